@@ -0,0 +1,52 @@
+"""add pg_trgm search indexes
+
+Revision ID: 08557ccd5c12
+Revises: 361d9a39c248
+Create Date: 2026-10-17 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '08557ccd5c12'
+down_revision: Union[str, Sequence[str], None] = '361d9a39c248'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (index name, table, column) served by gin_trgm_ops for ILIKE '%tok%'
+TRGM_INDEXES = [
+    ('ix_drug_name_trgm', 'drug', 'name'),
+    ('ix_brand_name_trgm', 'brand', 'name'),
+    ('ix_product_strength_trgm', 'product', 'strength'),
+    ('ix_unit_code_trgm', 'unit', 'code'),
+    ('ix_unit_name_trgm', 'unit', 'name'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # trigram indexes are Postgres only, SQLite keeps the plain ILIKE scan
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRGM_INDEXES:
+        op.create_index(
+            name, table, [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for name, table, _ in TRGM_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,33 @@
+"""add product low stock partial index
+
+Revision ID: 140aef6a8f5a
+Revises: 3cc80e23ed06
+Create Date: 2026-10-17 18:42:09.517306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '140aef6a8f5a'
+down_revision: Union[str, Sequence[str], None] = '3cc80e23ed06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # partial: only products at or below their reorder level are indexed
+    where = sa.text('stock <= reorder_level')
+    op.create_index(
+        'ix_product_low_stock', 'product', ['stock'], unique=False,
+        postgresql_where=where, sqlite_where=where,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_low_stock', table_name='product')
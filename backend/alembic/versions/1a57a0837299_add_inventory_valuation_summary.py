@@ -0,0 +1,47 @@
+"""add inventory valuation summary
+
+Revision ID: 1a57a0837299
+Revises: 6c59d5b7b59c
+Create Date: 2026-10-17 13:48:05.672210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1a57a0837299'
+down_revision: Union[str, Sequence[str], None] = '6c59d5b7b59c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('inventory_valuation',
+    sa.Column('formulation_type_id', sa.Integer(), nullable=False),
+    sa.Column('nhia_cover', sa.Boolean(), nullable=False),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.Column('total_stock', sa.Integer(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['formulation_type_id'], ['formulation_type.id'], ),
+    sa.PrimaryKeyConstraint('formulation_type_id', 'nhia_cover')
+    )
+    # seed from the current catalog, later changes are applied incrementally
+    op.execute(
+        """
+        INSERT INTO inventory_valuation
+            (formulation_type_id, nhia_cover, product_count, total_stock, total_value)
+        SELECT formulation_type_id, COALESCE(nhia_cover, false), COUNT(id),
+               SUM(COALESCE(stock, 0)), SUM(COALESCE(stock, 0) * COALESCE(price, 0))
+        FROM product
+        GROUP BY formulation_type_id, COALESCE(nhia_cover, false)
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('inventory_valuation')
@@ -0,0 +1,33 @@
+"""add catalog version counter
+
+Revision ID: 20d430c8502d
+Revises: 99be2d13e563
+Create Date: 2026-10-18 13:05:44.871209
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20d430c8502d'
+down_revision: Union[str, Sequence[str], None] = '99be2d13e563'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # shard rows are created by the first write that bumps them
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('catalog_version')
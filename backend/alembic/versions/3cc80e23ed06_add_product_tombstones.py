@@ -0,0 +1,36 @@
+"""add product tombstones
+
+Revision ID: 3cc80e23ed06
+Revises: fee15f17d0e9
+Create Date: 2026-10-17 16:21:33.905718
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3cc80e23ed06'
+down_revision: Union[str, Sequence[str], None] = 'fee15f17d0e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('product_tombstone',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index(op.f('ix_product_tombstone_deleted_at'), 'product_tombstone', ['deleted_at'], unique=False)
+    # rows from before last_changed_date had a default are invisible to delta sync
+    op.execute('UPDATE product SET last_changed_date = CURRENT_TIMESTAMP WHERE last_changed_date IS NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_product_tombstone_deleted_at'), table_name='product_tombstone')
+    op.drop_table('product_tombstone')
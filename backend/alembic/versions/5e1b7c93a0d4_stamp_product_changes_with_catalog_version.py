@@ -0,0 +1,40 @@
+"""stamp product changes with catalog version
+
+Revision ID: 5e1b7c93a0d4
+Revises: 20d430c8502d
+Create Date: 2026-10-18 16:12:37.402915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1b7c93a0d4'
+down_revision: Union[str, Sequence[str], None] = '20d430c8502d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # existing rows land on shard 0, version 0: sent once by a full sync
+    for table in ('product', 'product_tombstone'):
+        op.add_column(table, sa.Column('change_shard', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('change_version', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index('ix_product_change', 'product', ['change_shard', 'change_version', 'id'], unique=False)
+    op.create_index(
+        'ix_product_tombstone_change', 'product_tombstone',
+        ['change_shard', 'change_version', 'product_id'], unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_tombstone_change', table_name='product_tombstone')
+    op.drop_index('ix_product_change', table_name='product')
+    for table in ('product_tombstone', 'product'):
+        op.drop_column(table, 'change_version')
+        op.drop_column(table, 'change_shard')
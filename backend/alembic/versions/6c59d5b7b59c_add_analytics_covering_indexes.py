@@ -0,0 +1,33 @@
+"""add analytics covering indexes
+
+Revision ID: 6c59d5b7b59c
+Revises: 6fe66573abc4
+Create Date: 2026-10-17 12:26:51.093317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c59d5b7b59c'
+down_revision: Union[str, Sequence[str], None] = '6fe66573abc4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_dispense_created_at_user_id', 'dispense', ['created_at', 'user_id'], unique=False)
+    op.create_index(
+        'ix_dispense_item_dispense_id_covering', 'dispense_item',
+        ['dispense_id', 'product_id', 'qty', 'price_at_dispense'], unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dispense_item_dispense_id_covering', table_name='dispense_item')
+    op.drop_index('ix_dispense_created_at_user_id', table_name='dispense')
@@ -0,0 +1,46 @@
+"""add daily analytics rollups
+
+Revision ID: 6fe66573abc4
+Revises: 08557ccd5c12
+Create Date: 2026-10-17 11:02:17.540391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6fe66573abc4'
+down_revision: Union[str, Sequence[str], None] = '08557ccd5c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # no foreign keys: rollups outlive the products and users they count
+    op.create_table('daily_product_sales',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('qty', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('dispense_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'product_id')
+    )
+    op.create_table('daily_user_activity',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('qty', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('dispense_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'user_id')
+    )
+    # existing history is loaded by 99be2d13e563
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_user_activity')
+    op.drop_table('daily_product_sales')
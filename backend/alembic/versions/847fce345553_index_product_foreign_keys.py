@@ -0,0 +1,34 @@
+"""index product foreign keys
+
+Revision ID: 847fce345553
+Revises: 140aef6a8f5a
+Create Date: 2026-10-18 09:14:51.203118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '847fce345553'
+down_revision: Union[str, Sequence[str], None] = '140aef6a8f5a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# product columns that name searches join back through
+FK_COLUMNS = ['drug_id', 'brand_id', 'unit_id']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for column in FK_COLUMNS:
+        op.create_index(op.f(f'ix_product_{column}'), 'product', [column], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for column in FK_COLUMNS:
+        op.drop_index(op.f(f'ix_product_{column}'), table_name='product')
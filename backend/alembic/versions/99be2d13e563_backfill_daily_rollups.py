@@ -0,0 +1,56 @@
+"""backfill daily rollups
+
+Revision ID: 99be2d13e563
+Revises: 847fce345553
+Create Date: 2026-10-18 11:37:02.418365
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '99be2d13e563'
+down_revision: Union[str, Sequence[str], None] = '847fce345553'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# the rollups as of this revision, written out so later changes to
+# app.rollups can't change what this migration does
+PRODUCT_SALES = """
+    INSERT INTO daily_product_sales (day, product_id, qty, revenue, dispense_count)
+    SELECT {day}, di.product_id, SUM(di.qty),
+           COALESCE(SUM(di.qty * di.price_at_dispense), 0.0), COUNT(DISTINCT di.dispense_id)
+    FROM dispense_item di JOIN dispense d ON di.dispense_id = d.id
+    GROUP BY {day}, di.product_id
+"""
+USER_ACTIVITY = """
+    INSERT INTO daily_user_activity (day, user_id, qty, revenue, dispense_count)
+    SELECT {day}, d.user_id, SUM(di.qty),
+           COALESCE(SUM(di.qty * di.price_at_dispense), 0.0), COUNT(DISTINCT d.id)
+    FROM dispense_item di JOIN dispense d ON di.dispense_id = d.id
+    WHERE d.user_id IS NOT NULL
+    GROUP BY {day}, d.user_id
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # load the existing history, later dispenses are added incrementally
+    if op.get_bind().dialect.name == 'postgresql':
+        day = 'CAST(d.created_at AS DATE)'
+    else:
+        day = 'date(d.created_at)'
+    op.execute('DELETE FROM daily_product_sales')
+    op.execute('DELETE FROM daily_user_activity')
+    op.execute(PRODUCT_SALES.format(day=day))
+    op.execute(USER_ACTIVITY.format(day=day))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DELETE FROM daily_user_activity')
+    op.execute('DELETE FROM daily_product_sales')
@@ -0,0 +1,29 @@
+"""index product last_changed_date
+
+Revision ID: fee15f17d0e9
+Revises: 1a57a0837299
+Create Date: 2026-10-17 15:10:42.384017
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fee15f17d0e9'
+down_revision: Union[str, Sequence[str], None] = '1a57a0837299'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # max(last_changed_date) for catalog ETags becomes a single index lookup
+    op.create_index(op.f('ix_product_last_changed_date'), 'product', ['last_changed_date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_product_last_changed_date'), table_name='product')
@@ -1,8 +1,78 @@
+import os
+import pandas as pd
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select, union_all
 from datetime import datetime, timedelta
 
-from app.models import Dispense, DispenseItem, Product, User, Drug, Brand
+from app.models import (
+    Dispense, DispenseItem, Product, User, Drug, Brand,
+    DailyProductSales, DailyUserActivity,
+)
+from app.rollups import plan, day_filters, bucket_of
+
+
+# Where analytics are aggregated from:
+#   "rollup" - daily_product_sales / daily_user_activity for whole days,
+#              raw dispense rows only for partial days at the range edges
+#   "raw"    - dispense_item JOIN dispense for the whole range
+ANALYTICS_SOURCE = os.getenv("ANALYTICS_SOURCE", "rollup")
+
+
+def _resolve_range(start_date: datetime | None, end_date: datetime | None):
+    """Default to the past 7 days; a date-only end_date covers that whole day."""
+    if not start_date and not end_date:
+        start_date = datetime.now() - timedelta(days=7)
+        end_date = datetime.now()
+
+    if end_date and end_date.time() == datetime.min.time():
+        end_date = end_date + timedelta(days=1) - timedelta(microseconds=1)
+
+    return start_date, end_date
+
+
+def _sources(start_date: datetime | None, end_date: datetime | None):
+    """(rollup days or None, raw created_at windows) for the range."""
+    if ANALYTICS_SOURCE == "rollup":
+        return plan(start_date, end_date)
+    return None, [(start_date, end_date + timedelta(microseconds=1) if end_date else None)]
+
+
+def _in_window(q, lo: datetime | None, hi: datetime | None):
+    if lo:
+        q = q.filter(Dispense.created_at >= lo)
+    if hi:
+        q = q.filter(Dispense.created_at < hi)
+    return q
+
+
+def _totals(start_date: datetime | None, end_date: datetime | None, rollup, rollup_key, raw_key, *raw_filters):
+    """
+    Subquery of (id, total) quantities for the range: rollup rows for whole
+    days UNION ALL raw rows for the edge windows, summed per id in SQL so
+    ranking and LIMIT/OFFSET are applied by the database.
+    """
+    days, windows = _sources(start_date, end_date)
+
+    parts = []
+    if days:
+        parts.append(
+            select(rollup_key.label("id"), rollup.qty.label("qty"))
+            .where(*day_filters(rollup, *days))
+        )
+    for lo, hi in windows:
+        parts.append(_in_window(
+            select(raw_key.label("id"), DispenseItem.qty.label("qty"))
+            .join_from(DispenseItem, Dispense, DispenseItem.dispense_id == Dispense.id)
+            .where(*raw_filters),
+            lo, hi,
+        ))
+
+    rows = (union_all(*parts) if len(parts) > 1 else parts[0]).subquery()
+    return (
+        select(rows.c.id, func.sum(rows.c.qty).label("total"))
+        .group_by(rows.c.id)
+        .subquery()
+    )
 
 
 # --- Get most purchased products ---
@@ -10,46 +80,29 @@ def get_most_purchased_products(
         db: Session,
         start_date: datetime | None = None,
         end_date: datetime | None = None,
+        limit: int | None = None,
+        offset: int = 0,
 ):
-    
-    if not start_date and not end_date:
-        start_date = datetime.now() - timedelta(days=7)
-        end_date = datetime.now()
-
-
     """
     Returns the most purchased products withtin a date range or defaults to the last N days
     """
-    # Default to past N days only if no explicit date range is provided
-
+    start_date, end_date = _resolve_range(start_date, end_date)
+    totals = _totals(start_date, end_date, DailyProductSales, DailyProductSales.product_id, DispenseItem.product_id)
 
-    q = (
+    results = (
         db.query(
             Product.id.label("product_id"),
             Drug.name.label("product_name"),
             Brand.name.label("brand_name"),
-            func.sum(DispenseItem.qty).label("total_qty")
+            totals.c.total.label("total_qty"),
         )
+        .join(totals, totals.c.id == Product.id)
         .join(Product.drug)
         .join(Product.brand, isouter=True)
-        .join(DispenseItem, DispenseItem.product_id == Product.id)
-        .join(Dispense, DispenseItem.dispense_id == Dispense.id)
-
-    )
-
-    # Apply filters dynamically
-    if start_date:
-        q = q.filter(Dispense.created_at >= start_date)
-    if end_date:
-        if end_date.time() == datetime.min.time():
-            end_date = end_date + timedelta(days=1) - timedelta(microseconds=1)
-        q = q.filter(Dispense.created_at <= end_date)
-
-    
-    results = (
-        q.group_by(Product.id, Drug.name, Brand.name)
-            .order_by(desc("total_qty"))
-            .all()
+        .order_by(desc(totals.c.total), Product.id)
+        .offset(offset)
+        .limit(limit)
+        .all()
     )
 
     return [
@@ -67,37 +120,29 @@ def get_most_active_users(
     db: Session,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
+    limit: int | None = None,
+    offset: int = 0,
 ):
     """
     Returns users with the most dispenses in a given date range or defaults to the last N days.
     """
+    start_date, end_date = _resolve_range(start_date, end_date)
+    totals = _totals(
+        start_date, end_date, DailyUserActivity, DailyUserActivity.user_id,
+        Dispense.user_id, Dispense.user_id.isnot(None),
+    )
 
-    if not start_date and not end_date:
-        start_date = datetime.now() - timedelta(days=7)
-        end_date = datetime.now()
-
-
-    q = (
+    results = (
         db.query(
-            Dispense.user_id,
+            User.id.label("user_id"),
             User.username,
-            func.sum(DispenseItem.qty).label("total_dispensed")
+            totals.c.total.label("total_dispensed"),
         )
-        .join(DispenseItem, Dispense.id == DispenseItem.dispense_id)
-        .join(User, Dispense.user_id == User.id)
-    )
-
-    if start_date:
-        q = q.filter(Dispense.created_at >= start_date)
-    if end_date:
-        if end_date.time() == datetime.min.time():
-            end_date = end_date + timedelta(days=1) - timedelta(microseconds=1)
-        q = q.filter(Dispense.created_at <= end_date)
-
-    results = (
-        q.group_by(Dispense.user_id, User.username)
-         .order_by(desc("total_dispensed"))
-         .all()
+        .join(totals, totals.c.id == User.id)
+        .order_by(desc(totals.c.total), User.id)
+        .offset(offset)
+        .limit(limit)
+        .all()
     )
 
     return [
@@ -116,25 +161,137 @@ def get_revenue_stats(db: Session, start_date: datetime = None, end_date: dateti
     Returns total revenue and items sold within a date range.
     If no range is provided, returns for all time.
     """
-    if not start_date and not end_date:
-        start_date = datetime.now() - timedelta(days=7)
-        end_date = datetime.now()
+    start_date, end_date = _resolve_range(start_date, end_date)
+    days, windows = _sources(start_date, end_date)
 
-    q = db.query(
-        func.sum(DispenseItem.qty * DispenseItem.price_at_dispense).label("total_revenue"),
-        func.sum(DispenseItem.qty).label("total_items")
-    ).join(Dispense, DispenseItem.dispense_id == Dispense.id)
+    total_revenue, total_items = 0.0, 0
+    if days:
+        revenue, items = (
+            db.query(func.sum(DailyProductSales.revenue), func.sum(DailyProductSales.qty))
+            .filter(*day_filters(DailyProductSales, *days))
+            .one()
+        )
+        total_revenue += revenue or 0.0
+        total_items += items or 0
+    for lo, hi in windows:
+        revenue, items = _in_window(
+            db.query(
+                func.sum(DispenseItem.qty * DispenseItem.price_at_dispense),
+                func.sum(DispenseItem.qty),
+            ).join(Dispense, DispenseItem.dispense_id == Dispense.id),
+            lo, hi,
+        ).one()
+        total_revenue += revenue or 0.0
+        total_items += items or 0
 
-    if start_date:
-        q = q.filter(Dispense.created_at >= start_date)
-    if end_date:
-        if end_date.time() == datetime.min.time():
-            end_date = end_date + timedelta(days=1) - timedelta(microseconds=1)
-        q = q.filter(Dispense.created_at <= end_date)
+    return {
+        "total_revenue": total_revenue,
+        "total_items": total_items,
+    }
 
-    result = q.first()
 
-    return {
-        "total_revenue": result.total_revenue or 0.0,
-        "total_items": result.total_items or 0,
+# --- Time-bucketed series ---
+# pandas offsets matching the SQL buckets (weeks start on Monday)
+INTERVAL_FREQ = {"day": "D", "week": "W-MON", "month": "MS"}
+
+
+def _period_start(ts: datetime, interval: str) -> pd.Timestamp:
+    ts = pd.Timestamp(ts).normalize()
+    if interval == "week":
+        return ts - pd.Timedelta(days=ts.weekday())
+    if interval == "month":
+        return ts.replace(day=1)
+    return ts
+
+
+def _bucketed(db: Session, interval: str, days, windows, product_ids: list[int] | None = None) -> pd.DataFrame:
+    """
+    qty and revenue per bucket (and per product when product_ids is given),
+    grouped in SQL over the rollups and the raw edge windows, then summed.
+    """
+    rows = []
+    if days:
+        keys = [bucket_of(db, DailyProductSales.day, interval)]
+        if product_ids is not None:
+            keys.append(DailyProductSales.product_id)
+        q = (
+            db.query(*keys, func.sum(DailyProductSales.qty), func.sum(DailyProductSales.revenue))
+            .filter(*day_filters(DailyProductSales, *days))
+        )
+        if product_ids is not None:
+            q = q.filter(DailyProductSales.product_id.in_(product_ids))
+        rows.extend(q.group_by(*keys).all())
+    for lo, hi in windows:
+        keys = [bucket_of(db, Dispense.created_at, interval)]
+        if product_ids is not None:
+            keys.append(DispenseItem.product_id)
+        q = _in_window(
+            db.query(
+                *keys,
+                func.sum(DispenseItem.qty),
+                func.coalesce(func.sum(DispenseItem.qty * DispenseItem.price_at_dispense), 0.0),
+            ).join(Dispense, DispenseItem.dispense_id == Dispense.id),
+            lo, hi,
+        )
+        if product_ids is not None:
+            q = q.filter(DispenseItem.product_id.in_(product_ids))
+        rows.extend(q.group_by(*keys).all())
+
+    keys = ["period"] + (["product_id"] if product_ids is not None else [])
+    df = pd.DataFrame([tuple(r) for r in rows], columns=[*keys, "qty", "revenue"])
+    df["period"] = pd.to_datetime(df["period"])
+    return df.groupby(keys, as_index=False).sum()
+
+
+def _finish(df: pd.DataFrame, columns: list[str], index: pd.DatetimeIndex | None, moving_average: int | None) -> list[dict]:
+    """Gap-fill over index (when given), add moving averages, return records."""
+    df = df.set_index("period")[columns].sort_index()
+    if index is not None:
+        df = df.reindex(index, fill_value=0)
+    if moving_average:
+        for col in columns:
+            df[f"{col}_ma"] = df[col].rolling(moving_average, min_periods=1).mean()
+    df.index = df.index.date
+    return df.rename_axis("period").reset_index().to_dict("records")
+
+
+def get_timeseries(
+    db: Session,
+    interval: str = "day",
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    fill_gaps: bool = True,
+    moving_average: int | None = None,
+    top_n: int = 0,
+):
+    """
+    Revenue and quantity per day, week or month, plus the per-bucket quantity
+    of the top_n products of the range. Empty buckets are filled with zeros
+    when fill_gaps is set; moving_average adds trailing means over that
+    many buckets.
+    """
+    start_date, end_date = _resolve_range(start_date, end_date)
+    days, windows = _sources(start_date, end_date)
+
+    totals = _bucketed(db, interval, days, windows)
+
+    index = None
+    if fill_gaps and (start_date or not totals.empty):
+        first = _period_start(start_date, interval) if start_date else totals["period"].min()
+        last = _period_start(end_date or datetime.now(), interval)
+        index = pd.date_range(first, last, freq=INTERVAL_FREQ[interval])
+
+    result = {
+        "interval": interval,
+        "series": _finish(totals, ["qty", "revenue"], index, moving_average),
+        "top_products": [],
     }
+
+    if top_n:
+        top = get_most_purchased_products(db, start_date, end_date, limit=top_n)
+        per_product = _bucketed(db, interval, days, windows, [p["product_id"] for p in top])
+        for p in top:
+            series = per_product[per_product["product_id"] == p["product_id"]]
+            result["top_products"].append({**p, "series": _finish(series, ["qty"], index, moving_average)})
+
+    return result
@@ -0,0 +1,37 @@
+"""
+Async (AsyncSession) versions of the crud/operations functions used by
+the async endpoints, so they never block the event loop on database IO.
+
+Functions with real logic reuse the sync implementation through
+AsyncSession.run_sync, which drives it on the async driver.
+"""
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+from app.operations import apply_dispense, publish_low_stock_messages, search_products
+from app.redis.cache_utils import invalidate
+
+
+async def ad_search_products(db: AsyncSession, query: str, skip=0, limit=100):
+    return await db.run_sync(search_products, query, skip, limit)
+
+
+async def dispense_products(db: AsyncSession, user: schemas.UserResponse, dispense_in: schemas.DispenseCreate):
+    """Dispense products automatically and handle low-stock notifications."""
+    disp, redis_messages = await db.run_sync(apply_dispense, user, dispense_in)
+
+    # Only publish Redis messages after successful commit (locks released)
+    await publish_low_stock_messages(redis_messages)
+    await invalidate("products", "analytics")
+
+    return disp
+
+
+async def get_audit_logs(db: AsyncSession, skip: int = 0, limit: int = 100):
+    """Fetch audit logs with pagination."""
+    result = await db.execute(
+        select(models.AuditLog).order_by(models.AuditLog.timestamp.desc()).offset(skip).limit(limit)
+    )
+    return result.scalars().all()
@@ -1,12 +1,22 @@
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.sql.expression import func
-from datetime import datetime
+from datetime import datetime, timedelta
+import os
 import random
 
-from app import models, schemas
-from app.utils import hash_password, to_dispense_response
+from app import models, schemas, valuation
+from app.database import is_postgres
+from app.etag import bump_catalog_version, shard_versions, stamped_between
+from app.operations import publish_low_stock_messages_sync, sync_low_stock_notifications
+from app.query_options import PRODUCT_RESPONSE_OPTIONS, DISPENSE_RESPONSE_OPTIONS
+from app.search_index import product_index, product_ids_like
+from app.user_cache import user_cache
+from app.redis.cache_utils import invalidate_sync
+from app.utils import hash_password, to_dispense_response, to_product_response
 from email_validator import validate_email, EmailNotValidError
 
 
@@ -28,35 +38,143 @@ def get_or_create(session: Session, model, name_field: str, value: str):
 
 
 
-def get_all_products(db: Session, skip: int = 0, limit: int = 100):
-    query = db.query(models.Product)
-    if random:
-        query = query.order_by(func.random())
-    return query.limit(limit).all()
+# Keyset orders for product listings: ascending id, or most recently changed first
+PRODUCT_SORTS = ("id", "last_changed_date")
 
 
-def get_product_by_name_or_id(db: Session, query: str):
-    q = (
+def encode_product_cursor(product: models.Product, order_by: str = "id") -> str:
+    """Keyset cursor pointing just past the given product."""
+    if order_by == "last_changed_date":
+        changed = product.last_changed_date.isoformat() if product.last_changed_date else ""
+        return f"{changed},{product.id}"
+    return str(product.id)
+
+
+def decode_product_cursor(cursor: str, order_by: str = "id") -> tuple[datetime | None, int]:
+    try:
+        if order_by == "last_changed_date":
+            changed, product_id = cursor.rsplit(",", 1)
+            return (datetime.fromisoformat(changed) if changed else None), int(product_id)
+        return None, int(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
+        )
+
+
+def product_filters(
+    formulation_type_id: int | None = None,
+    nhia_cover: bool | None = None,
+    low_stock: bool | None = None,
+) -> list:
+    """Optional listing filters; None leaves a dimension unfiltered."""
+    filters = []
+    if formulation_type_id is not None:
+        filters.append(models.Product.formulation_type_id == formulation_type_id)
+    if nhia_cover is not None:
+        filters.append(
+            models.Product.nhia_cover.is_(True) if nhia_cover else models.Product.nhia_cover.isnot(True)
+        )
+    if low_stock is not None:
+        is_low = models.Product.stock <= models.Product.reorder_level
+        filters.append(is_low if low_stock else ~is_low)
+    return filters
+
+
+def query_products(db: Session, order_by: str = "id", cursor: str | None = None, **filters):
+    """
+    Base query for product listings with everything to_product_response
+    needs eager loaded. `cursor` continues after the last row of a previous
+    page; combine with .limit() for keyset pagination.
+    """
+    query = (
         db.query(models.Product)
-        .join(models.Drug, models.Product.drug_id == models.Drug.id)
-        .join(models.Brand, models.Product.brand_id == models.Brand.id, isouter=True)
+        .options(*PRODUCT_RESPONSE_OPTIONS)
+        .filter(*product_filters(**filters))
     )
 
-    if query.isdigit():
-        return q.filter(
-            or_(
-                models.Product.id == int(query),
-                models.Drug.name.ilike(f"%{query}%"),
-                models.Brand.name.ilike(f"%{query}%"),
-            )
-        ).all()
+    if order_by == "last_changed_date":
+        changed = models.Product.last_changed_date
+        if cursor:
+            changed_at, product_id = decode_product_cursor(cursor, order_by)
+            if changed_at is None:
+                # already inside the trailing never-changed rows
+                query = query.filter(changed.is_(None), models.Product.id < product_id)
+            else:
+                query = query.filter(
+                    or_(
+                        changed < changed_at,
+                        and_(changed == changed_at, models.Product.id < product_id),
+                        changed.is_(None),
+                    )
+                )
+        return query.order_by(changed.desc().nulls_last(), models.Product.id.desc())
+
+    if cursor:
+        _, product_id = decode_product_cursor(cursor)
+        query = query.filter(models.Product.id > product_id)
+    return query.order_by(models.Product.id)
 
-    return q.filter(
-        or_(
-            models.Drug.name.ilike(f"%{query}%"),
-            models.Brand.name.ilike(f"%{query}%"),
+
+def get_all_products(db: Session, skip: int = 0, limit: int = 100):
+    return query_products(db).offset(skip).limit(limit).all()
+
+
+def sample_products(db: Session, size: int, **filters):
+    """
+    `size` random products without sorting the table: random points in the
+    id range, each resolved to the next matching id by one index seek.
+    """
+    lo, hi = db.query(func.min(models.Product.id), func.max(models.Product.id)).one()
+    if lo is None:
+        return []
+
+    matching = db.query(models.Product.id).filter(*product_filters(**filters))
+    ids = []
+    for _ in range(size * 3):
+        if len(ids) >= size:
+            break
+        point = random.randint(lo, hi)
+        product_id = (
+            matching.filter(models.Product.id >= point).order_by(models.Product.id).limit(1).scalar()
+            # wrap around past the last match
+            or matching.order_by(models.Product.id).limit(1).scalar()
         )
-    ).all()
+        if product_id is None:
+            return []
+        if product_id not in ids:
+            ids.append(product_id)
+
+    by_id = {
+        p.id: p
+        for p in db.query(models.Product).options(*PRODUCT_RESPONSE_OPTIONS).filter(models.Product.id.in_(ids))
+    }
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def get_product_by_name_or_id(db: Session, query: str):
+    q = db.query(models.Product).options(*PRODUCT_RESPONSE_OPTIONS)
+
+    if is_postgres(db):
+        # closest names first
+        q = q.join(models.Drug, models.Product.drug_id == models.Drug.id)
+        q = q.join(models.Brand, models.Product.brand_id == models.Brand.id, isouter=True)
+        q = q.order_by(
+            func.greatest(
+                func.similarity(models.Drug.name, query),
+                func.similarity(func.coalesce(models.Brand.name, ""), query),
+            ).desc(),
+            models.Product.id,
+        )
+
+    # matched per table (see product_ids_like) so each ILIKE can use its index
+    by_name = models.Product.id.in_(product_ids_like(f"%{query}%", fields=("drug", "brand")))
+
+    if query.isdigit():
+        return q.filter(or_(models.Product.id == int(query), by_name)).all()
+
+    return q.filter(by_name).all()
 
 
 
@@ -80,35 +198,167 @@ def create_product(db: Session, product: schemas.ProductCreate):
         unit_id=unit.id,
     )
     db.add(db_product)
+    db.flush()
+    # SQLite can hand out a deleted product's id again
+    db.execute(delete(models.ProductTombstone).where(models.ProductTombstone.product_id == db_product.id))
+    valuation.apply_deltas(db, [valuation.contribution(db_product)])
+    # a product can be created at or below its reorder level
+    messages = sync_low_stock_notifications(db, [db_product])
+    bump_catalog_version(db, [db_product.id])
     db.commit()
     db.refresh(db_product)
+    product_index.upsert(db_product)
+    invalidate_sync("products")
+    publish_low_stock_messages_sync(messages)
 
     return db_product
 
 
 def update_product(db: Session, product_id: int, update_data: schemas.ProductBase):
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    # locked, so the valuation delta is taken from the row actually replaced
+    product = db.query(models.Product).filter(models.Product.id == product_id).with_for_update().first()
     if not product:
         return None
+    before = valuation.contribution(product, -1)
     for key, value in update_data.model_dump(exclude_unset=True).items():
         setattr(product, key, value)
+    valuation.apply_deltas(db, [before, valuation.contribution(product)])
+    messages = sync_low_stock_notifications(db, [product])
 
-    product.last_changed_date = datetime.now()
+    # the database clock, like every other product write
+    product.last_changed_date = func.now()
+    bump_catalog_version(db, [product.id])
     db.commit()
     db.refresh(product)
+    product_index.upsert(product)
+    invalidate_sync("products")
+    publish_low_stock_messages_sync(messages)
     return product
 
 
 def delete_product(db: Session, product_id: int):
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    product = db.query(models.Product).filter(models.Product.id == product_id).with_for_update().first()
     if not product:
         return None
     
+    valuation.apply_deltas(db, [valuation.contribution(product, -1)])
     db.delete(product)
+    db.flush()
+    shard, version = bump_catalog_version(db)
+    # upsert: the id may have been deleted before, then reused
+    stmt = (pg_insert if is_postgres(db) else sqlite_insert)(models.ProductTombstone)
+    db.execute(
+        stmt.values(product_id=product_id, change_shard=shard, change_version=version)
+        .on_conflict_do_update(
+            index_elements=["product_id"],
+            set_={"deleted_at": func.now(), "change_shard": shard, "change_version": version},
+        )
+    )
     db.commit()
+    product_index.remove(product_id)
+    invalidate_sync("products")
     return True
 
 
+# Column order of the compact rows returned by get_product_changes
+PRODUCT_SYNC_FIELDS = (
+    "id", "drug", "brand", "formulation_type", "unit", "strength", "price",
+    "nhia_cover", "stock", "reorder_level", "notes", "last_changed_date",
+)
+
+
+def encode_sync_cursor(positions: dict[int, tuple[int, int | None]]) -> str:
+    """
+    "shard=version" per counter shard, or "shard=version/id" for a shard
+    read up to that product within `version`.
+    """
+    return ",".join(
+        f"{shard}={version}" + ("" if after_id is None else f"/{after_id}")
+        for shard, (version, after_id) in sorted(positions.items())
+    )
+
+
+def decode_sync_cursor(cursor: str) -> dict[int, tuple[int, int | None]]:
+    try:
+        positions = {}
+        for part in cursor.split(","):
+            shard, position = part.split("=")
+            version, _, after_id = position.partition("/")
+            positions[int(shard)] = (int(version), int(after_id) if after_id else None)
+        return positions
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
+        )
+
+
+def get_product_changes(db: Session, cursor: str | None = None, limit: int = 500) -> dict:
+    """
+    Products created or updated, and ids deleted, after `cursor`, in
+    (change_shard, change_version, id) order. Products are sent as rows in
+    PRODUCT_SYNC_FIELDS order; deletions come from tombstones. No cursor
+    means a full initial sync.
+
+    Each write stamps its rows with the catalog counter shard it bumped
+    and that shard's new version, under the shard's row lock, so within a
+    shard versions are in commit order. The cursor holds a position per
+    shard. The shard versions are read first, in their own statement:
+    every row stamped up to them has committed, and anything committing
+    later gets a higher version and is picked up by the next call.
+    """
+    upto = shard_versions(db)
+    since = decode_sync_cursor(cursor) if cursor else {}
+
+    p, t = models.Product, models.ProductTombstone
+    products = (
+        db.query(p)
+        .options(*PRODUCT_RESPONSE_OPTIONS)
+        .filter(stamped_between(since, upto, p.change_shard, p.change_version, p.id))
+        .order_by(p.change_shard, p.change_version, p.id)
+        .limit(limit + 1)
+    )
+    tombstones = (
+        db.query(t)
+        .filter(stamped_between(since, upto, t.change_shard, t.change_version, t.product_id))
+        .order_by(t.change_shard, t.change_version, t.product_id)
+        .limit(limit + 1)
+    )
+
+    # each stream is already in order, merge them and keep the first `limit`
+    events = sorted(
+        [((r.change_shard, r.change_version, r.id), r) for r in products]
+        + [((r.change_shard, r.change_version, r.product_id), None) for r in tombstones],
+        key=lambda e: e[0],
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    upserts, deletes = [], []
+    for (_, _, product_id), product in events:
+        if product is None:
+            deletes.append(product_id)
+            continue
+        row = to_product_response(product).model_dump()
+        row["last_changed_date"] = row["last_changed_date"] and row["last_changed_date"].isoformat()
+        upserts.append([row[f] for f in PRODUCT_SYNC_FIELDS])
+
+    positions = {shard: (top, None) for shard, top in upto.items()}
+    if has_more:
+        # shards are read in order: those past the last one sent are untouched
+        (cut, version, product_id), _ = events[-1]
+        positions.update({shard: since.get(shard, (-1, None)) for shard in upto if shard > cut})
+        positions[cut] = (version, product_id)
+
+    return {
+        "fields": PRODUCT_SYNC_FIELDS,
+        "upserts": upserts,
+        "deletes": deletes,
+        "cursor": encode_sync_cursor(positions),
+        "has_more": has_more,
+    }
+
+
 # USER CREATION ENDPOINT 
 
 def create_user(db: Session, user: schemas.UserCreate):
@@ -244,11 +494,13 @@ def update_user(db:Session, user_id: int, update_data: dict):
     db_user = get_user(db, user_id)
     if not db_user:
         return None
+    old_username = db_user.username
     for key, value in update_data.items():
         setattr(db_user, key, value)
 
     db.commit()
     db.refresh(db_user)
+    user_cache.invalidate(old_username, db_user.username)
     return db_user
 
 
@@ -259,19 +511,114 @@ def delete_user(db: Session, user_id: int):
         return None
     db.delete(db_user)
     db.commit()
+    user_cache.invalidate(db_user.username)
     return True
 
 
 # gets dispense history per User
 
+def encode_dispense_cursor(dispense: models.Dispense) -> str:
+    """Keyset cursor pointing just past the given dispense."""
+    return f"{dispense.created_at.isoformat()},{dispense.id}"
+
+
+def decode_dispense_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, dispense_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(dispense_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
+        )
+
+
+def dispense_date_filters(start_date: datetime | None, end_date: datetime | None) -> list:
+    """Filter criteria for Dispense.created_at within an optional date range."""
+    filters = []
+    if start_date:
+        filters.append(models.Dispense.created_at >= start_date)
+    if end_date:
+        # include the whole end_date day if only a date was given
+        if end_date.time() == datetime.min.time():
+            end_date = end_date + timedelta(days=1) - timedelta(microseconds=1)
+        filters.append(models.Dispense.created_at <= end_date)
+    return filters
+
+
+def query_dispense_history(
+    db: Session,
+    user_id: int | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    cursor: str | None = None,
+):
+    """
+    Base query for dispense history, newest first, with everything
+    to_dispense_response needs eager loaded (2 SELECTs per page).
+    `cursor` continues after the last row of a previous page; combine
+    with .limit() for keyset pagination on (created_at, id).
+    """
+    query = db.query(models.Dispense).options(*DISPENSE_RESPONSE_OPTIONS)
+
+    if user_id is not None:
+        query = query.filter(models.Dispense.user_id == user_id)
+    query = query.filter(*dispense_date_filters(start_date, end_date))
+
+    if cursor:
+        created_at, dispense_id = decode_dispense_cursor(cursor)
+        query = query.filter(
+            or_(
+                models.Dispense.created_at < created_at,
+                and_(
+                    models.Dispense.created_at == created_at,
+                    models.Dispense.id < dispense_id,
+                ),
+            )
+        )
+
+    return query.order_by(models.Dispense.created_at.desc(), models.Dispense.id.desc())
+
+
 def get_dispense_history_per_user(db: Session, user_id: int):
     """
     Return all dispense records for a user, including nested items and product info
     """
-    user_dispenses = (
-        db.query(models.Dispense)
-        .filter(models.Dispense.user_id == user_id)
-        .order_by(models.Dispense.created_at.desc())
-        .all()
+    user_dispenses = query_dispense_history(db, user_id=user_id).all()
+    return [to_dispense_response(u) for u in user_dispenses]
+
+
+def iter_dispense_export_rows(
+    db: Session,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    batch_size: int = 1000,
+):
+    """
+    Stream one flat row per dispensed item (dispenses without items get a
+    single row with NULL item columns), newest dispense first.
+    Uses a server-side cursor so memory stays flat over any date range.
+    """
+    stmt = (
+        select(
+            models.Dispense.id.label("dispense_id"),
+            models.Dispense.created_at,
+            models.Dispense.user_id,
+            models.User.username,
+            models.DispenseItem.id.label("item_id"),
+            models.DispenseItem.product_id,
+            models.Drug.name.label("drug"),
+            models.Brand.name.label("brand"),
+            models.DispenseItem.qty,
+            models.DispenseItem.price_at_dispense,
+        )
+        .outerjoin(models.User, models.Dispense.user_id == models.User.id)
+        .outerjoin(models.DispenseItem, models.DispenseItem.dispense_id == models.Dispense.id)
+        .outerjoin(models.Product, models.DispenseItem.product_id == models.Product.id)
+        .outerjoin(models.Drug, models.Product.drug_id == models.Drug.id)
+        .outerjoin(models.Brand, models.Product.brand_id == models.Brand.id)
+        .where(*dispense_date_filters(start_date, end_date))
+        .order_by(models.Dispense.created_at.desc(), models.Dispense.id.desc(), models.DispenseItem.id)
+        .execution_options(stream_results=True, yield_per=batch_size)
     )
-    return [to_dispense_response(u) for u in user_dispenses]
\ No newline at end of file
+    yield from db.execute(stmt)
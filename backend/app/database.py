@@ -2,9 +2,13 @@
 
 from pathlib import Path
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base, sessionmaker
 import os
 
+from app.pool_metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool, instrument
+
 # Base directory of backend
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -17,18 +21,82 @@ POSTGRES_DEFAULT = "postgresql://medtrack_user:wzMvmPBEp9zD4kg_FA_SgtIuNxfJGFTe@
 # Use DATABASE_URL env variable if exists, otherwise use Postgres default
 DATABASE_URL = os.getenv("DATABASE_URL", POSTGRES_DEFAULT)
 
+# Connection pool settings (Postgres), per worker process. The sync pool
+# serves most routes; the async pool only the dispense and search routes
+# that run on AsyncSession, so it is kept smaller.
+POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+}
+ASYNC_POOL_OPTIONS = {
+    **POOL_OPTIONS,
+    "pool_size": int(os.getenv("DB_ASYNC_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "5")),
+}
+
+# Worst case every worker opens both pools to the full: 30 + 10 = 40
+# connections each by default. Workers (uvicorn reads WEB_CONCURRENCY) times
+# that must stay under Postgres's max_connections (100 by default, 3 of them
+# reserved for superusers), so two workers fit, three need smaller pools.
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+POSTGRES_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+POSTGRES_RESERVED_CONNECTIONS = 3
+
+
+def connections_per_worker() -> int:
+    """Most connections one worker can hold, both engines' pools full."""
+    return sum(o["pool_size"] + o["max_overflow"] for o in (POOL_OPTIONS, ASYNC_POOL_OPTIONS))
+
+
+if not DATABASE_URL.startswith("sqlite") and (
+    WORKERS * connections_per_worker() > POSTGRES_MAX_CONNECTIONS - POSTGRES_RESERVED_CONNECTIONS
+):
+    print(
+        f"WARNING -> {WORKERS} workers x {connections_per_worker()} pooled connections "
+        f"exceed max_connections={POSTGRES_MAX_CONNECTIONS}; lower DB_POOL_SIZE/DB_ASYNC_POOL_SIZE"
+    )
+
 # For local dev, optionally fall back to SQLite if Postgres not reachable
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(f"sqlite:///{SQLITE_PATH}", connect_args={"check_same_thread": False})
+    engine = create_engine(
+        f"sqlite:///{SQLITE_PATH}",
+        connect_args={"check_same_thread": False},
+        poolclass=InstrumentedQueuePool,
+    )
 else:
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
 
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine on the same database: asyncpg for Postgres, aiosqlite locally
+if DATABASE_URL.startswith("sqlite"):
+    ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{SQLITE_PATH}"
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool)
+else:
+    ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **ASYNC_POOL_OPTIONS
+    )
+
+instrument("sync", engine)
+instrument("async", async_engine.sync_engine)
+
+# expire_on_commit=False: touching an expired attribute would need implicit IO,
+# which AsyncSession can't do
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
+def is_postgres(db) -> bool:
+    """Whether a session is bound to Postgres (pg_trgm ranking etc.)."""
+    return db.get_bind().dialect.name == "postgresql"
+
+
 # Dependency for FastAPI
 def get_db():
     """Database session dependency."""
@@ -37,3 +105,17 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_session_factory():
+    """
+    Session factory dependency, for work that outlives the request's own
+    session (e.g. a streamed response body).
+    """
+    return SessionLocal
+
+
+async def get_async_db():
+    """Async database session dependency."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,166 @@
+"""Conditional GET (ETag / Last-Modified) for catalog reads"""
+
+import inspect
+import os
+import random
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import wraps
+from typing import Iterable
+
+from fastapi import Response, status
+from sqlalchemy import and_, false, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.database import is_postgres
+
+
+# Rows the write counter is spread over. Each write bumps one at random
+# and holds its lock until commit, so with several rows concurrent writers
+# rarely queue on the same one
+CATALOG_VERSION_SHARDS = int(os.getenv("CATALOG_VERSION_SHARDS", "16"))
+
+
+def bump_catalog_version(db: Session, product_ids: Iterable[int] = ()) -> tuple[int, int]:
+    """
+    Count a product write on one random shard of the counter, and stamp
+    the written products with (shard, new version). Call it in the write's
+    transaction, last before commit: the shard row stays locked until then,
+    so a shard's versions commit in order and delta sync
+    (crud.get_product_changes) can page on them. Returns (shard, version).
+    """
+    shard = random.randint(1, CATALOG_VERSION_SHARDS)
+    stmt = (pg_insert if is_postgres(db) else sqlite_insert)(models.CatalogVersion)
+    version = db.execute(
+        stmt.values(id=shard, version=1)
+        .on_conflict_do_update(index_elements=["id"], set_={"version": models.CatalogVersion.version + 1})
+        .returning(models.CatalogVersion.version)
+    ).scalar_one()
+
+    ids = sorted(product_ids)
+    for i in range(0, len(ids), 1000):
+        db.execute(
+            update(models.Product)
+            .where(models.Product.id.in_(ids[i:i + 1000]))
+            .values(change_shard=shard, change_version=version),
+            execution_options={"synchronize_session": False},
+        )
+    return shard, version
+
+
+def shard_versions(db: Session) -> dict[int, int]:
+    """
+    Committed version of every counter shard, plus shard 0 (rows stamped
+    before the counter existed) at 0. Rows stamped up to these versions
+    have all committed.
+    """
+    return {0: 0, **dict(db.execute(select(models.CatalogVersion.id, models.CatalogVersion.version)).all())}
+
+
+def stamped_between(since: dict[int, tuple[int, int | None]], upto: dict[int, int], shard, version, row_id):
+    """
+    Condition on (shard, version, row_id) columns for rows stamped after
+    the per-shard `since` positions, (version, last id read within it or
+    None), and at or below the `upto` versions. Shards missing from
+    `since` are read from the start.
+    """
+    ranges = []
+    for shard_id, top in upto.items():
+        since_version, after_id = since.get(shard_id, (-1, None))
+        after = version > since_version
+        if after_id is not None:
+            after = or_(after, and_(version == since_version, row_id > after_id))
+        elif since_version >= top:
+            continue
+        ranges.append(and_(shard == shard_id, version <= top, after))
+    return or_(false(), *ranges)
+
+
+def catalog_version(db: Session) -> tuple[int, datetime | None]:
+    """
+    (write counter, when the catalog last changed), in one query. The
+    counter, summed over its shards, decides the ETag: every commit adds
+    one to it. The latest last_changed_date or deletion only feeds
+    Last-Modified: it is too coarse (and, on Postgres, taken at
+    transaction start) to tell every change apart.
+    """
+    version, changed, deleted = db.execute(
+        select(
+            select(func.sum(models.CatalogVersion.version)).scalar_subquery(),
+            select(func.max(models.Product.last_changed_date)).scalar_subquery(),
+            select(func.max(models.ProductTombstone.deleted_at)).scalar_subquery(),
+        )
+    ).one()
+    return int(version or 0), max(filter(None, (changed, deleted)), default=None)
+
+
+def _etag(version: int) -> str:
+    return f'W/"{version:x}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison against an If-None-Match list."""
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (t.removeprefix("W/") for t in tags)
+
+
+def _not_modified_since(if_modified_since: str, changed: datetime | None) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if changed is None or since is None:
+        return False
+    return changed.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def conditional(version=catalog_version):
+    """
+    Decorator answering If-None-Match / If-Modified-Since with a bodiless
+    304 when `version(db)` is unchanged, before the endpoint (or a @cache
+    below it) runs. Other responses get ETag and Last-Modified headers.
+    `version(db)` returns (counter, last modified datetime or None).
+
+    The endpoint must take `request`, `response` and `db` parameters.
+    """
+    def decorator(func):
+        is_async = inspect.iscoroutinefunction(func)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request, response, db = kwargs["request"], kwargs["response"], kwargs["db"]
+
+            if isinstance(db, AsyncSession):
+                current, changed = await db.run_sync(version)
+            else:
+                current, changed = await run_in_threadpool(version, db)
+
+            headers = {"ETag": _etag(current)}
+            if changed:
+                headers["Last-Modified"] = format_datetime(changed.replace(tzinfo=timezone.utc), usegmt=True)
+
+            if_none_match = request.headers.get("if-none-match")
+            if_modified_since = request.headers.get("if-modified-since")
+            if (
+                _matches(if_none_match, headers["ETag"]) if if_none_match
+                else if_modified_since and _not_modified_since(if_modified_since, changed)
+            ):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+            if is_async:
+                result = await func(*args, **kwargs)
+            else:
+                result = await run_in_threadpool(func, *args, **kwargs)
+
+            # a Response returned as-is (e.g. from @cache) drops `response` headers
+            target = result if isinstance(result, Response) else response
+            target.headers.update(headers)
+            return result
+
+        return wrapper
+    return decorator
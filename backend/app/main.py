@@ -6,8 +6,10 @@ from datetime import datetime
 from contextlib import asynccontextmanager
 from app.models import Base
 
-from app.database import SessionLocal, engine
-from app.router import product_router, auth_router, dispense_router, notifications_router, audit_router, analytics_router, rag_router
+from app.database import SessionLocal, engine, async_engine
+from app.search_index import product_index, PRODUCT_SEARCH_MODE
+from app.operations import LOW_STOCK_SWEEP_SECONDS, low_stock_sweeper
+from app.router import product_router, auth_router, dispense_router, notifications_router, audit_router, analytics_router, rag_router, metrics_router
 from rag.ingestion import initialize_vectorstores
 from rag.graph import build_medtrack_graph
 
@@ -17,9 +19,19 @@ async def lifespan(app: FastAPI):
     """Ensure database tables are created on startup."""
     Base.metadata.create_all(bind=engine)
 
+    if PRODUCT_SEARCH_MODE == "index":
+        with SessionLocal() as db:
+            product_index.load(db)
+        print(" Product search index loaded")
+
     task = asyncio.create_task(notifications_router.redis_listener())
     print(" Redis listener started in lifespan")
 
+    sweeper = None
+    if LOW_STOCK_SWEEP_SECONDS > 0:
+        sweeper = asyncio.create_task(low_stock_sweeper())
+        print(f" Low-stock sweep every {LOW_STOCK_SWEEP_SECONDS}s")
+
     app.state.retrievers = initialize_vectorstores()
     app.state.graph = build_medtrack_graph(app)
     print(" Vectorstores + MedTrack Graph loaded and ready")
@@ -34,6 +46,15 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             print (" Redis listener stopped")
 
+        if sweeper:
+            sweeper.cancel()
+            try:
+                await sweeper
+            except asyncio.CancelledError:
+                print (" Low-stock sweep stopped")
+
+        await async_engine.dispose()
+
 
 app = FastAPI(title="Drug Inventory API", lifespan=lifespan)
 
@@ -52,6 +73,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "X-Last-Event-Id"],
 )
 
 # Dependency
@@ -72,6 +94,7 @@ app.include_router(notifications_router.router)
 app.include_router(audit_router.router)
 app.include_router(analytics_router.router)
 app.include_router(rag_router.router)
+app.include_router(metrics_router.router)
 
 # include middleware to allow frontend connectivity
 
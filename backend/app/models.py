@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Column, Integer, BigInteger, String, Float, Boolean,
-    ForeignKey, DateTime, Text, func
+    ForeignKey, DateTime, Date, Text, Index, func
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -61,24 +61,70 @@ class Product(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    drug_id = Column(Integer, ForeignKey("drug.id"), nullable=False)
-    brand_id = Column(Integer, ForeignKey("brand.id"), nullable=True)
+    # indexed so name searches (search_index.product_ids_like) reach products by key
+    drug_id = Column(Integer, ForeignKey("drug.id"), nullable=False, index=True)
+    brand_id = Column(Integer, ForeignKey("brand.id"), nullable=True, index=True)
     formulation_type_id = Column(Integer, ForeignKey("formulation_type.id"), nullable=False)
-    unit_id = Column(Integer, ForeignKey("unit.id"), nullable=True)
+    unit_id = Column(Integer, ForeignKey("unit.id"), nullable=True, index=True)
 
     strength = Column(String)
     price = Column(Float)
     nhia_cover = Column(Boolean, default=False)
     stock = Column(Integer, default=0)
     reorder_level = Column(Integer, default=10)
-    last_changed_date = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    last_changed_date = Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
     notes = Column(Text, nullable=True)
 
+    # catalog counter shard and version of the last write (etag.bump_catalog_version),
+    # the commit-ordered delta-sync position; 0 for rows written before the counter
+    change_shard = Column(Integer, nullable=False, server_default="0")
+    change_version = Column(BigInteger, nullable=False, server_default="0")
+
     drug = relationship("Drug", back_populates="products")
     brand = relationship("Brand", back_populates="products")
     formulation_type = relationship("FormulationType", back_populates="products")
     unit = relationship("Unit", back_populates="products")
 
+    __table_args__ = (
+        # only the (few) products at or below their reorder level are indexed,
+        # serving low-stock listings and the notification sweep
+        Index(
+            "ix_product_low_stock", "stock",
+            postgresql_where=stock <= reorder_level,
+            sqlite_where=stock <= reorder_level,
+        ),
+        # delta sync pages on (shard, version, id)
+        Index("ix_product_change", "change_shard", "change_version", "id"),
+    )
+
+
+class ProductTombstone(Base):
+    """Marks a deleted product so delta-syncing terminals can drop it too."""
+    __tablename__ = "product_tombstone"
+
+    # no FK: the product row is gone
+    product_id = Column(Integer, primary_key=True)
+    deleted_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+    change_shard = Column(Integer, nullable=False, server_default="0")
+    change_version = Column(BigInteger, nullable=False, server_default="0")
+
+    __table_args__ = (
+        Index("ix_product_tombstone_change", "change_shard", "change_version", "product_id"),
+    )
+
+
+class CatalogVersion(Base):
+    """
+    Counts committed product writes, the source of the catalog ETag. Spread
+    over CATALOG_VERSION_SHARDS rows (id = shard) that readers sum; each
+    write bumps one inside its transaction, so the sum moves exactly when
+    the change becomes visible.
+    """
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
 
 # --------------------
 # USER
@@ -132,6 +178,11 @@ class Dispense(Base):
     user = relationship("User", back_populates="dispenses")
     items = relationship("DispenseItem", back_populates="dispense", cascade="all, delete-orphan")
 
+    # covers the created_at range scans of analytics and dispense history
+    __table_args__ = (
+        Index("ix_dispense_created_at_user_id", "created_at", "user_id"),
+    )
+
 
 class DispenseItem(Base):
     __tablename__ = "dispense_item"
@@ -146,6 +197,63 @@ class DispenseItem(Base):
     dispense = relationship("Dispense", back_populates="items")
     product = relationship("Product")
 
+    # lets analytics aggregate items per dispense from the index alone
+    __table_args__ = (
+        Index(
+            "ix_dispense_item_dispense_id_covering",
+            "dispense_id", "product_id", "qty", "price_at_dispense",
+        ),
+    )
+
+
+# --------------------
+# ANALYTICS ROLLUPS
+# --------------------
+# One row per day and product / user, kept in step with dispense_item by
+# app.rollups. Days follow date(dispense.created_at).
+
+class DailyProductSales(Base):
+    __tablename__ = "daily_product_sales"
+
+    day = Column(Date, primary_key=True)
+    # no FK: sales history stays when the product is deleted
+    product_id = Column(Integer, primary_key=True)
+
+    qty = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    dispense_count = Column(Integer, nullable=False, default=0)
+
+
+class DailyUserActivity(Base):
+    __tablename__ = "daily_user_activity"
+
+    day = Column(Date, primary_key=True)
+    # no FK: activity history stays when the user is deleted
+    user_id = Column(Integer, primary_key=True)
+
+    qty = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    dispense_count = Column(Integer, nullable=False, default=0)
+
+
+# --------------------
+# INVENTORY VALUATION
+# --------------------
+# Stock and stock * price per formulation type and NHIA cover, adjusted by
+# app.valuation whenever a product's stock, price or grouping changes.
+
+class InventoryValuation(Base):
+    __tablename__ = "inventory_valuation"
+
+    formulation_type_id = Column(Integer, ForeignKey("formulation_type.id"), primary_key=True)
+    nhia_cover = Column(Boolean, primary_key=True)
+
+    product_count = Column(Integer, nullable=False, default=0)
+    total_stock = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
+
+    formulation_type = relationship("FormulationType")
+
 
 # --------------------
 # AUDIT LOG
@@ -0,0 +1,47 @@
+"""In-memory set of active low-stock notifications, kept current from the stream"""
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import LowStockNotification
+
+
+class ActiveNotifications:
+    """
+    Active notifications by product id, as of stream position `version`.
+    Loaded from the database once per worker, then kept current by
+    applying every diff the listener broadcasts, so websocket snapshots
+    cost no query.
+    """
+
+    def __init__(self):
+        self.by_product: dict[int, dict] = {}
+        self.version: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.version is not None
+
+    def load(self, db: Session, version: str):
+        """
+        Load from the database. `version` must be read before this runs:
+        events after it are then applied on top, and since each one fully
+        sets its product's state, re-applying one the query already saw is
+        harmless.
+        """
+        rows = db.execute(
+            select(LowStockNotification.id, LowStockNotification.product_id, LowStockNotification.message)
+            .where(LowStockNotification.is_active.is_(True))
+        )
+        self.by_product = {r.product_id: {"id": r.id, "message": r.message, "product_id": r.product_id} for r in rows}
+        self.version = version
+
+    def apply(self, diff: dict):
+        for notification in diff["added"]:
+            self.by_product[notification["product_id"]] = notification
+        for product_id in diff["removed"]:
+            self.by_product.pop(product_id, None)
+        self.version = diff["id"]
+
+    def snapshot(self) -> dict:
+        return {"type": "snapshot", "id": self.version, "notifications": list(self.by_product.values())}
@@ -1,162 +1,444 @@
-import asyncio, json
+import asyncio, math, os, time
+from collections import defaultdict
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import or_, and_, func, desc
+from sqlalchemy import func, insert, select, union, update, values, column, case, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime, timedelta
 
-from app import models, schemas
+from app import models, schemas, rollups, valuation
+from app.database import is_postgres, SessionLocal
+from app.etag import bump_catalog_version
+from app.query_options import PRODUCT_RESPONSE_OPTIONS, DISPENSE_RESPONSE_OPTIONS
+from app.search_index import product_index, product_ids_like, PRODUCT_SEARCH_MODE
 from app.router.notifications_router import broadcast_message
 
+from app.redis import notification_stream
 from app.redis.dependencies import delete_cache, redis
+from app.redis.cache_utils import invalidate, invalidate_sync
 
 
-async def check_low_stock_notification(db: Session, product: models.Product):
+# An open low-stock notification is only resolved once stock climbs this
+# fraction of reorder_level above it, so a product hovering around the
+# threshold doesn't flap between add and remove
+LOW_STOCK_HYSTERESIS = float(os.getenv("LOW_STOCK_HYSTERESIS", "0.1"))
+
+
+def low_stock_clear_level(product: models.Product) -> int:
+    """Stock above which an open low-stock notification is resolved."""
+    return product.reorder_level + math.ceil(product.reorder_level * LOW_STOCK_HYSTERESIS)
+
+
+def low_stock_clear_level_sql():
+    """low_stock_clear_level as a SQL expression on models.Product."""
+    return models.Product.reorder_level + func.ceil(models.Product.reorder_level * LOW_STOCK_HYSTERESIS)
+
+
+def low_stock_message(product: models.Product) -> str:
+    return (
+        f"{product.drug.name} {product.strength or ''} "
+        f"{product.formulation_type.name if product.formulation_type else ''} "
+        f"({product.brand.name if product.brand else 'No Brand'}) "
+        f"low on stock — {product.stock} left."
+    )
+
+
+def sync_low_stock_notifications(db: Session, products: list[models.Product]) -> list[dict]:
+    """
+    Set-based reconciliation of notifications with the current stock of
+    `products`: one SELECT for their existing notifications, then at most
+    one bulk INSERT, one bulk reactivation and one bulk deactivation.
+    Notifications open at reorder_level and close above
+    low_stock_clear_level.
+
+    The INSERT is an upsert on product_id: the sweep and a dispense can
+    both find no notification for the same product and both insert it.
+
+    Does not commit. Returns the stream messages to hand to
+    publish_low_stock_messages once the caller has committed.
+    """
+    if not products:
+        return []
+
+    existing = {
+        n.product_id: n
+        for n in db.query(models.LowStockNotification).filter(
+            models.LowStockNotification.product_id.in_([p.id for p in products])
+        )
+    }
+
+    inserts, reactivations, deactivations = [], [], []
+    messages = []
+
+    for p in products:
+        notif = existing.get(p.id)
+
+        # stock low - creates (or re-opens) the notif
+        if p.stock <= p.reorder_level:
+            if notif is None:
+                inserts.append({"product_id": p.id, "message": low_stock_message(p), "is_active": True})
+            elif not notif.is_active:
+                # product_id is unique, so a resolved notif is re-opened in place
+                message = low_stock_message(p)
+                reactivations.append({"id": notif.id, "message": message, "is_active": True})
+                messages.append({"add": {"id": notif.id, "message": message, "product_id": p.id}})
+
+        # stock is ookay (past the hysteresis band), deactivates notifs
+        elif notif is not None and notif.is_active and p.stock > low_stock_clear_level(p):
+            deactivations.append(notif.id)
+            messages.append({"remove": p.id})
+
+    if inserts:
+        stmt = (pg_insert if is_postgres(db) else sqlite_insert)(models.LowStockNotification)
+        rows = db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["product_id"],
+                set_={"message": stmt.excluded.message, "is_active": True},
+            ).returning(
+                models.LowStockNotification.id,
+                models.LowStockNotification.product_id,
+                models.LowStockNotification.message,
+            ),
+            inserts,
+        )
+        messages.extend(
+            {"add": {"id": r.id, "message": r.message, "product_id": r.product_id}}
+            for r in rows
+        )
+    if reactivations:
+        db.execute(update(models.LowStockNotification), reactivations)
+    if deactivations:
+        db.execute(
+            update(models.LowStockNotification)
+            .where(models.LowStockNotification.id.in_(deactivations))
+            .values(is_active=False)
+        )
+
+    return messages
+
+
+async def publish_low_stock_messages(messages: list[dict]):
+    """
+    Append buffered low-stock messages to the notification stream in a
+    single Redis round trip. Callers have already committed, so Redis
+    errors are logged, not raised (a retried request would repeat the
+    write); low_stock_sweeper reconciles the notifications later.
+    """
+    if not messages:
+        return
+    await invalidate("notifications")
+    try:
+        await notification_stream.publish(messages)
+    except Exception as e:
+        print("Could not publish low-stock messages:", e)
+
+
+def publish_low_stock_messages_sync(messages: list[dict]):
+    """publish_low_stock_messages for sync write paths; Redis errors are logged, not raised."""
+    if not messages:
+        return
+    invalidate_sync("notifications")
+    try:
+        notification_stream.publish_sync(messages)
+    except Exception as e:
+        print("Could not publish low-stock messages:", e)
+
+
+# How often one worker reconciles notifications for the whole catalog (0 = never)
+LOW_STOCK_SWEEP_SECONDS = int(os.getenv("LOW_STOCK_SWEEP_SECONDS", "60"))
+
+
+def sweep_low_stock(db: Session) -> list[dict]:
+    """
+    Reconcile notifications with stock for the whole catalog, catching
+    writes that bypassed sync_low_stock_notifications (direct SQL, imports,
+    new products). One SELECT finds the products that may be out of date:
+    low with no active notification (read from ix_product_low_stock), or
+    with an active notification but back above low_stock_clear_level (read
+    from the active notifications); sync_low_stock_notifications then
+    writes the changes in bulk. Commits; returns the messages to publish.
+    """
+    notification = models.LowStockNotification
+    # EXISTS, not NOT IN: NOT IN (...) matches nothing once it holds a NULL product_id
+    notified = (
+        select(notification.id)
+        .where(notification.product_id == models.Product.id, notification.is_active.is_(True))
+        .exists()
+    )
+    stale = union(
+        select(models.Product.id).where(models.Product.stock <= models.Product.reorder_level, ~notified),
+        select(notification.product_id)
+        .join(models.Product, models.Product.id == notification.product_id)
+        .where(notification.is_active.is_(True), models.Product.stock > low_stock_clear_level_sql()),
+    )
+    products = (
+        db.query(models.Product)
+        .options(*PRODUCT_RESPONSE_OPTIONS)
+        .filter(models.Product.id.in_(stale))
+        .all()
+    )
+    try:
+        messages = sync_low_stock_notifications(db, products)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return messages
+
+
+def _sweep() -> list[dict]:
+    with SessionLocal() as db:
+        return sweep_low_stock(db)
+
+
+async def low_stock_sweeper():
+    """Run sweep_low_stock every LOW_STOCK_SWEEP_SECONDS on one worker at a time."""
+    while True:
+        await asyncio.sleep(LOW_STOCK_SWEEP_SECONDS)
+        try:
+            # the lock outlives the sweep by design: one sweep per interval across workers
+            if not await redis.set("low_stock_sweep:lock", "1", nx=True, px=LOW_STOCK_SWEEP_SECONDS * 1000):
+                continue
+            messages = await asyncio.to_thread(_sweep)
+            if messages:
+                print(f"Low-stock sweep reconciled {len(messages)} notifications")
+            await publish_low_stock_messages(messages)
+        except Exception as e:
+            print("Low-stock sweep error:", e)
+
+
+def check_low_stock_notification(db: Session, product: models.Product):
     """
     Ensures notifications state matches current stock.
-    Called anytime that the stock is changed
-    """
-
-    # stock low - creates the notifs
-    if product.stock <= product.reorder_level:
-        notif = db.query(models.LowStockNotification).filter_by(
-            product_id=product.id, is_active=True
-        ).first()
-
-
-        if not notif:
-            notif = models.LowStockNotification(
-                product_id=product.id,
-                message=f"{product.drug.name} {product.strength or ''} "
-                        f"{product.formulation_type.name if product.formulation_type else ''} "
-                        f"({product.brand.name if product.brand else 'No Brand'}) "
-                        f"low on stock — {product.stock} left."
-            )
-            db.add(notif)
-            db.flush()
-
-
-            await redis.publish(
-                "low_stock_channel",
-                json.dumps({
-                    "add": {
-                        "id": notif.id,
-                        "message": notif.message,
-                        "product_id": product.id
-                    }
-                })
-            )
+    Called anytime that the stock is changed; commits and then publishes.
+    """
+    messages = sync_low_stock_notifications(db, [product])
+    db.commit()
+    publish_low_stock_messages_sync(messages)
 
-    
-    # stock is ookay, deactivates notifs
-    else:
-        notif = db.query(models.LowStockNotification).filter_by(
-            product_id=product.id, is_active=True
-        ).first()
 
-        if notif:
-            notif.is_active = False
-            db.flush()
 
+# How long dispense_products holds product row locks (UPDATE -> COMMIT)
+dispense_lock_stats = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
 
-            # Broadcast the removal
-            await redis.publish(
-                "low_stock_channel",
-                json.dumps({"remove": product.id})
-            )
 
+def _record_lock_time(started: float):
+    held_ms = (time.perf_counter() - started) * 1000
+    dispense_lock_stats["count"] += 1
+    dispense_lock_stats["total_ms"] += held_ms
+    dispense_lock_stats["max_ms"] = max(dispense_lock_stats["max_ms"], held_ms)
 
 
-async def dispense_products(db: Session, user: models.User, dispense_in: schemas.DispenseCreate):
-    """Dispense products automatically and handle low-stock notifications."""
+def _decrement_stock(db: Session, qty_by_product: dict[int, int]) -> dict[int, float | None]:
+    """
+    Decrement stock for every product in one guarded UPDATE.
+    Only rows with `stock >= qty` are touched; returns {product_id: price}
+    for the rows that were, so the caller can spot shortfalls.
+    """
+    if is_postgres(db):
+        # Lock the rows in id order first: UPDATE ... FROM locks them in
+        # whatever order its join runs, so concurrent dispenses of
+        # overlapping products could otherwise deadlock
+        db.execute(
+            select(models.Product.id)
+            .where(models.Product.id.in_(qty_by_product))
+            .order_by(models.Product.id)
+            .with_for_update()
+        )
+        # UPDATE product ... FROM (VALUES (id, qty), ...) AS v
+        v = values(column("id", Integer), column("qty", Integer), name="v").data(
+            sorted(qty_by_product.items())
+        )
+        stmt = (
+            update(models.Product)
+            .where(models.Product.id == v.c.id, models.Product.stock >= v.c.qty)
+            .values(stock=models.Product.stock - v.c.qty)
+        )
+    else:
+        # SQLite can't alias VALUES columns, a CASE keeps it to one statement
+        qty = case(qty_by_product, value=models.Product.id)
+        stmt = (
+            update(models.Product)
+            .where(models.Product.id.in_(qty_by_product), models.Product.stock >= qty)
+            .values(stock=models.Product.stock - qty)
+        )
+
+    rows = db.execute(
+        stmt.returning(models.Product.id, models.Product.price),
+        execution_options={"synchronize_session": False},
+    )
+    return {r.id: r.price for r in rows}
 
-    # Collect product IDs
-    product_ids = [item.product_id for item in dispense_in.items]
 
-    # Lock all products once
+def _shortfall_message(db: Session, product_ids: set[int]) -> str:
     products = (
         db.query(models.Product)
+        .options(*PRODUCT_RESPONSE_OPTIONS)
         .filter(models.Product.id.in_(product_ids))
-        .with_for_update()
         .all()
     )
+    found = {p.id for p in products}
+    for product_id in sorted(product_ids - found):
+        return f"Product {product_id} not found."
+    p = min(products, key=lambda p: p.id)
+    return f"Insufficient stock for product {p.id} ({p.drug.name})"
 
-    prod_map = {p.id: p for p in products}
 
-    # Validate stock before any modifications
+def apply_dispense(db: Session, user: schemas.UserResponse, dispense_in: schemas.DispenseCreate):
+    """
+    Database half of a dispense: writes and commits everything and returns
+    (dispense, low-stock messages to publish). Plain sync so it can also run
+    on an AsyncSession through run_sync.
+    """
+
+    # Total quantity per product (the same product may appear on several lines)
+    qty_by_product = defaultdict(int)
     for item in dispense_in.items:
-        p = prod_map.get(item.product_id)
-        if not p:
-            raise ValueError(f"Product {item.product_id} not found.")
         if item.qty <= 0:
             raise ValueError("Quantity must be > 0.")
-        if p.stock is None or p.stock < item.qty:
-            raise ValueError(f"Insufficient stock for product {p.id} ({p.drug.name})")
-
-    # These will be published after commit
-    redis_messages = []
+        qty_by_product[item.product_id] += item.qty
 
     try:
-        print("DEBUG - Dispense initiated by:", user.id, user.username)
-
+        # insert the header before any product row is locked
         disp = models.Dispense(user_id=user.id)
         db.add(disp)
         db.flush()
 
-        for item in dispense_in.items:
-            p = prod_map[item.product_id]
-
-            # Decrease stock
-            p.stock -= item.qty
-
-            # Check reorder-level condition
-            await check_low_stock_notification(db, p)
+        # Decrease stock; row locks are held from here until commit
+        lock_started = time.perf_counter()
+        prices = _decrement_stock(db, qty_by_product)
+
+        missing = set(qty_by_product) - set(prices)
+        if missing:
+            raise ValueError(_shortfall_message(db, missing))
+
+        db.execute(
+            insert(models.DispenseItem),
+            [
+                {
+                    "dispense_id": disp.id,
+                    "product_id": item.product_id,
+                    "qty": item.qty,
+                    "price_at_dispense": prices[item.product_id],
+                }
+                for item in dispense_in.items
+            ],
+        )
+        rollups.record_dispense(db, disp.id)
+
+        # Check reorder-level condition for the whole dispense at once;
+        # populate_existing so products already in the session get the
+        # stock the UPDATE above left (it doesn't synchronize the session)
+        products = (
+            db.query(models.Product)
+            .options(*PRODUCT_RESPONSE_OPTIONS)
+            .filter(models.Product.id.in_(qty_by_product))
+            .order_by(models.Product.id)
+            .populate_existing()
+            .all()
+        )
+        redis_messages = sync_low_stock_notifications(db, products)
+        # last before commit: the summary rows are shared by every dispense
+        valuation.apply_deltas(
+            db, [valuation.stock_change(p, -qty_by_product[p.id], prices[p.id]) for p in products]
+        )
+        bump_catalog_version(db, qty_by_product)
 
         # Commit DB transaction
         db.commit()
+        _record_lock_time(lock_started)
 
     except Exception:
         db.rollback()
         raise
 
-    # Only publish Redis messages after successful commit
-    for msg in redis_messages:
-        await redis.publish("low_stock_channel", json.dumps(msg))
+    disp = (
+        db.query(models.Dispense)
+        .options(*DISPENSE_RESPONSE_OPTIONS)
+        .filter(models.Dispense.id == disp.id)
+        .one()
+    )
+    return disp, redis_messages
+
+
+async def dispense_products(db: Session, user: schemas.UserResponse, dispense_in: schemas.DispenseCreate):
+    """Dispense products automatically and handle low-stock notifications."""
+    disp, redis_messages = apply_dispense(db, user, dispense_in)
+
+    # Only publish Redis messages after successful commit (locks released)
+    await publish_low_stock_messages(redis_messages)
+    await invalidate("products", "analytics")
 
     return disp
 
 
 
 
-async def ad_search_products(db: Session, query: str, skip=0, limit=100):
+def search_products(db: Session, query: str, skip=0, limit=100):
+    """
+    Multi-token AND search over drug, brand, strength and unit.
+    Plain sync so it can run in a thread or on an AsyncSession via run_sync.
+    """
     tokens = [q.strip() for q in query.split() if q.strip()]
 
-    def sync_query():
-        q = db.query(models.Product).join(models.Drug).outerjoin(models.Brand).outerjoin(models.Unit)
-        filters = []
-        for tok in tokens:
-            tok_like = f"%{tok}%"
-            filters.append(
-                or_(
-                    models.Drug.name.ilike(tok_like),
-                    models.Brand.name.ilike(tok_like),
-                    models.Product.strength.ilike(tok_like),
-                    models.Unit.code.ilike(tok_like),
-                    models.Unit.name.ilike(tok_like),
-                )
-            )
-        if not filters:
+    if PRODUCT_SEARCH_MODE == "index" and product_index.ready:
+        # matching is answered by the in-memory index, once it has caught
+        # up with writes from other workers; only the page of rows is
+        # loaded (by primary key) so stock and price stay live
+        product_index.refresh(db)
+        ids = product_index.search(tokens, skip=skip, limit=limit)
+        if not ids:
             return []
-        q = q.filter(and_(*filters)).offset(skip).limit(limit)
-        return q.all()
+        rows = (
+            db.query(models.Product)
+            .options(*PRODUCT_RESPONSE_OPTIONS)
+            .filter(models.Product.id.in_(ids))
+            .all()
+        )
+        by_id = {p.id: p for p in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    if not tokens:
+        return []
+
+    # every token must match one of the fields
+    q = (
+        db.query(models.Product)
+        .options(*PRODUCT_RESPONSE_OPTIONS)
+        .filter(*(models.Product.id.in_(product_ids_like(f"%{tok}%")) for tok in tokens))
+    )
+
+    if PRODUCT_SEARCH_MODE == "trigram" and is_postgres(db):
+        # rank by how closely the whole query matches the product text
+        q = q.join(models.Drug).outerjoin(models.Brand).outerjoin(models.Unit)
+        document = func.concat_ws(
+            " ", models.Drug.name, models.Brand.name, models.Product.strength,
+            models.Unit.code, models.Unit.name,
+        )
+        q = q.order_by(func.word_similarity(query, document).desc(), models.Product.id)
+    else:
+        q = q.order_by(models.Product.id)
+
+    return q.offset(skip).limit(limit).all()
+
 
-    return await asyncio.to_thread(sync_query)
+async def ad_search_products(db: Session, query: str, skip=0, limit=100):
+    return await asyncio.to_thread(search_products, db, query, skip, limit)
 
 
 
 def get_low_stock(db: Session):
+    """
+    Products at or below their reorder level, lowest stock first. The filter
+    is exactly the predicate of ix_product_low_stock, so the rows come from
+    that partial index (already in stock order) without touching the rest
+    of the catalog.
+    """
     return (
         db.query(models.Product)
+        .options(*PRODUCT_RESPONSE_OPTIONS)
         .filter(models.Product.stock <= models.Product.reorder_level)
         .order_by(models.Product.stock.asc())
         .all()
@@ -176,7 +458,7 @@ def log_action(db: Session, admin_id: int, product_id: int, action: str, old_val
     return log_entry
 
 
-async def update_product_reorder_level(db: Session, product_id: int, reorder_level: int, admin_id: int):
+def update_product_reorder_level(db: Session, product_id: int, reorder_level: int, admin_id: int):
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
@@ -185,29 +467,33 @@ async def update_product_reorder_level(db: Session, product_id: int, reorder_lev
     product.reorder_level = reorder_level
 
     log_action(db, admin_id, product.id, "update_reorder", old_value, reorder_level)
+    bump_catalog_version(db, [product.id])
 
-    db.commit()
+    check_low_stock_notification(db, product)
     db.refresh(product)
-    await check_low_stock_notification(db, product)
+    invalidate_sync("products", "audit")
 
     return product
 
 
 
-async def update_product_stock(db: Session, product_id: int, qty: int, admin_id: int):
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+def update_product_stock(db: Session, product_id: int, qty: int, admin_id: int):
+    # locked, so the valuation delta is taken from the stock actually replaced
+    product = db.query(models.Product).filter(models.Product.id == product_id).with_for_update().first()
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
     old_value = product.stock
     product.stock = qty
+    valuation.apply_deltas(db, [valuation.stock_change(product, qty - (old_value or 0), product.price)])
 
     log_action(db, admin_id, product.id, "update_stock", old_value, qty)
-    
-    db.commit()
+    bump_catalog_version(db, [product.id])
+
+    check_low_stock_notification(db, product)
     db.refresh(product)
-    await check_low_stock_notification(db, product)
-    
+    invalidate_sync("products", "audit")
+
     return product
 
 
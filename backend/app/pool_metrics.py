@@ -0,0 +1,107 @@
+"""Connection pool instrumentation"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+# Upper bounds (ms) of the latency histogram buckets, the last one catches the rest
+BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, float("inf")]
+
+
+class Histogram:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": self.total_ms / self.count if self.count else 0.0,
+            "max_ms": self.max_ms,
+            "buckets": {
+                ("+Inf" if b == float("inf") else f"le_{b}ms"): c
+                for b, c in zip(BUCKETS_MS, self.counts)
+            },
+        }
+
+
+class PoolMetrics:
+    """
+    Counters for one engine's pool: how long callers wait for a connection,
+    what the pre-ping costs, and how often a checkout fails (pool timeouts).
+    """
+
+    def __init__(self):
+        self.wait = Histogram()
+        self.pre_ping = Histogram()
+        self.checkout_errors = 0
+        self.engine = None
+
+    def snapshot(self) -> dict:
+        pool = self.engine.pool if self.engine is not None else None
+        return {
+            "size": pool.size() if pool else None,
+            "checked_out": pool.checkedout() if pool else None,
+            "checked_in": pool.checkedin() if pool else None,
+            "overflow": pool.overflow() if pool else None,
+            "checkout_errors": self.checkout_errors,
+            "wait": self.wait.snapshot(),
+            "pre_ping": self.pre_ping.snapshot(),
+        }
+
+
+POOL_METRICS = {"sync": PoolMetrics(), "async": PoolMetrics()}
+
+
+class _InstrumentedPoolMixin:
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except Exception:
+            self.metrics.checkout_errors += 1
+            raise
+        now = time.perf_counter()
+        self.metrics.wait.observe(now - started)
+
+        # the pre-ping runs between here and the checkout event
+        record.info["checked_out_at"] = now
+        return record
+
+
+def _on_checkout(dbapi_connection, record, proxy):
+    started = record.info.pop("checked_out_at", None)
+    pool = proxy._pool
+    if started is not None and pool._pre_ping:
+        pool.metrics.pre_ping.observe(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    metrics = POOL_METRICS["sync"]
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = POOL_METRICS["async"]
+
+
+def instrument(key: str, engine):
+    """Report an engine (created with an instrumented poolclass) under `key`."""
+    POOL_METRICS[key].engine = engine
+    event.listen(engine, "checkout", _on_checkout)
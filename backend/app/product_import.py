@@ -0,0 +1,202 @@
+"""Bulk product import: set-based lookups, executemany writes, per-row errors"""
+
+import asyncio
+from types import SimpleNamespace
+
+from pydantic import ValidationError
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app import models, schemas, valuation
+from app.database import is_postgres
+from app.etag import bump_catalog_version
+from app.operations import publish_low_stock_messages, sync_low_stock_notifications
+from app.query_options import PRODUCT_RESPONSE_OPTIONS
+from app.redis.cache_utils import invalidate
+from app.search_index import product_index
+
+
+BULK_IMPORT_MAX_ROWS = 100_000
+
+# Rows per IN (...) list / lookup upsert, well under SQLite's variable limit
+CHUNK_SIZE = 1000
+
+# Product columns a row may set, with the values new products get when it doesn't
+PRODUCT_DEFAULTS = {
+    "strength": None,
+    "price": None,
+    "nhia_cover": False,
+    "stock": 0,
+    "reorder_level": models.Product.reorder_level.default.arg,
+    "notes": None,
+}
+
+LOOKUP_FIELDS = {"drug_id", "brand_id", "formulation_type_id", "unit_id"}
+
+
+def _chunks(items, size: int = CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _resolve_names(db: Session, model, names: set[str]) -> dict[str, int]:
+    """name -> id for a lookup table, creating missing names with INSERT ... ON CONFLICT DO NOTHING."""
+    insert_ = pg_insert if is_postgres(db) else sqlite_insert
+    ids = {}
+    for chunk in _chunks(names):
+        db.execute(insert_(model).on_conflict_do_nothing(index_elements=["name"]), [{"name": n} for n in chunk])
+        ids.update(db.execute(select(model.name, model.id).where(model.name.in_(chunk))).all())
+    return ids
+
+
+def _resolve_units(db: Session, names: set[str]) -> dict[str, int]:
+    """Units need a code too, so they are matched (on name or code) but never created."""
+    ids = {}
+    for chunk in _chunks(names):
+        rows = db.execute(
+            select(models.Unit.id, models.Unit.name, models.Unit.code)
+            .where(or_(models.Unit.name.in_(chunk), models.Unit.code.in_(chunk)))
+        )
+        for unit in rows:
+            ids.setdefault(unit.name, unit.id)
+            ids.setdefault(unit.code, unit.id)
+    return ids
+
+
+def _error(row: int, e: ValidationError) -> dict:
+    return {
+        "row": row,
+        "error": "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors()),
+    }
+
+
+def import_products(db: Session, rows: list) -> tuple[dict, list[dict]]:
+    """
+    Create or update products from ProductCreate-shaped rows (lookup fields
+    hold names). A row updates the product with the same drug, brand,
+    formulation type, unit and strength if there is one, else creates it.
+
+    Invalid rows are skipped and reported by their 1-based position; the
+    rest are written in one transaction. Returns (summary, low-stock
+    messages to publish after commit).
+    """
+    errors = []
+    valid = []
+    for row_no, raw in enumerate(rows, start=1):
+        try:
+            valid.append((row_no, schemas.ProductCreate.model_validate(raw)))
+        except ValidationError as e:
+            errors.append(_error(row_no, e))
+
+    try:
+        drugs = _resolve_names(db, models.Drug, {item.drug_id for _, item in valid})
+        brands = _resolve_names(db, models.Brand, {item.brand_id for _, item in valid if item.brand_id})
+        types = _resolve_names(db, models.FormulationType, {item.formulation_type_id for _, item in valid})
+        units = _resolve_units(db, {item.unit_id for _, item in valid if item.unit_id})
+
+        # one entry per product key, later rows for the same product win
+        resolved = {}
+        for row_no, item in valid:
+            if item.unit_id and item.unit_id not in units:
+                errors.append({"row": row_no, "error": f"unit_id: unknown unit '{item.unit_id}'"})
+                continue
+            key = (
+                drugs[item.drug_id],
+                brands.get(item.brand_id),
+                types[item.formulation_type_id],
+                units.get(item.unit_id),
+                item.strength,
+            )
+            resolved.setdefault(key, {}).update(item.model_dump(exclude_unset=True, exclude=LOOKUP_FIELDS))
+
+        existing = {}
+        for chunk in _chunks({key[0] for key in resolved}):
+            matches = db.execute(
+                select(
+                    models.Product.id, models.Product.drug_id, models.Product.brand_id,
+                    models.Product.formulation_type_id, models.Product.unit_id, models.Product.strength,
+                    models.Product.stock, models.Product.price, models.Product.nhia_cover,
+                )
+                .where(models.Product.drug_id.in_(chunk))
+                .order_by(models.Product.id)
+                .with_for_update()  # valuation deltas are taken from these
+            )
+            for p in matches:
+                existing.setdefault((p.drug_id, p.brand_id, p.formulation_type_id, p.unit_id, p.strength), p)
+
+        inserts, updates, deltas = [], [], []
+        for key, fields in resolved.items():
+            drug_id, brand_id, formulation_type_id, unit_id, strength = key
+            current = existing.get(key)
+            if current is None:
+                row = {
+                    **PRODUCT_DEFAULTS, **fields,
+                    "drug_id": drug_id, "brand_id": brand_id,
+                    "formulation_type_id": formulation_type_id, "unit_id": unit_id,
+                }
+                inserts.append(row)
+                deltas.append(valuation.contribution(SimpleNamespace(**row)))
+            else:
+                updates.append({"id": current.id, **fields})
+                deltas.append(valuation.contribution(current, -1))
+                deltas.append(valuation.contribution(SimpleNamespace(**{**current._asdict(), **fields})))
+
+        created_ids = []
+        if inserts:
+            # Core insert: executemany batches without building ORM state
+            product = models.Product.__table__
+            created_ids = list(db.scalars(
+                insert(product).returning(product.c.id),
+                inserts,
+            ))
+            # SQLite can hand out a deleted product's id again
+            for chunk in _chunks(created_ids):
+                db.execute(delete(models.ProductTombstone).where(models.ProductTombstone.product_id.in_(chunk)))
+        if updates:
+            db.execute(update(models.Product), updates)
+        valuation.apply_deltas(db, deltas)
+
+        # only products that are low, or have a notification to close, need a look
+        touched = created_ids + [u["id"] for u in updates]
+        active = select(models.LowStockNotification.product_id).where(models.LowStockNotification.is_active.is_(True))
+        to_check = []
+        for chunk in _chunks(touched):
+            to_check += (
+                db.query(models.Product)
+                .options(*PRODUCT_RESPONSE_OPTIONS)
+                .filter(
+                    models.Product.id.in_(chunk),
+                    or_(models.Product.stock <= models.Product.reorder_level, models.Product.id.in_(active)),
+                )
+                .all()
+            )
+        messages = sync_low_stock_notifications(db, to_check)
+        if touched:
+            # also sets last_changed_date, from the database clock
+            bump_catalog_version(db, touched)
+
+        db.commit()
+
+    except Exception:
+        db.rollback()
+        raise
+
+    if product_index.ready:
+        for chunk in _chunks(touched):
+            product_index.upsert_many(db, chunk)
+
+    errors.sort(key=lambda e: e["row"])
+    return {"created": len(created_ids), "updated": len(updates), "errors": errors}, messages
+
+
+async def bulk_import_products(db: Session, rows: list) -> dict:
+    summary, messages = await asyncio.to_thread(import_products, db, rows)
+
+    # publish only after the commit, like dispense_products
+    await publish_low_stock_messages(messages)
+    await invalidate("products")
+
+    return summary
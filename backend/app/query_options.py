@@ -0,0 +1,28 @@
+"""Shared eager-loading presets for ORM queries"""
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import models
+
+
+# Everything utils.to_product_response reads, loaded in the same SELECT
+# so serializing a page of products never falls back to lazy loads.
+PRODUCT_RESPONSE_OPTIONS = (
+    joinedload(models.Product.drug, innerjoin=True),
+    joinedload(models.Product.brand),
+    joinedload(models.Product.formulation_type, innerjoin=True),
+    joinedload(models.Product.unit),
+)
+
+
+# Everything utils.to_dispense_response reads: the user joined in, and all
+# items with their product/drug/brand in one extra SELECT ... IN query.
+DISPENSE_RESPONSE_OPTIONS = (
+    joinedload(models.Dispense.user),
+    selectinload(models.Dispense.items)
+    .joinedload(models.DispenseItem.product)
+    .options(
+        joinedload(models.Product.drug, innerjoin=True),
+        joinedload(models.Product.brand),
+    ),
+)
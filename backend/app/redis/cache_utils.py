@@ -1,54 +1,279 @@
-import json
 import asyncio
+import orjson
+import inspect
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from functools import wraps
-from datetime import datetime, date
-from app.redis.dependencies import redis_client
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.database import SessionLocal, AsyncSessionLocal
+from app.redis.dependencies import redis, redis_client
 
-def cache(ttl: int = 300):
+# kwargs that never take part in a cache key
+SKIP_KWARGS = {"db", "request", "response", "current_user", "current_admin"}
+
+# Response headers an endpoint may set (on its `response` param) that are
+# cached and replayed along with the body
+CACHED_HEADERS = ("x-next-cursor", "x-last-event-id")
+
+# How long one worker may hold a recompute lock, and how often others poll it
+LOCK_TTL_MS = 10_000
+LOCK_POLL_SECONDS = 0.05
+
+# Per-endpoint hit/miss counters for this worker
+cache_stats = defaultdict(lambda: {"hits": 0, "stale": 0, "misses": 0, "errors": 0})
+
+# Recomputations running in this worker, concurrent misses await the same one
+_inflight: dict[str, asyncio.Future] = {}
+_background: set[asyncio.Task] = set()
+
+
+def _tag_key(tag: str) -> str:
+    """Holds when `tag` was last invalidated (epoch seconds)."""
+    return f"cache:tag:{tag}:invalidated_at"
+
+
+def _role(kwargs: dict) -> str:
+    user = kwargs.get("current_user") or kwargs.get("current_admin")
+    if user is None:
+        return "public"
+    return "admin" if getattr(user, "is_admin", False) else "user"
+
+
+def make_key(func, kwargs: dict) -> str:
+    """
+    Canonical key: endpoint, caller role, then the remaining arguments
+    in sorted order (orjson gives a stable encoding for dates too).
+    """
+    params = {k: v for k, v in kwargs.items() if k not in SKIP_KWARGS}
+    args = orjson.dumps(jsonable_encoder(params), option=orjson.OPT_SORT_KEYS).decode()
+    return f"cache:{func.__module__}.{func.__name__}:{_role(kwargs)}:{args}"
+
+
+def _pack(fresh_until: float, headers: dict, body: str) -> str:
+    """Stored values are '[fresh until (epoch), headers]' and the body, one line apart."""
+    return orjson.dumps([fresh_until, headers]).decode() + "\n" + body
+
+
+def _unpack(cached: str) -> tuple[float, dict, str]:
+    meta, _, body = cached.partition("\n")
+    fresh_until, headers = orjson.loads(meta)
+    return fresh_until, headers, body
+
+
+def _fresh_until(fresh_until: float, ttl: int, invalidated_at: list) -> float:
+    """
+    When an entry stops being fresh: at fresh_until, or earlier if one of its
+    tags was invalidated after it was computed (at fresh_until - ttl).
+    """
+    computed_at = fresh_until - ttl
+    marks = [float(t) for t in invalidated_at if t is not None and float(t) >= computed_at]
+    return min([fresh_until, *marks])
+
+
+def _response(headers: dict, body: str) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@asynccontextmanager
+async def _own_session(kwargs: dict):
+    """
+    Swap the request's db session for a new one, for refreshes that run
+    after the response (and its session) are gone.
+    """
+    db = kwargs.get("db")
+    if isinstance(db, AsyncSession):
+        async with AsyncSessionLocal() as new_db:
+            yield {**kwargs, "db": new_db}
+    elif isinstance(db, Session):
+        new_db = SessionLocal()
+        try:
+            yield {**kwargs, "db": new_db}
+        finally:
+            new_db.close()
+    else:
+        yield kwargs
+
+
+async def _single_flight(key: str, compute) -> tuple[dict, str]:
+    """
+    Run compute() once per key in this worker; concurrent callers share it.
+    If the caller computing it is cancelled (e.g. its client went away), a
+    waiter takes over instead of waiting forever.
+    """
+    while (future := _inflight.get(key)) is not None:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling() or not future.cancelled():
+                raise  # this caller was cancelled, not the computation
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        entry = await compute()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as exc:
+        future.set_exception(exc)
+        future.exception()  # retrieved here, waiters still get it raised
+        raise
+    else:
+        future.set_result(entry)
+        return entry
+    finally:
+        _inflight.pop(key, None)
+
+
+def cache(ttl: int = 300, tags: tuple[str, ...] = (), stale_ttl: int = 0):
     """
     Async decorator for caching FastAPI endpoint results in Redis.
+
+    Results are stored as orjson bytes and returned as a raw JSON Response,
+    skipping serialization and response_model validation. invalidate() on
+    any of `tags` marks every entry computed before it as expired.
+    CACHED_HEADERS the endpoint sets on its `response` are kept alongside.
+
+    Recomputation is single-flight: one per key per worker, and across
+    workers through a Redis lock that the others wait on. With `stale_ttl`,
+    an expired (or invalidated) value is still served for that many seconds
+    while a single background refresh replaces it. Redis being unavailable
+    only turns the cache off.
     """
     def decorator(func):
+        name = f"{func.__module__}.{func.__name__}"
+        is_async = inspect.iscoroutinefunction(func)
+        tag_keys = [_tag_key(tag) for tag in tags]
+
+        async def lookup(key: str) -> tuple[float, dict, str] | None:
+            """The cached entry and when it stops being fresh, in one round trip."""
+            cached, *invalidated_at = await redis.mget(key, *tag_keys)
+            if cached is None:
+                return None
+            fresh_until, headers, body = _unpack(cached)
+            return _fresh_until(fresh_until, ttl, invalidated_at), headers, body
+
+        async def call(args, kwargs):
+            if is_async:
+                return await func(*args, **kwargs)
+            return await run_in_threadpool(func, *args, **kwargs)
+
+        async def store(key: str, computed_at: float, headers: dict, body: str):
+            await redis.setex(key, ttl + stale_ttl, _pack(computed_at + ttl, headers, body))
+
+        async def recompute(key: str, args, kwargs) -> tuple[dict, str]:
+            stats = cache_stats[name]
+            lock = f"{key}:lock"
+            try:
+                acquired = await redis.set(lock, "1", nx=True, px=LOCK_TTL_MS)
+            except Exception:
+                stats["errors"] += 1
+                acquired = False
+            else:
+                if not acquired:
+                    # another worker is computing it: wait for its result
+                    deadline = time.monotonic() + LOCK_TTL_MS / 1000
+                    while time.monotonic() < deadline:
+                        await asyncio.sleep(LOCK_POLL_SECONDS)
+                        entry = await lookup(key)
+                        if entry is not None:
+                            fresh_until, headers, body = entry
+                            if fresh_until > time.time():
+                                return headers, body
+
+            try:
+                if acquired:
+                    # a recompute that finished after our miss may have stored it since
+                    try:
+                        entry = await lookup(key)
+                    except Exception:
+                        entry = None
+                    if entry is not None and entry[0] > time.time():
+                        return entry[1], entry[2]
+
+                computed_at = time.time()
+                body = orjson.dumps(jsonable_encoder(await call(args, kwargs))).decode()
+                response = kwargs.get("response")
+                headers = {
+                    h: response.headers[h] for h in CACHED_HEADERS
+                    if isinstance(response, Response) and h in response.headers
+                }
+                try:
+                    await store(key, computed_at, headers, body)
+                except Exception:
+                    stats["errors"] += 1
+                return headers, body
+            finally:
+                if acquired:
+                    try:
+                        await redis.delete(lock)
+                    except Exception:
+                        pass
+
+        async def refresh(key: str, args, kwargs):
+            try:
+                async with _own_session(kwargs) as own_kwargs:
+                    await _single_flight(key, lambda: recompute(key, args, own_kwargs))
+            except Exception:
+                cache_stats[name]["errors"] += 1
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-             # Remove non-serializable objects (like db sessions)
-            serializable_kwargs = {
-                k: v for k, v in kwargs.items() if k not in {"db", "request", "response"}
-            }
-
-            # Make a key based only on the kwargs
-            key = f"{func.__name__}:{json.dumps(serializable_kwargs, sort_keys=True)}"
-            redis = redis_client
-
-            cached = await asyncio.to_thread(redis.get, key)
-            if cached:
-                return json.loads(cached)
-
-            # Call the original function
-            
-            result = await func(*args, **kwargs)  # <-- force keyword args
-             # ---  Convert ORM objects to serializable form ---
-            # --- Convert objects recursively to JSON-safe ---
-            def make_json_safe(obj):
-                if isinstance(obj, list):
-                    return [make_json_safe(i) for i in obj]
-                elif isinstance(obj, dict):
-                    return {k: make_json_safe(v) for k, v in obj.items()}
-                elif hasattr(obj, "__dict__"):  # ORM object
-                    return {
-                        k: make_json_safe(v)
-                        for k, v in vars(obj).items()
-                        if not k.startswith("_")
-                    }
-                elif isinstance(obj, (datetime, date)):  # ✅ Fix for datetime
-                    return obj.isoformat()
-                return obj
-
-            safe_result = make_json_safe(result)
-
-            # Save in Redis (off main thread)
-            await asyncio.to_thread(redis.setex, key, ttl, json.dumps(safe_result))
-            return result
-        
+            key = make_key(func, kwargs)
+            stats = cache_stats[name]
+
+            try:
+                entry = await lookup(key)
+            except Exception:
+                stats["errors"] += 1
+                entry = None
+
+            if entry is not None:
+                fresh_until, headers, body = entry
+                now = time.time()
+                if fresh_until > now:
+                    stats["hits"] += 1
+                    return _response(headers, body)
+                if fresh_until + stale_ttl > now:
+                    # stale-while-revalidate: answer now, refresh once in the background
+                    stats["stale"] += 1
+                    if key not in _inflight:
+                        task = asyncio.create_task(refresh(key, args, kwargs))
+                        _background.add(task)
+                        task.add_done_callback(_background.discard)
+                    return _response(headers, body)
+
+            stats["misses"] += 1
+            return _response(*await _single_flight(key, lambda: recompute(key, args, kwargs)))
+
         return wrapper
     return decorator
+
+
+async def invalidate(*tags: str):
+    """
+    Expire every cached response under any of `tags`. Entries are only
+    marked, not deleted, so endpoints with a stale_ttl keep answering from
+    them while one refresh runs.
+    """
+    if not tags:
+        return
+    try:
+        await redis.mset({_tag_key(tag): time.time() for tag in tags})
+    except Exception:
+        pass
+
+
+def invalidate_sync(*tags: str):
+    """invalidate() for sync write paths running in the threadpool."""
+    if not tags:
+        return
+    try:
+        redis_client.mset({_tag_key(tag): time.time() for tag in tags})
+    except Exception:
+        pass
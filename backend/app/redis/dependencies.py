@@ -1,9 +1,24 @@
+import os
 from app.redis.redis_client import redis_client, REDIS_URL, delete_cache
 import redis.asyncio as aioredis
 
+# Async connections per worker. A burst beyond this (e.g. hundreds of
+# concurrent cache misses) waits up to REDIS_POOL_TIMEOUT seconds for one
+# instead of failing outright, as redis-py's default pool does.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+
 def get_redis():
     """Return the redis client instance."""
     return redis_client
 
 
-redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+redis = aioredis.Redis(
+    connection_pool=aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        encoding="utf-8",
+        decode_responses=True,
+    )
+)
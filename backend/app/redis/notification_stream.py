@@ -0,0 +1,111 @@
+"""Low-stock events on a Redis Stream, so websocket clients can resume after a reconnect"""
+
+import json
+import os
+
+from app.redis.dependencies import redis, redis_client
+
+
+LOW_STOCK_STREAM = "low_stock_stream"
+
+# Events kept for replay; XADD trims approximately (MAXLEN ~) to stay cheap
+LOW_STOCK_STREAM_MAXLEN = int(os.getenv("LOW_STOCK_STREAM_MAXLEN", "10000"))
+
+# How long one XREAD waits for new events before it is reissued
+READ_BLOCK_MS = 5000
+READ_COUNT = 500
+
+# Events read within this window go out to clients as a single diff
+LOW_STOCK_COALESCE_MS = int(os.getenv("LOW_STOCK_COALESCE_MS", "250"))
+
+
+def _event(event_id: str, fields: dict) -> dict:
+    return {"id": event_id, **json.loads(fields["data"])}
+
+
+def _parse_id(event_id: str) -> tuple[int, int]:
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+async def publish(messages: list[dict]):
+    """XADD messages in a single Redis round trip."""
+    async with redis.pipeline(transaction=False) as pipe:
+        for msg in messages:
+            pipe.xadd(
+                LOW_STOCK_STREAM,
+                {"data": json.dumps(msg)},
+                maxlen=LOW_STOCK_STREAM_MAXLEN,
+                approximate=True,
+            )
+        await pipe.execute()
+
+
+def publish_sync(messages: list[dict]):
+    """publish() for sync write paths running in the threadpool."""
+    with redis_client.pipeline(transaction=False) as pipe:
+        for msg in messages:
+            pipe.xadd(
+                LOW_STOCK_STREAM,
+                {"data": json.dumps(msg)},
+                maxlen=LOW_STOCK_STREAM_MAXLEN,
+                approximate=True,
+            )
+        pipe.execute()
+
+
+async def latest_id() -> str:
+    entries = await redis.xrevrange(LOW_STOCK_STREAM, count=1)
+    return entries[0][0] if entries else "0-0"
+
+
+async def read(after: str, block_ms: int = READ_BLOCK_MS) -> list[dict]:
+    """Events after `after`, waiting up to block_ms for the first one."""
+    response = await redis.xread({LOW_STOCK_STREAM: after}, count=READ_COUNT, block=block_ms)
+    return [_event(event_id, fields) for _, entries in response or [] for event_id, fields in entries]
+
+
+async def replay(after: str, upto: str) -> list[dict] | None:
+    """
+    Events after `after` up to and including `upto`, or None when `after` is
+    not a usable position (malformed, older than the oldest event kept so
+    some events may have been trimmed away, or past `upto`: a client that
+    got further on another worker can't be replayed back to this one).
+    """
+    try:
+        after_key, upto_key = _parse_id(after), _parse_id(upto)
+    except ValueError:
+        return None
+    if after_key > upto_key:
+        return None
+    if after_key == upto_key:
+        return []
+
+    oldest = await redis.xrange(LOW_STOCK_STREAM, count=1)
+    if not oldest or after_key < _parse_id(oldest[0][0]):
+        return None
+
+    entries = await redis.xrange(LOW_STOCK_STREAM, min=f"({after}", max=upto)
+    return [_event(event_id, fields) for event_id, fields in entries]
+
+
+def coalesce(events: list[dict], prev: str) -> dict:
+    """
+    Fold a run of stream events after position `prev` into one diff:
+    {"type": "diff", "prev", "id": last event id, "added": [notifications],
+    "removed": [product ids]}. Only the last event per product counts, so
+    an add undone within the same run is sent as a single remove.
+    """
+    latest = {}
+    for event in events:
+        if "add" in event:
+            latest[event["add"]["product_id"]] = event["add"]
+        elif "remove" in event:
+            latest[event["remove"]] = None
+    return {
+        "type": "diff",
+        "prev": prev,
+        "id": events[-1]["id"],
+        "added": [n for n in latest.values() if n is not None],
+        "removed": [product_id for product_id, n in latest.items() if n is None],
+    }
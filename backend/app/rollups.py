@@ -0,0 +1,146 @@
+"""Daily analytics rollups, maintained incrementally on every dispense"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, DateTime, cast, delete, distinct, func, select, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.database import is_postgres
+from app.models import DailyProductSales, DailyUserActivity, Dispense, DispenseItem
+
+
+ROLLUP_COLUMNS = ["qty", "revenue", "dispense_count"]
+
+
+def day_of(db: Session, column):
+    """The calendar day of a DateTime column, comparable with a Date on both backends."""
+    if is_postgres(db):
+        return cast(column, Date)
+    # SQLite keeps dates as 'YYYY-MM-DD' text, which is what date() returns
+    return func.date(column)
+
+
+# SQLite date() modifiers equivalent to Postgres date_trunc (weeks start on Monday)
+SQLITE_BUCKETS = {
+    "day": (),
+    "week": ("weekday 0", "-6 days"),
+    "month": ("start of month",),
+}
+
+
+def bucket_of(db: Session, column, interval: str):
+    """First day of the day/week/month containing column, as a Date."""
+    if is_postgres(db):
+        return cast(func.date_trunc(interval, cast(column, DateTime)), Date)
+    return func.date(column, *SQLITE_BUCKETS[interval])
+
+
+def _product_sales(db: Session, *where):
+    day = day_of(db, Dispense.created_at)
+    return (
+        select(
+            day,
+            DispenseItem.product_id,
+            func.sum(DispenseItem.qty),
+            func.coalesce(func.sum(DispenseItem.qty * DispenseItem.price_at_dispense), 0.0),
+            func.count(distinct(DispenseItem.dispense_id)),
+        )
+        .join_from(DispenseItem, Dispense, DispenseItem.dispense_id == Dispense.id)
+        .where(*where)
+        .group_by(day, DispenseItem.product_id)
+    )
+
+
+def _user_activity(db: Session, *where):
+    day = day_of(db, Dispense.created_at)
+    return (
+        select(
+            day,
+            Dispense.user_id,
+            func.sum(DispenseItem.qty),
+            func.coalesce(func.sum(DispenseItem.qty * DispenseItem.price_at_dispense), 0.0),
+            func.count(distinct(Dispense.id)),
+        )
+        .join_from(DispenseItem, Dispense, DispenseItem.dispense_id == Dispense.id)
+        .where(Dispense.user_id.isnot(None), *where)
+        .group_by(day, Dispense.user_id)
+    )
+
+
+def _upsert(db: Session, model, key: str, rows):
+    """INSERT ... SELECT rows into a rollup, adding onto any existing (day, key) row."""
+    insert = pg_insert if is_postgres(db) else sqlite_insert
+    # SQLite can't tell a join's ON from ON CONFLICT without a WHERE clause
+    stmt = insert(model).from_select(["day", key, *ROLLUP_COLUMNS], rows.where(true()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", key],
+        set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in ROLLUP_COLUMNS},
+    )
+    db.execute(stmt)
+
+
+def record_dispense(db: Session, dispense_id: int):
+    """
+    Add one dispense to the rollups. Runs inside the dispense transaction
+    (before commit) so the rollups never drift from dispense_item.
+    """
+    _upsert(db, DailyProductSales, "product_id", _product_sales(db, Dispense.id == dispense_id))
+    _upsert(db, DailyUserActivity, "user_id", _user_activity(db, Dispense.id == dispense_id))
+
+
+def day_filters(model, first: date | None, last: date | None) -> list:
+    """WHERE clauses selecting rollup rows for the days first..last (inclusive)."""
+    where = []
+    if first:
+        where.append(model.day >= first)
+    if last:
+        where.append(model.day <= last)
+    return where
+
+
+def backfill(db: Session, start: date | None = None, end: date | None = None):
+    """
+    Rebuild the rollups for the days start..end (inclusive, open when None)
+    from the raw dispense rows. Commits.
+    """
+    raw = []
+    if start:
+        raw.append(Dispense.created_at >= datetime.combine(start, datetime.min.time()))
+    if end:
+        raw.append(Dispense.created_at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+
+    db.execute(delete(DailyProductSales).where(*day_filters(DailyProductSales, start, end)))
+    db.execute(delete(DailyUserActivity).where(*day_filters(DailyUserActivity, start, end)))
+    _upsert(db, DailyProductSales, "product_id", _product_sales(db, *raw))
+    _upsert(db, DailyUserActivity, "user_id", _user_activity(db, *raw))
+    db.commit()
+
+
+def plan(start: datetime | None, end: datetime | None):
+    """
+    Split the created_at range [start, end] into whole days the rollups can
+    answer and the partial days at its edges that still need raw rows.
+
+    Returns (days, raw): days is (first, last) inclusive with None for an
+    open side, or None when no whole day is covered; raw is a list of
+    (lo, hi) created_at windows, lo inclusive and hi exclusive.
+    """
+    first = last = None
+    head = tail = None
+    hi = end + timedelta(microseconds=1) if end else None
+
+    if start:
+        first = start.date()
+        if start.time() != datetime.min.time():
+            first += timedelta(days=1)
+            head = (start, datetime.combine(first, datetime.min.time()))
+    if hi:
+        last = hi.date() - timedelta(days=1)
+        if hi.time() != datetime.min.time():
+            tail = (datetime.combine(hi.date(), datetime.min.time()), hi)
+
+    if first and last and first > last:
+        return None, [(start, hi)]
+    return (first, last), [w for w in (head, tail) if w]
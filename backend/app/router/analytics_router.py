@@ -1,15 +1,18 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List
+from datetime import date, datetime
+from typing import List, Literal
 
 from app.database import get_db
+from app.redis.cache_utils import cache
 from app.schemas import BaseModel
 from app.analytics_crud import (
     get_most_purchased_products,
     get_most_active_users,
     get_revenue_stats,
+    get_timeseries,
 )
+from app.valuation import get_valuation
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
@@ -33,29 +36,106 @@ class RevenueStats(BaseModel):
     total_items: int
 
 
+class ValuationTotals(BaseModel):
+    product_count: int
+    total_stock: int
+    total_value: float
+
+
+class FormulationValuation(ValuationTotals):
+    formulation_type_id: int
+    formulation_type: str
+
+
+class NhiaValuation(BaseModel):
+    covered: ValuationTotals
+    uncovered: ValuationTotals
+
+
+class InventoryValuation(ValuationTotals):
+    by_formulation_type: List[FormulationValuation]
+    by_nhia_cover: NhiaValuation
+
+
+class TimeseriesPoint(BaseModel):
+    period: date
+    qty: int
+    revenue: float
+    qty_ma: float | None = None
+    revenue_ma: float | None = None
+
+
+class ProductPoint(BaseModel):
+    period: date
+    qty: int
+    qty_ma: float | None = None
+
+
+class ProductSeries(ProductStats):
+    series: List[ProductPoint]
+
+
+class Timeseries(BaseModel):
+    interval: str
+    series: List[TimeseriesPoint]
+    top_products: List[ProductSeries]
+
+
 # --- Routes using the CRUD functions ---
 @router.get("/most-purchased-products/", response_model=List[ProductStats])
+@cache(ttl=300, stale_ttl=600, tags=("analytics",))
 def most_purchased_products(
     db: Session = Depends(get_db),
     start_date: datetime = Query(None),
-    end_date: datetime = Query(None)
+    end_date: datetime = Query(None),
+    limit: int = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    top_n: int = Query(None, ge=1, le=100, description="Shorthand for limit=top_n&offset=0"),
 ):
-    return get_most_purchased_products(db, start_date, end_date)
+    if top_n:
+        limit, offset = top_n, 0
+    return get_most_purchased_products(db, start_date, end_date, limit, offset)
 
 
 @router.get("/most-active-users/", response_model=List[UserStats])
+@cache(ttl=300, stale_ttl=600, tags=("analytics",))
 def most_active_users(
     db: Session = Depends(get_db),
     start_date: datetime = Query(None),
-    end_date: datetime = Query(None)
+    end_date: datetime = Query(None),
+    limit: int = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    top_n: int = Query(None, ge=1, le=100, description="Shorthand for limit=top_n&offset=0"),
 ):
-    return get_most_active_users(db, start_date, end_date)
+    if top_n:
+        limit, offset = top_n, 0
+    return get_most_active_users(db, start_date, end_date, limit, offset)
 
 
 @router.get("/revenue-stats/", response_model=RevenueStats)
+@cache(ttl=300, stale_ttl=600, tags=("analytics",))
 def revenue_stats(
     db: Session = Depends(get_db),
     start_date: datetime = Query(None),
     end_date: datetime = Query(None)
 ):
     return get_revenue_stats(db, start_date, end_date)
+
+
+@router.get("/timeseries/", response_model=Timeseries)
+@cache(ttl=300, stale_ttl=600, tags=("analytics",))
+def timeseries(
+    db: Session = Depends(get_db),
+    interval: Literal["day", "week", "month"] = Query("day"),
+    start_date: datetime = Query(None),
+    end_date: datetime = Query(None),
+    fill_gaps: bool = Query(True),
+    moving_average: int = Query(None, ge=2, le=90),
+    top_n: int = Query(0, ge=0, le=20),
+):
+    return get_timeseries(db, interval, start_date, end_date, fill_gaps, moving_average, top_n)
+
+
+@router.get("/inventory-valuation/", response_model=InventoryValuation)
+def inventory_valuation(db: Session = Depends(get_db)):
+    return get_valuation(db)
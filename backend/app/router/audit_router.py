@@ -1,16 +1,22 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app import schemas, models
-from app.database import get_db
-from app.operations import get_audit_logs
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import async_crud, schemas, models
+from app.database import get_async_db
 from app.security import get_current_user
+from app.redis.cache_utils import cache
 
 router = APIRouter(prefix="/audit", tags=["Audit Logs"])
 
 
 # Audit router for audit endpoint 
-@router.get("/", response_model=list[schemas.AuditLogBase], dependencies=[Depends(get_current_user)])
-async def read_audit_logs(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+@router.get("/", response_model=list[schemas.AuditLogBase])
+@cache(ttl=60, tags=("audit",))
+async def read_audit_logs(
+    skip: int = 0,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserResponse = Depends(get_current_user),
+):
     """Retrieve system audit logs (admin actions)."""
-    logs = get_audit_logs(db, skip=skip, limit=limit)
-    return logs
+    logs = await async_crud.get_audit_logs(db, skip=skip, limit=limit)
+    return [schemas.AuditLogBase.model_validate(log) for log in logs]
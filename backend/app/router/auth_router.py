@@ -12,6 +12,7 @@ from jose import jwt
 from app.database import get_db
 from app import crud, schemas, security, utils, models, email
 from app.email import send_verification_email, send_password_reset_email
+from app.user_cache import user_cache
 import requests as http
 
 load_dotenv()
@@ -51,6 +52,7 @@ def verify_email(data: schemas.VerifyEmail, db: Session = Depends(get_db)):
     user.is_active = True
     user.verification_code = None
     db.commit()
+    user_cache.invalidate(user.username)
 
 
 @router.post(
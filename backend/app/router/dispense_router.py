@@ -1,22 +1,30 @@
-import asyncio
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session, joinedload
-from datetime import datetime, timedelta
-from typing import List
-from app import operations, schemas, models
-from app.database import get_db
+import csv
+import io
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Literal
+from app import async_crud, schemas
+from app.database import get_db, get_async_db, get_session_factory
 from app.security import get_current_user, get_current_admin
 from app.utils import to_dispense_response
-from app.crud import get_dispense_history_per_user
+from app.crud import (
+    query_dispense_history,
+    encode_dispense_cursor,
+    iter_dispense_export_rows,
+)
 
 router = APIRouter(prefix="/dispense", tags=["Dispense"])
 
 
 @router.post("/", response_model=schemas.DispenseResponse)
-async def create_dispense(dispense_in: schemas.DispenseCreate, db: Session = Depends(get_db),
-                    current_user: models.User = Depends(get_current_user)):
+async def create_dispense(dispense_in: schemas.DispenseCreate, db: AsyncSession = Depends(get_async_db),
+                    current_user: schemas.UserResponse = Depends(get_current_user)):
     try:
-        disp = await operations.dispense_products(db, current_user, dispense_in)
+        disp = await async_crud.dispense_products(db, current_user, dispense_in)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -26,15 +34,18 @@ async def create_dispense(dispense_in: schemas.DispenseCreate, db: Session = Dep
 
 @router.get("/my-history", response_model=list[schemas.DispenseResponse])
 def get_my_dispense_history(
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.UserResponse = Depends(get_current_user),
+    limit: int | None = Query(None, ge=1, le=500, description="Page size; omit to return the full history"),
+    cursor: str | None = Query(None, description="X-Next-Cursor value from the previous page"),
 ):
-    dispenses = (
-        db.query(models.Dispense)
-        .filter(models.Dispense.user_id == current_user.id)
-        .order_by(models.Dispense.created_at.desc())
-        .all()
-    )
+    """
+    Dispense history of the logged-in user, newest first.
+    When `limit` is set, the next page's cursor is returned in the X-Next-Cursor header.
+    """
+    query = query_dispense_history(db, user_id=current_user.id, cursor=cursor)
+    dispenses = _page(query, limit, response)
 
     # map to serialized dicts
     return [to_dispense_response(d) for d in dispenses]
@@ -42,29 +53,102 @@ def get_my_dispense_history(
 
 @router.get("/all", response_model=List[schemas.DispenseResponse])
 def get_all_dispenses(
+    response: Response,
     db: Session = Depends(get_db),
-    current_admin: models.User = Depends(get_current_admin),
+    current_admin: schemas.UserResponse = Depends(get_current_admin),
     start_date: datetime | None = Query(None, description="Start date filter (YYYY-MM-DD)"),
-    end_date: datetime | None = Query(None, description="End date filter (YYYY-MM-DD)")
+    end_date: datetime | None = Query(None, description="End date filter (YYYY-MM-DD)"),
+    limit: int | None = Query(None, ge=1, le=1000, description="Page size; omit to return the whole range"),
+    cursor: str | None = Query(None, description="X-Next-Cursor value from the previous page"),
 ):
     """
     Retrieve all dispenses with items and user info.
     Admin-only access.
-    Optional date range filtering.
+    Optional date range filtering and keyset pagination.
     """
-    query = db.query(models.Dispense).options(joinedload(models.Dispense.user)).order_by(models.Dispense.created_at.desc())
-    if start_date:
-        query = query.filter(models.Dispense.created_at >= start_date)
-    if end_date:
-        if end_date.time() == datetime.min.time():
-            end_date = end_date + timedelta(days=1) - timedelta(microseconds=1)
-        query = query.filter(models.Dispense.created_at <= end_date)
-
-    dispenses = query.all()
+    query = query_dispense_history(db, start_date=start_date, end_date=end_date, cursor=cursor)
+    dispenses = _page(query, limit, response)
     return [to_dispense_response(d) for d in dispenses]
 
 
 
+@router.get("/all/export", dependencies=[Depends(get_current_admin)])
+def export_all_dispenses(
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="ndjson: one dispense per line, csv: one item per row"),
+    start_date: datetime | None = Query(None, description="Start date filter (YYYY-MM-DD)"),
+    end_date: datetime | None = Query(None, description="End date filter (YYYY-MM-DD)"),
+    session_factory=Depends(get_session_factory),
+):
+    """
+    Stream every dispense in the range for reconciliation.
+    Admin-only access. Rows are read through a server-side cursor and written
+    out as they arrive, so memory stays flat however wide the range is.
+    """
+    if format == "csv":
+        return StreamingResponse(
+            _export_csv(session_factory, start_date, end_date),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="dispenses.csv"'},
+        )
+    return StreamingResponse(
+        _export_ndjson(session_factory, start_date, end_date), media_type="application/x-ndjson"
+    )
+
+
+EXPORT_COLUMNS = [
+    "dispense_id", "created_at", "user_id", "username", "item_id",
+    "product_id", "drug", "brand", "qty", "price_at_dispense",
+]
+
+
+def _export_csv(session_factory, start_date: datetime | None, end_date: datetime | None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(EXPORT_COLUMNS)
+    yield drain()
+
+    # the request's session is closed before streaming starts, use our own
+    with session_factory() as db:
+        for i, row in enumerate(iter_dispense_export_rows(db, start_date, end_date), 1):
+            writer.writerow(row)
+            if i % 500 == 0:
+                yield drain()
+    yield drain()
+
+
+def _export_ndjson(session_factory, start_date: datetime | None, end_date: datetime | None):
+    current = None
+    with session_factory() as db:
+        for row in iter_dispense_export_rows(db, start_date, end_date):
+            # rows arrive grouped by dispense, emit one when the next starts
+            if current is None or current["id"] != row.dispense_id:
+                if current is not None:
+                    yield json.dumps(current) + "\n"
+                current = {
+                    "id": row.dispense_id,
+                    "created_at": row.created_at.isoformat(),
+                    "user_id": row.user_id,
+                    "user": {"id": row.user_id, "username": row.username} if row.username else None,
+                    "items": [],
+                }
+            if row.item_id is not None:
+                current["items"].append({
+                    "id": row.item_id,
+                    "qty": row.qty,
+                    "price_at_dispense": row.price_at_dispense,
+                    "product": {"id": row.product_id, "drug": row.drug, "brand": row.brand},
+                })
+    if current is not None:
+        yield json.dumps(current) + "\n"
+
+
 @router.get(
     "/dispense-history/{user_id}",
     response_model=dict,
@@ -75,6 +159,7 @@ def get_user_dispense_history(
     page: int = Query(1, ge=1, description="Page number (1-indexed)"),
     limit: int = Query(5, ge=1, le=100, description="Items per page"),
     paginate: bool = Query(True, descrition="If false return ALL matching dispenses (no server-side pagination)"),
+    cursor: str | None = Query(None, description="next_cursor from the previous page; replaces `page` when given"),
     db: Session = Depends(get_db),
     start_date: datetime | None = Query(None, description="Filter dispenses created on/after this date (YYYY-MM-DD or ISO)"),
     end_date: datetime | None = Query(None, description="Filter dispenses created on/before this date (YYYY-MM-DD or ISO)")
@@ -82,38 +167,31 @@ def get_user_dispense_history(
     """
     Get paginated dispense history for a specific user (admin view).
     Supports optional start_date / end_date filters and returns:
-    { total, page, limit, results }
+    { total, page, limit, results, next_cursor }
     where results is a list of serialized dispense dicts.
     """
     # Build base query (use SQL filtering to avoid post-serialization date parsing)
-    query = db.query(models.Dispense).filter(models.Dispense.user_id == user_id)
-
-    # Apply date filters at DB level if provided
-    if start_date:
-        query = query.filter(models.Dispense.created_at >= start_date)
-    if end_date:
-        # include the whole end_date day if only date provided by user — but user may pass full datetime
-        if end_date.time() == datetime.min.time():
-            end_date = end_date + timedelta(days=1) - timedelta(microseconds=1)
-        query = query.filter(models.Dispense.created_at <= end_date)
-
+    query = query_dispense_history(db, user_id=user_id, start_date=start_date, end_date=end_date)
 
     # If client requests all results (no pagination), return the fll list
     if not paginate:
-        dispenses_objs = query.order_by(models.Dispense.created_at.desc()).all()
-        results = [to_dispense_response(d) for d in dispenses_objs]
+        results = [to_dispense_response(d) for d in query.all()]
         total = len(results)
         return {"total": total, "page": 1, "limit": total or 0, "results": results}
 
-    total = query.count()
+    # total ignores the cursor so it stays the size of the whole filtered history
+    total = query.order_by(None).count()
 
-    offset = (page - 1) * limit
-    dispenses_objs = (
-        query.order_by(models.Dispense.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+    if cursor:
+        query = query_dispense_history(
+            db, user_id=user_id, start_date=start_date, end_date=end_date, cursor=cursor
+        )
+    else:
+        query = query.offset((page - 1) * limit)
+
+    dispenses_objs = query.limit(limit + 1).all()
+    has_more = len(dispenses_objs) > limit
+    dispenses_objs = dispenses_objs[:limit]
 
     # Serialize each Dispense using your existing helper
     results = [to_dispense_response(d) for d in dispenses_objs]
@@ -123,4 +201,20 @@ def get_user_dispense_history(
         "page": page,
         "limit": limit,
         "results": results,
-    }
\ No newline at end of file
+        "next_cursor": encode_dispense_cursor(dispenses_objs[-1]) if has_more else None,
+    }
+
+
+def _page(query, limit: int | None, response: Response):
+    """
+    Apply a keyset page to a dispense history query and expose the cursor
+    for the following page in the X-Next-Cursor header.
+    """
+    if limit is None:
+        return query.all()
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_dispense_cursor(rows[-1])
+    return rows
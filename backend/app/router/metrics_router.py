@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends
+
+from app.operations import dispense_lock_stats
+from app.pool_metrics import POOL_METRICS
+from app.redis.cache_utils import cache_stats
+from app.router.notifications_router import manager
+from app.security import get_current_admin
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"], dependencies=[Depends(get_current_admin)])
+
+
+@router.get("/db-pool")
+def db_pool_metrics():
+    """
+    Live connection pool statistics for this worker: size, checked-out and
+    overflow connections, failed checkouts, and histograms of checkout wait time
+    and pre-ping cost for the sync and async engines.
+    """
+    return {name: metrics.snapshot() for name, metrics in POOL_METRICS.items()}
+
+
+@router.get("/dispense-locks")
+def dispense_lock_metrics():
+    """How long dispenses held product row locks (UPDATE to COMMIT)."""
+    stats = dict(dispense_lock_stats)
+    stats["avg_ms"] = stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+    return stats
+
+
+@router.get("/cache")
+def response_cache_metrics():
+    """Response cache hits, misses and Redis errors per endpoint for this worker."""
+    return cache_stats
+
+
+@router.get("/websockets")
+def websocket_metrics():
+    """Notification websocket clients, queued messages and slow-consumer drops/disconnects."""
+    return manager.snapshot()
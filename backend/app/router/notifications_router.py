@@ -1,67 +1,152 @@
-import json
 import asyncio
-from fastapi import APIRouter,  WebSocket, Depends
+from fastapi import APIRouter,  WebSocket, Depends, Response
 from typing import List
 from sqlalchemy.orm import Session
 from app import schemas, models
-from app.database import get_db
+from app.database import get_db, SessionLocal
+from app.notification_set import ActiveNotifications
 
-from app.redis.dependencies import redis
+from app.redis import notification_stream
+from app.redis.notification_stream import LOW_STOCK_STREAM, LOW_STOCK_COALESCE_MS, READ_BLOCK_MS, coalesce
+from app.redis.redis_client import redis_client
+from app.redis.cache_utils import cache
+from app.ws_manager import Client, ConnectionManager
 
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
-# Tracking connected clients 
-active_connections: List[WebSocket] = []
+# Tracking connected clients
+manager = ConnectionManager()
 
 async def broadcast_message(message: dict):
     """
-    Send a message to all connected websocket clients.
+    Send a message to all connected websocket clients. Only queues it, so
+    a slow client never holds up the others or the Redis listener.
     """
-    disconnected = []
-    for connection in active_connections:
-        try:
-            await connection.send_json(message)
-        except Exception:
-            disconnected.append(connection)
+    manager.broadcast(message)
+
+# Active notifications as of the last diff this worker's listener broadcast
+active = ActiveNotifications()
+
+# Pause before the listener retries after a Redis or database error
+LISTENER_RETRY_SECONDS = 2
+
+
+def _load_active(version: str):
+    with SessionLocal() as db:
+        active.load(db, version)
 
-    # Clean up any disconnected sockets
-    for conn in disconnected:
-        active_connections.remove(conn)
 
 async def redis_listener():
+    """
+    Tail the low-stock stream and broadcast what it reads, coalesced into
+    one diff per LOW_STOCK_COALESCE_MS window, applying each diff to the
+    in-memory `active` set first. Every worker reads the whole stream for
+    its own sockets, and keeps its position across Redis errors, so
+    nothing published while it reconnects is lost.
+    """
+    loop = asyncio.get_running_loop()
+    window = LOW_STOCK_COALESCE_MS / 1000
+    read_id = None
+    pending, flush_at = [], None
+
     while True:
         try:
-            pubsub = redis.pubsub()
-            await pubsub.subscribe("low_stock_channel")
-            print("Redis listener connected and subscribed.")
+            if read_id is None:
+                # position first, then the rows: events in between get re-applied
+                version = await notification_stream.latest_id()
+                await asyncio.to_thread(_load_active, version)
+                read_id = version
+                print(f"Redis listener reading {LOW_STOCK_STREAM} after {read_id}, {len(active.by_product)} active")
 
-            async for message in pubsub.listen():
-                if message["type"] != "message":
-                    continue
+            # block only until the open window is due (0 would block forever)
+            block_ms = READ_BLOCK_MS if flush_at is None else max(1, int((flush_at - loop.time()) * 1000))
+            events = await notification_stream.read(read_id, block_ms)
+            if events:
+                read_id = events[-1]["id"]
+                pending.extend(events)
+                if flush_at is None:
+                    flush_at = loop.time() + window
 
-                data = json.loads(message["data"])
-                await broadcast_message(data)
+            if pending and loop.time() >= flush_at:
+                diff = coalesce(pending, active.version)
+                active.apply(diff)
+                await broadcast_message(diff)
+                pending, flush_at = [], None
 
         except Exception as e:
             print("Redis listener error:", e)
-            print("Retrying in 2 seconds...")
-            await asyncio.sleep(2)
+            print(f"Retrying in {LISTENER_RETRY_SECONDS} seconds...")
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+
+
+async def resume(client: Client, last_event_id: str | None):
+    """
+    Bring a connecting client up to date, then join it to live broadcasts:
+    with the diffs since last_event_id when the stream still has them,
+    else with a snapshot of `active`. Joining right after the client's
+    position meets active.version (no await in between) leaves no gap and
+    no overlap with the live diffs.
+    """
+    cursor = last_event_id
+    while cursor and active.ready and cursor != active.version:
+        upto = active.version
+        events = await notification_stream.replay(cursor, upto)
+        if events is None:
+            break
+        if events:
+            manager.send(client, coalesce(events, cursor))
+        cursor = upto
+
+    if active.ready and cursor != active.version:
+        manager.send(client, active.snapshot())
+    manager.join(client)
 
 
 @router.websocket("/ws/notifications")
-async def low_stock_notifications(websocket: WebSocket):
-    await websocket.accept()
-    active_connections.append(websocket)
+async def low_stock_notifications(websocket: WebSocket, last_event_id: str | None = None):
+    """
+    Sends a snapshot, {"type": "snapshot", "id", "notifications": [...]},
+    then diffs, {"type": "diff", "prev", "id", "added": [...],
+    "removed": [product ids]}. "id" is the stream position a message
+    brings the client to, and a diff applies on top of "prev"; on a
+    mismatch, or after a disconnect, reconnect with ?last_event_id=<id> to
+    get only what was missed.
 
+    Until this worker's listener has loaded, clients are joined without a
+    snapshot and should fall back to /notifications/active.
+    """
+    client = await manager.connect(websocket)
 
     try:
+        await resume(client, last_event_id)
+
         while True:
-            await websocket.receive()
-    except:
-        active_connections.remove(websocket)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except Exception:
+        pass
+    finally:
+        manager.disconnect(client)
 
 
 @router.get("/active", response_model=List[schemas.ActiveNotification])
-def get_active_notifications(db:Session = Depends(get_db)):
-    notifs = db.query(models.LowStockNotification).filter_by(is_active=True).all()
-    return [{"message": n.message} for n in notifs]
\ No newline at end of file
+@cache(ttl=60, tags=("notifications",))
+def get_active_notifications(response: Response, db:Session = Depends(get_db)):
+    """
+    Open notifications. X-Last-Event-Id is the stream position they are
+    current as of: connect the websocket with it as last_event_id to get
+    everything after it.
+    """
+    # read before the query, so a replay from it can only repeat events, never miss one
+    try:
+        latest = redis_client.xrevrange(LOW_STOCK_STREAM, count=1)
+        response.headers["X-Last-Event-Id"] = latest[0][0] if latest else "0-0"
+    except Exception as e:
+        print("Could not read the low-stock stream position:", e)
+    rows = db.query(
+        models.LowStockNotification.id,
+        models.LowStockNotification.product_id,
+        models.LowStockNotification.message,
+    ).filter(models.LowStockNotification.is_active.is_(True))
+    return [{"id": r.id, "product_id": r.product_id, "message": r.message} for r in rows]
\ No newline at end of file
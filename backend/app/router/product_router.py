@@ -1,12 +1,21 @@
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import csv
+import gzip
+import io
+import msgpack
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal
 from app.security import get_current_admin, get_current_user
 
-from app.schemas import ProductBase, ProductCreate, ProductResponse
+from app.schemas import ProductBase, ProductCreate, ProductResponse, UserResponse, BulkImportResult
 from app.crud import (
-    get_all_products, 
+    query_products,
+    sample_products,
+    encode_product_cursor,
+    get_product_changes,
     get_product_by_name_or_id, 
     create_product, 
     update_product, 
@@ -14,29 +23,77 @@ from app.crud import (
 )
 from app.utils import to_product_response
 
-from app import models
+from app import async_crud, models
 
-from app.database import get_db
-from app.operations import ad_search_products, update_product_reorder_level, update_product_stock
+from app.database import get_db, get_async_db
+from app.redis.cache_utils import cache
+from app.etag import conditional
+from app.operations import update_product_reorder_level, update_product_stock
+from app.product_import import bulk_import_products, BULK_IMPORT_MAX_ROWS
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
 
 # ------- PUBLIC ENDPOINTS --------
 
-@router.get("/", response_model=list[ProductResponse], dependencies=[Depends(get_current_user)])
-def read_products(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+@router.get("/", response_model=list[ProductResponse])
+@conditional()
+@cache(ttl=60, tags=("products",))
+def read_products(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None, description="X-Next-Cursor value from the previous page"),
+    order_by: Literal["id", "last_changed_date"] = Query("id", description="id ascending, or most recently changed first"),
+    formulation_type_id: int | None = None,
+    nhia_cover: bool | None = None,
+    low_stock: bool | None = Query(None, description="Only products at or below (true) / above (false) their reorder level"),
+    db: Session = Depends(get_db),
+    current_user: UserResponse = Depends(get_current_user),
+):
     """
     Get a paginated list of all products.
+    Pages are keyset based: pass the X-Next-Cursor header of a page as `cursor`
+    to get the next one (`skip` still works but gets slower the deeper it goes).
     """
-    products = get_all_products(db, skip=skip, limit=limit)
+    query = query_products(
+        db, order_by=order_by, cursor=cursor,
+        formulation_type_id=formulation_type_id, nhia_cover=nhia_cover, low_stock=low_stock,
+    )
+    return [
+        to_product_response(p) for p in _page(query.offset(skip), limit, order_by, response)
+    ]
+
+
+# not cached and no ETag: every call should draw a new sample
+@router.get("/sample", response_model=list[ProductResponse], dependencies=[Depends(get_current_user)])
+def read_product_sample(
+    size: int = Query(10, ge=1, le=100),
+    formulation_type_id: int | None = None,
+    nhia_cover: bool | None = None,
+    low_stock: bool | None = Query(None, description="Only products at or below (true) / above (false) their reorder level"),
+    db: Session = Depends(get_db),
+):
+    """
+    `size` random products matching the filters, without sorting the table.
+    """
+    products = sample_products(
+        db, size, formulation_type_id=formulation_type_id, nhia_cover=nhia_cover, low_stock=low_stock,
+    )
     return [
         to_product_response(p) for p in products
     ]
 
 
 @router.get("/db-search/", response_model=list[ProductResponse], dependencies=[Depends(get_current_user)])
-def search_products(query: str = Query(..., min_length=1), db: Session = Depends(get_db)):
+@conditional()
+def search_products(
+    request: Request,
+    response: Response,
+    query: str = Query(..., min_length=1),
+    db: Session = Depends(get_db),
+):
     """
     Search for products by name.
     """
@@ -49,23 +106,56 @@ def search_products(query: str = Query(..., min_length=1), db: Session = Depends
 
 
 @router.get("/search/", response_model=List[ProductResponse], dependencies=[Depends(get_current_user)])
+@conditional()
 async def advanced_search_products(
+    request: Request,
+    response: Response,
     query: str = Query(..., description="Search text for drug name, brand, strength, or unit."),
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
      Advanced search for products by multiple tokens.
     Example: `paracetamol 500mg fidson` → filters by all terms.
     """
 
-    results = await ad_search_products(db=db, query=query, skip=skip, limit=limit)
+    results = await async_crud.ad_search_products(db=db, query=query, skip=skip, limit=limit)
     if not results:
         raise HTTPException(status_code=404, detail="No matching products found.")
     return [to_product_response(p) for p in results]
 
 
+@router.get("/changes", dependencies=[Depends(get_current_user)])
+def product_changes(
+    request: Request,
+    since: str | None = Query(None, description="`cursor` from the previous call; omit for a full sync"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    """
+    Delta sync for terminals keeping a local catalog copy: products created
+    or updated and ids deleted since the cursor. Keep calling with the
+    returned `cursor` while `has_more` is true.
+
+    Sent as msgpack when the client accepts `application/msgpack`, and
+    gzipped when it accepts gzip.
+    """
+    payload = get_product_changes(db, cursor=since, limit=limit)
+
+    if "application/msgpack" in request.headers.get("accept", ""):
+        body, media_type = msgpack.packb(payload), "application/msgpack"
+    else:
+        body, media_type = orjson.dumps(payload), "application/json"
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", "") and len(body) > 512:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
 # ----- ADMIN ENDPOINTS --------
 
 @router.post("/create-products/", response_model=ProductResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_admin)])
@@ -78,6 +168,39 @@ def create_product_route(product: ProductCreate, db: Session = Depends(get_db)):
 
 
 
+@router.post("/bulk", response_model=BulkImportResult, dependencies=[Depends(get_current_admin)])
+async def bulk_import_route(request: Request, db: Session = Depends(get_db)):
+    """
+    Create or update many products at once, e.g. from a supplier price list.
+    Send a JSON array of create-product objects, or a CSV body (Content-Type:
+    text/csv) with the same field names as headers. A row updates the
+    product with the same drug, brand, formulation type, unit and strength.
+    Invalid rows are skipped and listed in `errors`.
+    """
+    body = await request.body()
+
+    if "csv" in request.headers.get("content-type", ""):
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        # empty cells mean "not given", not an empty string
+        rows = [{k: v for k, v in row.items() if v not in ("", None)} for row in reader]
+    else:
+        try:
+            rows = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or CSV.")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or CSV.")
+
+    if len(rows) > BULK_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {BULK_IMPORT_MAX_ROWS} rows per import.",
+        )
+
+    return await bulk_import_products(db, rows)
+
+
+
 @router.put("/update-products/{product_id}", response_model=ProductResponse, dependencies=[Depends(get_current_admin)])
 def update_product_route(product_id: int, update_data: ProductBase, db: Session = Depends(get_db)):
     """
@@ -106,7 +229,7 @@ def update_reorder_level(
     product_id: int,
     reorder_level: int,
     db: Session = Depends(get_db),
-    current_admin: models.User = Depends(get_current_admin),
+    current_admin: UserResponse = Depends(get_current_admin),
 ):
     updated_product = update_product_reorder_level(db, product_id, reorder_level, current_admin.id)
 
@@ -118,8 +241,19 @@ def update_stock(
     product_id: int,
     qty: int,
     db: Session = Depends(get_db),
-    current_admin: models.User = Depends(get_current_admin),
+    current_admin: UserResponse = Depends(get_current_admin),
 ):
     updated_stock = update_product_stock(db, product_id, qty, current_admin.id)
     return to_product_response(updated_stock)
-    
\ No newline at end of file
+    
+
+def _page(query, limit: int, order_by: str, response: Response):
+    """
+    Apply a keyset page to a product listing query and expose the cursor
+    for the following page in the X-Next-Cursor header.
+    """
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_product_cursor(rows[-1], order_by)
+    return rows
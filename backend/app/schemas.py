@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -60,6 +60,17 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True # allows returning SQLALchemy models directly
 
+
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    created: int
+    updated: int
+    errors: List[BulkImportError]
+
 # Users 
 
 class UserBase(BaseModel):
@@ -121,7 +132,8 @@ class DispenseItemCreate(BaseModel):
 
 
 class DispenseCreate(BaseModel):
-    items: List[DispenseItemCreate]
+    # an empty dispense has nothing to decrement (and no valid UPDATE to build)
+    items: List[DispenseItemCreate] = Field(min_length=1)
 
 
 class DispenseProduct(BaseModel):
@@ -215,6 +227,8 @@ class LowStockNotificationResponse(LowStockNotificationBase):
 
 
 class ActiveNotification(BaseModel):
+    id: int
+    product_id: int
     message: str
 
     
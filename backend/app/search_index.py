@@ -0,0 +1,244 @@
+"""In-memory product search index"""
+
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import or_, select, union
+from sqlalchemy.orm import Session
+
+from app import models
+from app.etag import shard_versions, stamped_between
+
+
+# How /products/search/ matches products:
+#   "index"   - in-memory n-gram index (default)
+#   "trigram" - SQL ILIKE served by pg_trgm GIN indexes, ranked by similarity
+#   "ilike"   - plain SQL ILIKE, the only SQL mode SQLite supports
+PRODUCT_SEARCH_MODE = os.getenv("PRODUCT_SEARCH_MODE", "index")
+
+# Columns the SQL search modes match a token against
+SEARCH_FIELDS = ("drug", "brand", "strength", "unit")
+
+
+def product_ids_like(pattern: str, fields=SEARCH_FIELDS):
+    """
+    Ids of products whose drug, brand, strength or unit ILIKE pattern, as a
+    UNION with one arm per table. Each ILIKE then runs against its own
+    table, where its pg_trgm index applies (an OR across joined tables
+    leaves the planner no choice but a scan), and the arms reach product
+    through the btree indexes on its foreign keys.
+    """
+    Product = models.Product
+    arms = []
+    if "drug" in fields:
+        drugs = select(models.Drug.id).where(models.Drug.name.ilike(pattern))
+        arms.append(select(Product.id).where(Product.drug_id.in_(drugs)))
+    if "brand" in fields:
+        brands = select(models.Brand.id).where(models.Brand.name.ilike(pattern))
+        arms.append(select(Product.id).where(Product.brand_id.in_(brands)))
+    if "strength" in fields:
+        arms.append(select(Product.id).where(Product.strength.ilike(pattern)))
+    if "unit" in fields:
+        units = select(models.Unit.id).where(or_(models.Unit.code.ilike(pattern), models.Unit.name.ilike(pattern)))
+        arms.append(select(Product.id).where(Product.unit_id.in_(units)))
+    return union(*arms)
+
+
+# Grams up to this length are indexed, so any token of this length or
+# shorter is answered straight from a posting list.
+MAX_GRAM = 3
+
+
+def _fields(p: models.Product) -> tuple[str, ...]:
+    """
+    Lower-cased searchable text for a product, mirroring the columns
+    the SQL ILIKE search matches on.
+    """
+    return _normalize((
+        p.drug.name if p.drug else None,
+        p.brand.name if p.brand else None,
+        p.strength,
+        p.unit.code if p.unit else None,
+        p.unit.name if p.unit else None,
+    ))
+
+
+def _normalize(values) -> tuple[str, ...]:
+    return tuple(v.lower() for v in values if v)
+
+
+def _grams(text: str) -> set[str]:
+    """Every distinct substring of text up to MAX_GRAM characters long."""
+    return {
+        text[i:i + n]
+        for n in range(1, MAX_GRAM + 1)
+        for i in range(len(text) - n + 1)
+    }
+
+
+def _text_rows(db: Session, *filters) -> list[tuple]:
+    """(id, drug, brand, strength, unit code, unit name) of matching products."""
+    return (
+        db.query(
+            models.Product.id, models.Drug.name, models.Brand.name,
+            models.Product.strength, models.Unit.code, models.Unit.name,
+        )
+        .join(models.Drug, models.Product.drug_id == models.Drug.id)
+        .outerjoin(models.Brand, models.Product.brand_id == models.Brand.id)
+        .outerjoin(models.Unit, models.Product.unit_id == models.Unit.id)
+        .filter(*filters)
+        .all()
+    )
+
+
+class ProductSearchIndex:
+    """
+    Process-local inverted n-gram index over drug, brand, strength and unit.
+
+    Each gram maps to the set of product ids whose fields contain it.
+    A token matches a product when it is a substring of one of its fields,
+    the same semantics as `ILIKE '%tok%'`.
+
+    Every worker holds its own copy. refresh() catches it up with writes
+    committed through any worker, from the catalog counter stamps (see
+    etag.bump_catalog_version).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: dict[str, set[int]] = defaultdict(set)
+        self._docs: dict[int, tuple[str, ...]] = {}
+        # counter shard versions the index reflects
+        self._versions: dict[int, int] = {}
+        self.ready = False
+
+    def load(self, db: Session):
+        """Build the index from every product in the database."""
+        # versions first: writes committing meanwhile are applied again by refresh
+        versions = shard_versions(db)
+        rows = _text_rows(db)
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            for product_id, *values in rows:
+                self._add(product_id, _normalize(values))
+            self._versions = versions
+            self.ready = True
+
+    def refresh(self, db: Session):
+        """
+        Apply product writes committed since the index was loaded or last
+        refreshed. One small query on the counter when nothing changed.
+        """
+        with self._lock:
+            since = self._versions
+        upto = shard_versions(db)
+        if upto == since:
+            return
+
+        positions = {shard: (version, None) for shard, version in since.items()}
+        Product, Tombstone = models.Product, models.ProductTombstone
+        rows = _text_rows(db, stamped_between(
+            positions, upto, Product.change_shard, Product.change_version, Product.id,
+        ))
+        deleted = db.scalars(
+            select(Tombstone.product_id).where(stamped_between(
+                positions, upto, Tombstone.change_shard, Tombstone.change_version, Tombstone.product_id,
+            ))
+        ).all()
+
+        with self._lock:
+            # another thread got here first, with the same or a newer snapshot
+            if self._versions != since:
+                return
+            for product_id in deleted:
+                self._discard(product_id)
+            for product_id, *values in rows:
+                self._discard(product_id)
+                self._add(product_id, _normalize(values))
+            self._versions = upto
+
+    def _add(self, product_id: int, fields: tuple[str, ...]):
+        self._docs[product_id] = fields
+        for field in fields:
+            for gram in _grams(field):
+                self._postings[gram].add(product_id)
+
+    def _discard(self, product_id: int):
+        fields = self._docs.pop(product_id, None)
+        if not fields:
+            return
+        for field in fields:
+            for gram in _grams(field):
+                ids = self._postings.get(gram)
+                if ids is None:
+                    continue
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def upsert(self, p: models.Product):
+        """Add or re-index a single product after it was created or updated."""
+        fields = _fields(p)
+        with self._lock:
+            self._discard(p.id)
+            self._add(p.id, fields)
+
+    def upsert_many(self, db: Session, product_ids: list[int]):
+        """
+        Re-index many products at once (e.g. after a bulk import), reading
+        just the searchable columns instead of full Product objects.
+        """
+        rows = _text_rows(db, models.Product.id.in_(product_ids))
+        with self._lock:
+            for product_id, *values in rows:
+                self._discard(product_id)
+                self._add(product_id, _normalize(values))
+
+    def remove(self, product_id: int):
+        """Drop a deleted product from the index."""
+        with self._lock:
+            self._discard(product_id)
+
+    def _match(self, token: str) -> set[int]:
+        if len(token) <= MAX_GRAM:
+            return set(self._postings.get(token, ()))
+
+        # intersect the token's trigrams, then confirm the full substring
+        candidates = None
+        for i in range(len(token) - MAX_GRAM + 1):
+            ids = self._postings.get(token[i:i + MAX_GRAM])
+            if not ids:
+                return set()
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return set()
+
+        return {
+            pid for pid in candidates
+            if any(token in field for field in self._docs[pid])
+        }
+
+    def search(self, tokens: list[str], skip: int = 0, limit: int = 100) -> list[int]:
+        """
+        Return product ids matching every token (AND), ordered by id,
+        with the same skip/limit window as the SQL search.
+        """
+        tokens = [t.lower() for t in tokens if t]
+        if not tokens:
+            return []
+
+        with self._lock:
+            # start from the rarest token so intersections stay small
+            matches = sorted((self._match(t) for t in tokens), key=len)
+            result = matches[0]
+            for ids in matches[1:]:
+                if not result:
+                    break
+                result &= ids
+
+        return sorted(result)[skip:skip + limit]
+
+
+product_index = ProductSearchIndex()
@@ -6,7 +6,8 @@ from fastapi import Depends, Request, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app import crud, models
+from app import crud, models, schemas
+from app.user_cache import user_cache
 
 load_dotenv()
 
@@ -54,16 +55,21 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
         raise credentials_exception
     
 
+    # common case: principal cached, no database round trip
+    principal = user_cache.get(username)
+    if principal is not None:
+        return principal
+
     user = crud.get_user_by_username(db, username=username)
     if user is None:
         raise credentials_exception
-    
-    #  Debug who is actually authenticated
-    print("DEBUG - Authenticated user:", user.id, user.username, "is_admin:", user.is_admin)
-    return user
+
+    principal = schemas.UserResponse.model_validate(user, from_attributes=True)
+    user_cache.set(username, principal)
+    return principal
 
 
-def get_current_admin(current_user: models.User = Depends(get_current_user)):
+def get_current_admin(current_user: schemas.UserResponse = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
@@ -84,6 +90,7 @@ def delete_user(db: Session,user_id: int):
     
     db.delete(user)
     db.commit()
+    user_cache.invalidate(user.username)
     return {"message": f"User with id {user_id} deleted successfully"}
 
 
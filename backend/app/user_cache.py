@@ -0,0 +1,88 @@
+"""Short-lived cache of authenticated user principals"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app import schemas
+from app.redis.redis_client import redis_client
+
+
+# Seconds a principal is trusted before it is re-read from the database.
+# Other workers only see an invalidation through Redis, so keep this short.
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_REDIS = os.getenv("USER_CACHE_REDIS", "false").lower() == "true"
+
+
+class UserPrincipalCache:
+    """
+    In-process LRU of UserResponse principals keyed by token subject
+    (username), optionally backed by Redis so workers share lookups.
+    """
+
+    def __init__(self, ttl: int = USER_CACHE_TTL, maxsize: int = USER_CACHE_SIZE, use_redis: bool = USER_CACHE_REDIS):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.use_redis = use_redis
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, schemas.UserResponse]] = OrderedDict()
+
+    @staticmethod
+    def _redis_key(username: str) -> str:
+        return f"user:principal:{username}"
+
+    def get(self, username: str) -> schemas.UserResponse | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                expires_at, principal = entry
+                if expires_at > now:
+                    self._entries.move_to_end(username)
+                    return principal
+                del self._entries[username]
+
+        if not self.use_redis:
+            return None
+        try:
+            cached = redis_client.get(self._redis_key(username))
+        except Exception:
+            return None
+        if not cached:
+            return None
+
+        principal = schemas.UserResponse.model_validate_json(cached)
+        self._store(username, principal)
+        return principal
+
+    def _store(self, username: str, principal: schemas.UserResponse):
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set(self, username: str, principal: schemas.UserResponse):
+        self._store(username, principal)
+        if self.use_redis:
+            try:
+                redis_client.setex(self._redis_key(username), self.ttl, principal.model_dump_json())
+            except Exception:
+                pass
+
+    def invalidate(self, *usernames: str | None):
+        """Forget cached principals, e.g. after the user row changed."""
+        usernames = [u for u in usernames if u]
+        with self._lock:
+            for username in usernames:
+                self._entries.pop(username, None)
+        if self.use_redis and usernames:
+            try:
+                redis_client.delete(*(self._redis_key(u) for u in usernames))
+            except Exception:
+                pass
+
+
+user_cache = UserPrincipalCache()
@@ -0,0 +1,122 @@
+"""Inventory valuation summary, maintained incrementally with product stock"""
+
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.database import is_postgres
+from app.models import FormulationType, InventoryValuation, Product
+
+
+VALUATION_COLUMNS = ["product_count", "total_stock", "total_value"]
+
+
+def contribution(p: Product, sign: int = 1) -> tuple:
+    """
+    What one product adds to the summary: (formulation_type_id, nhia_cover,
+    count, stock, value). sign=-1 takes it back out, e.g. before an update.
+    """
+    stock = p.stock or 0
+    return (p.formulation_type_id, bool(p.nhia_cover), sign, sign * stock, sign * stock * (p.price or 0.0))
+
+
+def stock_change(p: Product, qty: int, price: float | None) -> tuple:
+    """A product's stock moving by qty at price, e.g. -qty for a dispense."""
+    return (p.formulation_type_id, bool(p.nhia_cover), 0, qty, qty * (price or 0.0))
+
+
+def apply_deltas(db: Session, deltas):
+    """
+    Add deltas (see contribution) onto the summary rows with a single
+    upsert. Does not commit, so it lands in the caller's transaction.
+    Rows are written in key order, so concurrent writers lock the summary
+    rows in the same order. Call it after locking the product rows.
+    """
+    grouped = defaultdict(lambda: [0, 0, 0.0])
+    for formulation_type_id, nhia_cover, count, stock, value in deltas:
+        g = grouped[(formulation_type_id, nhia_cover)]
+        g[0] += count
+        g[1] += stock
+        g[2] += value
+
+    rows = [
+        {
+            "formulation_type_id": formulation_type_id,
+            "nhia_cover": nhia_cover,
+            "product_count": count,
+            "total_stock": stock,
+            "total_value": value,
+        }
+        for (formulation_type_id, nhia_cover), (count, stock, value) in sorted(grouped.items())
+        if count or stock or value
+    ]
+    if not rows:
+        return
+
+    stmt = (pg_insert if is_postgres(db) else sqlite_insert)(InventoryValuation)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["formulation_type_id", "nhia_cover"],
+        set_={c: getattr(InventoryValuation, c) + getattr(stmt.excluded, c) for c in VALUATION_COLUMNS},
+    )
+    db.execute(stmt, rows)
+
+
+def rebuild(db: Session):
+    """Recompute the summary from the product table. Commits."""
+    stock = func.coalesce(Product.stock, 0)
+    nhia_cover = func.coalesce(Product.nhia_cover, False)
+    db.execute(delete(InventoryValuation))
+    db.execute(
+        insert(InventoryValuation).from_select(
+            ["formulation_type_id", "nhia_cover", *VALUATION_COLUMNS],
+            select(
+                Product.formulation_type_id,
+                nhia_cover,
+                func.count(Product.id),
+                func.sum(stock),
+                func.sum(stock * func.coalesce(Product.price, 0.0)),
+            ).group_by(Product.formulation_type_id, nhia_cover),
+        )
+    )
+    db.commit()
+
+
+def get_valuation(db: Session):
+    """
+    Total inventory value, by formulation type and by NHIA cover. Reads only
+    the summary rows, so the cost does not grow with the catalog.
+    """
+    rows = (
+        db.query(InventoryValuation, FormulationType.name)
+        .join(FormulationType, InventoryValuation.formulation_type_id == FormulationType.id)
+        .all()
+    )
+
+    def bucket():
+        return {"product_count": 0, "total_stock": 0, "total_value": 0.0}
+
+    total = bucket()
+    by_type = defaultdict(bucket)
+    by_nhia = {"covered": bucket(), "uncovered": bucket()}
+
+    for row, type_name in rows:
+        targets = (
+            total,
+            by_type[(row.formulation_type_id, type_name)],
+            by_nhia["covered" if row.nhia_cover else "uncovered"],
+        )
+        for target in targets:
+            for c in VALUATION_COLUMNS:
+                target[c] += getattr(row, c)
+
+    return {
+        **total,
+        "by_formulation_type": [
+            {"formulation_type_id": type_id, "formulation_type": name, **values}
+            for (type_id, name), values in sorted(by_type.items(), key=lambda kv: -kv[1]["total_value"])
+        ],
+        "by_nhia_cover": by_nhia,
+    }
@@ -0,0 +1,129 @@
+"""WebSocket fan-out with a bounded send queue and writer task per client"""
+
+import asyncio
+import os
+
+import orjson
+from fastapi import WebSocket, status
+
+
+# Messages buffered per client before it counts as a slow consumer
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+
+# What to do with a slow consumer whose queue is full:
+#   "drop"       - discard its oldest queued message to make room
+#   "disconnect" - close it (1013 Try Again Later); the client reconnects
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop")
+
+# A single send taking longer than this drops the client
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+
+
+class Client:
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.writer: asyncio.Task | None = None
+
+
+class ConnectionManager:
+    """
+    Tracks connected websockets. broadcast() encodes a message once and
+    only enqueues the shared payload per client, so it never waits on a
+    socket; each client's writer task drains its own queue, so one slow
+    client cannot hold up the others or the caller.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = WS_QUEUE_SIZE,
+        policy: str = WS_SLOW_CONSUMER_POLICY,
+        send_timeout: float = WS_SEND_TIMEOUT_SECONDS,
+    ):
+        if policy not in ("drop", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.clients: dict[WebSocket, Client] = {}
+        self.stats = {"broadcasts": 0, "sent": 0, "dropped": 0, "slow_disconnects": 0, "send_failures": 0}
+        self._closing: set[asyncio.Task] = set()
+
+    async def connect(self, websocket: WebSocket) -> Client:
+        """Accept and start the writer. The client gets broadcasts once join()ed."""
+        await websocket.accept()
+        client = Client(websocket, self.queue_size)
+        client.writer = asyncio.create_task(self._writer(client))
+        return client
+
+    def join(self, client: Client):
+        self.clients[client.websocket] = client
+
+    def disconnect(self, client: Client):
+        self.clients.pop(client.websocket, None)
+        if client.writer:
+            client.writer.cancel()
+
+    async def _writer(self, client: Client):
+        try:
+            while True:
+                payload = await client.queue.get()
+                # asyncio.timeout, unlike wait_for, doesn't spawn a task per send
+                async with asyncio.timeout(self.send_timeout):
+                    await client.websocket.send_text(payload)
+                self.stats["sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # gone or stuck: stop tracking it, its receive loop ends on its own
+            self.stats["send_failures"] += 1
+            self.clients.pop(client.websocket, None)
+            await self._close(client.websocket, status.WS_1011_INTERNAL_ERROR)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            async with asyncio.timeout(self.send_timeout):
+                await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def _slow_consumer(self, client: Client, payload: str):
+        if self.policy == "disconnect":
+            self.stats["slow_disconnects"] += 1
+            self.disconnect(client)
+            task = asyncio.create_task(self._close(client.websocket, status.WS_1013_TRY_AGAIN_LATER))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            return
+
+        client.queue.get_nowait()
+        client.queue.put_nowait(payload)
+        client.dropped += 1
+        self.stats["dropped"] += 1
+
+    def _enqueue(self, client: Client, payload: str):
+        try:
+            client.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self._slow_consumer(client, payload)
+
+    def send(self, client: Client, message: dict):
+        """Queue message for one client, e.g. a replay before it joins."""
+        self._enqueue(client, orjson.dumps(message).decode())
+
+    def broadcast(self, message: dict):
+        """Queue message for every joined client without waiting on any of them."""
+        payload = orjson.dumps(message).decode()
+        self.stats["broadcasts"] += 1
+        for client in list(self.clients.values()):
+            self._enqueue(client, payload)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "clients": len(self.clients),
+            "queued": sum(c.queue.qsize() for c in self.clients.values()),
+            "queue_size": self.queue_size,
+            "policy": self.policy,
+        }
@@ -0,0 +1,28 @@
+import argparse
+from datetime import date
+
+from app.database import SessionLocal
+from app.rollups import backfill
+from app import valuation
+
+
+def rebuild(start: date | None, end: date | None):
+    """Recompute the daily analytics rollups and the inventory valuation summary."""
+    db = SessionLocal()
+    try:
+        print(f"🔁 Rebuilding rollups for {start or 'the beginning'} .. {end or 'today'}")
+        backfill(db, start, end)
+        print("✅ Rollups rebuilt.")
+        valuation.rebuild(db)
+        print("✅ Inventory valuation rebuilt.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill daily analytics rollups")
+    parser.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD), default: all history")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day (YYYY-MM-DD), default: today")
+    args = parser.parse_args()
+
+    rebuild(args.start, args.end)
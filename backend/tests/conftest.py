@@ -0,0 +1,193 @@
+import os
+
+# app.email and app.security read these at import time
+for name, value in {
+    "BREVO_API_KEY": "test",
+    "MAIL_USERNAME": "test",
+    "MAIL_PASSWORD": "test",
+    "MAIL_FROM": "medtrack@example.com",
+    "MAIL_PORT": "587",
+    "MAIL_SERVER": "localhost",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+}.items():
+    os.environ.setdefault(name, value)
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+import redis.asyncio as aioredis
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import BigInteger, create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models, security
+from app.database import Base, get_db, get_session_factory
+from app.redis.dependencies import REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT
+
+
+@compiles(BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    # SQLite only autoincrements an INTEGER PRIMARY KEY
+    return "INTEGER"
+
+
+DRUGS = ["Paracetamol", "Amoxicillin", "Ibuprofen", "Metformin", "Ciprofloxacin"]
+BRANDS = ["Fidson", "Emzor", "GSK"]
+FORMULATION_TYPES = ["Tablet", "Syrup"]
+UNITS = [("mg", "milligram"), ("ml", "millilitre")]
+
+
+def seed(db, n: int = 50):
+    """n products spread over the lookup tables above, plus an admin user."""
+    drugs = [models.Drug(name=name) for name in DRUGS]
+    brands = [models.Brand(name=name) for name in BRANDS]
+    types = [models.FormulationType(name=name) for name in FORMULATION_TYPES]
+    units = [models.Unit(code=code, name=name) for code, name in UNITS]
+    db.add_all(drugs + brands + types + units)
+    db.flush()
+    for i in range(n):
+        db.add(models.Product(
+            drug=drugs[i % len(drugs)],
+            brand=brands[i % len(brands)] if i % 4 else None,
+            formulation_type=types[i % len(types)],
+            unit=units[i % len(units)],
+            strength=f"{(i % 4 + 1) * 250}mg",
+            price=10.0 + i,
+            stock=i % 15,
+            reorder_level=10,
+        ))
+    db.add(models.User(username="alice", email="alice@example.com", hashed_password="x", is_admin=True))
+    db.commit()
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def Session(engine, monkeypatch):
+    """Session factory on the test database, also used by background work."""
+    factory = sessionmaker(bind=engine, autoflush=False)
+    import app.operations
+    import app.redis.cache_utils
+    import app.router.notifications_router
+    for module in (app.operations, app.redis.cache_utils, app.router.notifications_router):
+        monkeypatch.setattr(module, "SessionLocal", factory)
+    return factory
+
+
+@pytest.fixture
+def db(Session):
+    with Session() as session:
+        seed(session)
+        yield session
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """In-memory Redis for every module holding a client; returns (async, sync)."""
+    server = fakeredis.FakeServer()
+    # same pool behaviour as app.redis.dependencies.redis
+    async_client = aioredis.Redis(connection_pool=aioredis.BlockingConnectionPool(
+        connection_class=fakeredis.aioredis.FakeConnection,
+        server=server,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        decode_responses=True,
+    ))
+    sync_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+
+    import app.operations
+    import app.redis.cache_utils
+    import app.redis.dependencies
+    import app.redis.notification_stream
+    import app.redis.redis_client
+    import app.router.notifications_router
+    import app.user_cache
+    for module in (app.redis.dependencies, app.redis.cache_utils, app.redis.notification_stream, app.operations):
+        monkeypatch.setattr(module, "redis", async_client)
+    for module in (
+        app.redis.redis_client, app.redis.dependencies, app.redis.cache_utils,
+        app.redis.notification_stream, app.router.notifications_router, app.user_cache,
+    ):
+        monkeypatch.setattr(module, "redis_client", sync_client)
+    return async_client, sync_client
+
+
+@pytest.fixture
+def make_client(Session, db):
+    """TestClient over the given routers, authenticated as the seeded admin."""
+    def make(*routers):
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+
+        def _db():
+            with Session() as session:
+                yield session
+
+        def _user():
+            with Session() as session:
+                return session.query(models.User).first()
+
+        app.dependency_overrides[get_db] = _db
+        app.dependency_overrides[get_session_factory] = lambda: Session
+        app.dependency_overrides[security.get_current_user] = _user
+        return TestClient(app)
+    return make
+
+
+@pytest.fixture
+def count_statements(engine):
+    """Context manager counting the SQL statements run on the test engine."""
+    class Counter:
+        def __init__(self):
+            self.statements = []
+
+        def __enter__(self):
+            event.listen(engine, "before_cursor_execute", self._record)
+            return self
+
+        def __exit__(self, *exc):
+            event.remove(engine, "before_cursor_execute", self._record)
+
+        def _record(self, conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        @property
+        def count(self):
+            return len(self.statements)
+
+    return Counter
+
+
+@pytest.fixture
+def query_plans(engine):
+    """query_plans(db, fetch): EXPLAIN QUERY PLAN of each statement fetch() runs, one string each."""
+    def explain(db, fetch) -> list[str]:
+        statements = []
+
+        def record(conn, cursor, statement, parameters, *args):
+            statements.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            fetch()
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        conn = db.connection()
+        return [
+            " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+            for statement, parameters in statements
+        ]
+
+    return explain
@@ -0,0 +1,56 @@
+"""Leaderboard range scans must be served by the covering indexes, not table scans."""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, text
+
+from app import analytics_crud, models
+
+DISPENSES = 20_000
+DAYS = 200
+
+
+@pytest.fixture
+def history(db):
+    """DISPENSES dispenses of 1-3 items spread over the past DAYS days, with planner stats."""
+    rng = random.Random(15)
+    users = [db.query(models.User).one().id]
+    for n in range(4):
+        user = models.User(username=f"clerk{n}", email=f"clerk{n}@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        users.append(user.id)
+
+    now = datetime.now()
+    db.execute(insert(models.Dispense), [
+        {"id": i, "user_id": rng.choice(users), "created_at": now - timedelta(seconds=rng.randrange(DAYS * 86400))}
+        for i in range(1, DISPENSES + 1)
+    ])
+    db.execute(insert(models.DispenseItem), [
+        {"dispense_id": i, "product_id": rng.randrange(1, 51), "qty": rng.randrange(1, 5), "price_at_dispense": 10.0}
+        for i in range(1, DISPENSES + 1)
+        for _ in range(rng.randrange(1, 4))
+    ])
+    db.commit()
+    db.execute(text("ANALYZE"))
+    return now
+
+
+@pytest.mark.parametrize("source", ["raw", "rollup"])
+@pytest.mark.parametrize("leaderboard", [
+    analytics_crud.get_most_purchased_products,
+    analytics_crud.get_most_active_users,
+])
+def test_leaderboard_windows_use_covering_indexes(db, history, query_plans, monkeypatch, source, leaderboard):
+    monkeypatch.setattr(analytics_crud, "ANALYTICS_SOURCE", source)
+    # partial days at both ends, so even the rollup plan reads raw rows
+    start, end = history - timedelta(days=3, hours=5), history - timedelta(hours=7)
+
+    (plan,) = query_plans(db, lambda: leaderboard(db, start, end, limit=10))
+
+    assert "USING COVERING INDEX ix_dispense_created_at_user_id (created_at>? AND created_at<?)" in plan
+    assert "USING COVERING INDEX ix_dispense_item_dispense_id_covering (dispense_id=?)" in plan
+    assert "SCAN dispense " not in plan + " "
+    assert "SCAN dispense_item" not in plan
@@ -0,0 +1,96 @@
+"""async_crud on a real AsyncSession (aiosqlite), the way the async endpoints run it."""
+
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import async_crud, database, models, operations, schemas
+from app.redis.notification_stream import LOW_STOCK_STREAM
+from app.utils import to_dispense_response
+from tests.conftest import seed
+
+
+@pytest.fixture
+def databases(tmp_path):
+    """(sync, async) session factories on one SQLite file; the async one configured like AsyncSessionLocal."""
+    path = tmp_path / "async.db"
+    engine = create_engine(f"sqlite:///{path}")
+    database.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        seed(db)
+
+    # NullPool: aiosqlite connections belong to the event loop that opened them
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    options = {k: v for k, v in database.AsyncSessionLocal.kw.items() if k != "bind"}
+    yield Session, async_sessionmaker(async_engine, **options)
+    asyncio.run(async_engine.dispose())
+    engine.dispose()
+
+
+def test_dispense_on_async_session(databases, fake_redis):
+    Session, AsyncSession = databases
+    with Session() as db:
+        user = db.query(models.User).one()
+
+    async def dispense():
+        async with AsyncSession() as db:
+            # product 12 starts at 11 in stock, reorder level 10
+            dispense_in = schemas.DispenseCreate(items=[{"product_id": 12, "qty": 5}, {"product_id": 15, "qty": 1}])
+            return await async_crud.dispense_products(db, user, dispense_in)
+
+    disp = asyncio.run(dispense())
+
+    # serialized after the session closed: nothing expired, nothing left to lazy load
+    response = to_dispense_response(disp)
+    assert response["user"]["username"] == "alice"
+    assert sorted((item["product"]["id"], item["qty"]) for item in response["items"]) == [(12, 5), (15, 1)]
+
+    with Session() as db:
+        assert db.get(models.Product, 12).stock == 6
+        notification = db.query(models.LowStockNotification).filter_by(product_id=12, is_active=True).one()
+    _, sync_redis = fake_redis
+    events = [json.loads(fields["data"]) for _, fields in sync_redis.xrange(LOW_STOCK_STREAM)]
+    assert events == [{"add": {"id": notification.id, "message": notification.message, "product_id": 12}}]
+
+
+def test_failed_dispense_on_async_session_writes_nothing(databases):
+    Session, AsyncSession = databases
+    with Session() as db:
+        user = db.query(models.User).one()
+        stock = {p.id: p.stock for p in db.query(models.Product)}
+
+    async def dispense():
+        async with AsyncSession() as db:
+            # product 1 has none in stock
+            dispense_in = schemas.DispenseCreate(items=[{"product_id": 2, "qty": 1}, {"product_id": 1, "qty": 1}])
+            await async_crud.dispense_products(db, user, dispense_in)
+
+    with pytest.raises(ValueError):
+        asyncio.run(dispense())
+
+    with Session() as db:
+        assert {p.id: p.stock for p in db.query(models.Product)} == stock
+        assert db.query(models.Dispense).count() == 0
+
+
+def test_search_on_async_session_matches_sync(databases, monkeypatch):
+    Session, AsyncSession = databases
+    monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", "ilike")
+
+    async def search():
+        async with AsyncSession() as db:
+            return await async_crud.ad_search_products(db, "para 500", skip=1, limit=3)
+
+    found = asyncio.run(search())
+    with Session() as db:
+        expected = [p.id for p in operations.search_products(db, "para 500", skip=1, limit=3)]
+
+    assert [p.id for p in found] == expected and expected
+    # loaded with the response options, readable after the session closed
+    assert all(p.drug.name == "Paracetamol" for p in found)
@@ -0,0 +1,72 @@
+"""Bulk import: invalid rows are reported by position and skipped, the rest are written."""
+
+import orjson
+import pytest
+
+from app import models
+from app.router import product_router
+
+CSV = """drug_id,brand_id,formulation_type_id,unit_id,strength,price,stock
+Paracetamol,,Tablet,mg,250mg,11.5,30
+Aspirin,Bayer,Tablet,mg,75mg,2.0,100
+Aspirin,Bayer,Tablet,mg,300mg,abc,10
+,Emzor,Syrup,ml,5ml,3.0,10
+Aspirin,Bayer,Tablet,tsp,75mg,2.0,10
+Aspirin,Bayer,Tablet,mg,75mg,2.5,120
+"""
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client(product_router.router)
+
+
+def test_csv_import_reports_bad_rows_and_writes_the_rest(client, db):
+    r = client.post("/products/bulk", content=CSV, headers={"Content-Type": "text/csv"})
+    assert r.status_code == 200
+    result = r.json()
+
+    assert (result["created"], result["updated"]) == (1, 1)
+    assert [e["row"] for e in result["errors"]] == [3, 4, 5]
+    assert result["errors"][0]["error"].startswith("price:")
+    assert result["errors"][1]["error"].startswith("drug_id:")
+    assert result["errors"][2]["error"] == "unit_id: unknown unit 'tsp'"
+
+    db.expire_all()
+    assert (db.get(models.Product, 1).price, db.get(models.Product, 1).stock) == (11.5, 30)
+    # the later row for the same product wins
+    aspirin = db.query(models.Product).join(models.Product.drug).filter(models.Drug.name == "Aspirin").one()
+    assert (aspirin.strength, aspirin.price, aspirin.stock) == ("75mg", 2.5, 120)
+    assert aspirin.brand.name == "Bayer"
+
+
+def test_json_import_reports_rows_that_are_not_objects(client, db):
+    rows = [{"drug_id": "Ibuprofen", "formulation_type_id": "Tablet", "strength": "1g"}, "oops", {}]
+    r = client.post("/products/bulk", content=orjson.dumps(rows), headers={"Content-Type": "application/json"})
+    assert r.status_code == 200
+    result = r.json()
+
+    assert result["created"] == 1
+    assert [e["row"] for e in result["errors"]] == [2, 3]
+
+
+def test_all_rows_bad_writes_nothing(client, db):
+    before = db.query(models.Product).count()
+    r = client.post("/products/bulk", content=orjson.dumps([{"price": 1}, {"drug_id": "X"}]))
+
+    assert r.status_code == 200
+    assert r.json()["created"] == r.json()["updated"] == 0
+    assert len(r.json()["errors"]) == 2
+    assert db.query(models.Product).count() == before
+
+
+@pytest.mark.parametrize("body", [b"not json", b'{"drug_id": "X"}'])
+def test_malformed_body_is_rejected(client, body):
+    r = client.post("/products/bulk", content=body, headers={"Content-Type": "application/json"})
+    assert r.status_code == 400
+
+
+def test_too_many_rows_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(product_router, "BULK_IMPORT_MAX_ROWS", 2)
+    r = client.post("/products/bulk", content=orjson.dumps([{}, {}, {}]))
+    assert r.status_code == 413
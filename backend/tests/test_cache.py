@@ -0,0 +1,96 @@
+"""Response cache: single-flight recomputation, cancellation, and invalidation serving stale."""
+
+import asyncio
+
+import orjson
+from sqlalchemy import func, select
+
+from app import models
+from app.redis import cache_utils
+from app.redis.cache_utils import cache, invalidate
+
+
+def _body(response) -> object:
+    return orjson.loads(response.body)
+
+
+def test_concurrent_misses_run_one_query(db, count_statements):
+    @cache(ttl=60, tags=("products",))
+    def product_count(db):
+        return db.scalar(select(func.count(models.Product.id)))
+
+    async def burst():
+        return await asyncio.gather(*(product_count(db=db) for _ in range(200)))
+
+    with count_statements() as counter:
+        responses = asyncio.run(burst())
+
+    assert counter.count == 1
+    assert {_body(r) for r in responses} == {50}
+    stats = cache_utils.cache_stats[f"{product_count.__module__}.{product_count.__name__}"]
+    assert stats["misses"] == 200
+    assert stats["errors"] == 0
+
+
+def test_waiters_take_over_when_the_computing_caller_is_cancelled():
+    calls = []
+
+    @cache(ttl=60, tags=("products",))
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        first = asyncio.create_task(slow())
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(slow()) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await asyncio.wait_for(asyncio.gather(*waiters), timeout=2)
+
+    responses = asyncio.run(run())
+
+    # one waiter recomputed it and the others shared that result
+    assert len(calls) == 2
+    assert {_body(r) for r in responses} == {2}
+    assert not cache_utils._inflight
+
+
+def test_invalidate_serves_stale_while_refreshing():
+    version = {"n": 1}
+
+    @cache(ttl=60, stale_ttl=600, tags=("analytics",))
+    async def report():
+        return version["n"]
+
+    async def run():
+        assert _body(await report()) == 1
+        version["n"] = 2
+        await invalidate("analytics")
+
+        # answered from the invalidated entry, with a refresh started
+        stale = await report()
+        await asyncio.gather(*cache_utils._background)
+        return stale, await report()
+
+    stale, refreshed = asyncio.run(run())
+
+    assert _body(stale) == 1
+    assert _body(refreshed) == 2
+
+
+def test_invalidate_recomputes_without_stale_ttl():
+    version = {"n": 1}
+
+    @cache(ttl=60, tags=("products",))
+    async def listing():
+        return version["n"]
+
+    async def run():
+        await listing()
+        version["n"] = 2
+        await invalidate("products")
+        return await listing()
+
+    assert _body(asyncio.run(run())) == 2
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from app import models, operations, schemas
+from app.router import dispense_router
+
+
+def test_empty_dispense_is_rejected(make_client):
+    with pytest.raises(ValidationError):
+        schemas.DispenseCreate(items=[])
+
+    client = make_client(dispense_router.router)
+    r = client.post("/dispense/", json={"items": []})
+    assert r.status_code == 422
+
+
+def test_dispense_sees_stock_of_products_already_loaded(db):
+    user = db.query(models.User).one()
+
+    # product 12 starts at 11 in stock, reorder level 10; load it first
+    product = db.get(models.Product, 12)
+    assert product.stock == 11
+
+    dispense_in = schemas.DispenseCreate(items=[{"product_id": 12, "qty": 5}])
+    asyncio.run(operations.dispense_products(db, user, dispense_in))
+
+    assert product.stock == 6
+    assert db.query(models.LowStockNotification).filter_by(product_id=12, is_active=True).count() == 1
@@ -0,0 +1,73 @@
+"""/dispense/all/export: NDJSON one dispense per line, CSV one item per row, streamed from its own session."""
+
+import csv
+import io
+import json
+
+import pytest
+
+from app import models, operations, schemas
+from app.router import dispense_router
+
+
+@pytest.fixture
+def dispenses(db) -> list[models.Dispense]:
+    """Three dispenses, oldest first: two items (one product twice), one item, three items."""
+    user = db.query(models.User).one()
+    orders = [
+        [(14, 1), (5, 2), (14, 1)],
+        [(9, 3)],
+        [(4, 1), (6, 1), (7, 1)],
+    ]
+    created = []
+    for items in orders:
+        dispense_in = schemas.DispenseCreate(items=[{"product_id": p, "qty": q} for p, q in items])
+        disp, _ = operations.apply_dispense(db, user, dispense_in)
+        created.append(disp)
+    return created
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client(dispense_router.router)
+
+
+def test_ndjson_groups_items_under_their_dispense(client, dispenses):
+    r = client.get("/dispense/all/export")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+
+    # newest first, one line per dispense
+    assert [d["id"] for d in lines] == [d.id for d in reversed(dispenses)]
+    first = lines[-1]
+    assert set(first) == {"id", "created_at", "user_id", "user", "items"}
+    assert first["user"] == {"id": first["user_id"], "username": "alice"}
+    assert [(i["product"]["id"], i["qty"]) for i in first["items"]] == [(14, 1), (5, 2), (14, 1)]
+    assert set(first["items"][0]) == {"id", "qty", "price_at_dispense", "product"}
+    assert set(first["items"][0]["product"]) == {"id", "drug", "brand"}
+    assert [len(d["items"]) for d in lines] == [3, 1, 3]
+
+
+def test_csv_has_one_row_per_item(client, dispenses):
+    r = client.get("/dispense/all/export", params={"format": "csv"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    assert "attachment" in r.headers["content-disposition"]
+
+    rows = list(csv.reader(io.StringIO(r.text)))
+    assert rows[0] == dispense_router.EXPORT_COLUMNS
+    body = [dict(zip(rows[0], row)) for row in rows[1:]]
+    assert len(body) == 7
+    # items of a dispense stay together, in item order
+    assert [int(row["dispense_id"]) for row in body] == [dispenses[2].id] * 3 + [dispenses[1].id] + [dispenses[0].id] * 3
+    assert [row["product_id"] for row in body[-3:]] == ["14", "5", "14"]
+    assert body[3]["username"] == "alice" and body[3]["qty"] == "3"
+
+
+def test_empty_range_exports_nothing(client, dispenses):
+    params = {"start_date": "2001-01-01", "end_date": "2001-01-02"}
+    assert client.get("/dispense/all/export", params=params).text == ""
+    assert client.get("/dispense/all/export", params={**params, "format": "csv"}).text.splitlines() == [
+        ",".join(dispense_router.EXPORT_COLUMNS)
+    ]
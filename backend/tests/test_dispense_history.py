@@ -0,0 +1,88 @@
+"""Dispense history: a fixed number of statements per page, and keyset paging over equal timestamps."""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from app import models
+from app.router import dispense_router
+
+BASE = datetime(2026, 10, 1, 9, 0)
+
+
+@pytest.fixture
+def history(db) -> list[int]:
+    """40 dispenses of 1-3 items, four to each timestamp; returns their ids newest first."""
+    user = db.query(models.User).one()
+    created_at = {i: BASE + timedelta(minutes=i // 4) for i in range(1, 41)}
+    db.execute(insert(models.Dispense), [
+        {"id": i, "user_id": user.id, "created_at": created_at[i]} for i in created_at
+    ])
+    db.execute(insert(models.DispenseItem), [
+        {"dispense_id": i, "product_id": (i + n) % 50 + 1, "qty": 1, "price_at_dispense": 5.0}
+        for i in created_at
+        for n in range(i % 3 + 1)
+    ])
+    db.commit()
+    return sorted(created_at, key=lambda i: (created_at[i], i), reverse=True)
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client(dispense_router.router)
+
+
+def _fetch(client, path, limit, cursor=None) -> tuple[list[int], str | None]:
+    """One page of a history endpoint: (dispense ids, next cursor)."""
+    params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+    r = client.get(path, params=params)
+    assert r.status_code == 200
+    if path.startswith("/dispense/dispense-history/"):
+        body = r.json()
+        return [d["id"] for d in body["results"]], body["next_cursor"]
+    return [d["id"] for d in r.json()], r.headers.get("x-next-cursor")
+
+
+PATHS = ["/dispense/all", "/dispense/my-history", "/dispense/dispense-history/1"]
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_statements_per_page_do_not_grow_with_page_size(client, history, count_statements, path):
+    counts = {}
+    for limit in (2, 30):
+        with count_statements() as counter:
+            ids, _ = _fetch(client, path, limit)
+        assert len(ids) == limit
+        # the dispense SELECT, then items with products in one SELECT ... IN
+        counts[limit] = [s for s in counter.statements if "dispense" in s]
+
+    assert len(counts[2]) == len(counts[30])
+    loads = [s for s in counts[30] if "count(" not in s]
+    assert len(loads) == 2
+
+
+@pytest.mark.parametrize("path", PATHS)
+@pytest.mark.parametrize("limit", [1, 3, 4, 7])
+def test_keyset_walk_over_equal_created_at(client, history, path, limit):
+    seen, cursor = [], None
+    while True:
+        ids, cursor = _fetch(client, path, limit, cursor)
+        seen += ids
+        if not cursor:
+            break
+
+    assert seen == history
+
+
+def test_cursor_between_equal_timestamps_continues_by_id(client, history):
+    # ids 8-11 share a timestamp; stop after 11 and 10
+    page, cursor = _fetch(client, "/dispense/all", history.index(10) + 1)
+    assert page[-2:] == [11, 10]
+
+    rest, _ = _fetch(client, "/dispense/all", 3, cursor)
+    assert rest == [9, 8, 7]
+
+
+def test_malformed_cursor_is_rejected(client, history):
+    assert client.get("/dispense/all", params={"limit": 5, "cursor": "yesterday"}).status_code == 400
@@ -0,0 +1,67 @@
+"""
+Opt-in (pytest -m benchmark -s): dispense lock hold times under 50
+concurrent dispensers, with the catalog counter on one row and spread over
+shards. Runs on a SQLite file, or on BENCHMARK_DATABASE_URL (a scratch
+database: its tables are dropped) to measure Postgres row locks.
+"""
+
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from app import etag, models, operations, schemas
+from app.database import Base
+from app.router import metrics_router
+from tests.conftest import seed
+
+DISPENSERS = 50
+ROUNDS = 20
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.fixture
+def load_db(tmp_path):
+    url = os.getenv("BENCHMARK_DATABASE_URL") or f"sqlite:///{tmp_path / 'load.db'}"
+    options = {"connect_args": {"check_same_thread": False, "timeout": 60}} if url.startswith("sqlite") else {}
+    engine = create_engine(url, pool_size=DISPENSERS, max_overflow=0, **options)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as db:
+        seed(db)
+        db.execute(update(models.Product).values(stock=10 ** 6))
+        db.commit()
+    yield factory
+    engine.dispose()
+
+
+@pytest.mark.parametrize("shards", [1, etag.CATALOG_VERSION_SHARDS])
+def test_dispense_lock_stats_under_load(load_db, monkeypatch, shards):
+    monkeypatch.setattr(etag, "CATALOG_VERSION_SHARDS", shards)
+    monkeypatch.setattr(operations, "dispense_lock_stats", {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+    monkeypatch.setattr(metrics_router, "dispense_lock_stats", operations.dispense_lock_stats)
+    with load_db() as db:
+        user = db.query(models.User).one()
+    start = threading.Barrier(DISPENSERS)
+
+    def dispenser(n: int):
+        rng = random.Random(n)
+        start.wait()
+        with load_db() as db:
+            for _ in range(ROUNDS):
+                items = [{"product_id": p, "qty": 1} for p in rng.sample(range(1, 51), 3)]
+                operations.apply_dispense(db, user, schemas.DispenseCreate(items=items))
+
+    with ThreadPoolExecutor(DISPENSERS) as pool:
+        list(pool.map(dispenser, range(DISPENSERS)))
+
+    stats = metrics_router.dispense_lock_metrics()
+    print(f"\n{shards} counter shard(s), {DISPENSERS} dispensers x {ROUNDS}: "
+          f"avg {stats['avg_ms']:.1f} ms, max {stats['max_ms']:.1f} ms held")
+    assert stats["count"] == DISPENSERS * ROUNDS
@@ -0,0 +1,69 @@
+"""The catalog ETag must change with every committed product write, however close together."""
+
+import asyncio
+
+import pytest
+
+from app import crud, models, operations, schemas
+from app.etag import bump_catalog_version, catalog_version
+from app.router import product_router
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client(product_router.router)
+
+
+def _etag(client) -> str:
+    r = client.get("/products/", params={"limit": 5})
+    assert r.status_code == 200
+    return r.headers["etag"]
+
+
+def test_unchanged_catalog_answers_304(client):
+    etag = _etag(client)
+    r = client.get("/products/", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+
+
+def test_every_write_moves_the_etag(client, db):
+    user = db.query(models.User).one()
+    seen = [_etag(client)]
+
+    # all within the same second, where last_changed_date can't tell them apart
+    writes = [
+        lambda: operations.update_product_stock(db, 5, 40, user.id),
+        lambda: operations.update_product_stock(db, 5, 41, user.id),
+        lambda: operations.update_product_reorder_level(db, 5, 3, user.id),
+        lambda: crud.update_product(db, 6, schemas.ProductBase.model_validate({"price": 12.5})),
+        lambda: asyncio.run(operations.dispense_products(
+            db, user, schemas.DispenseCreate(items=[{"product_id": 14, "qty": 1}]),
+        )),
+        lambda: crud.delete_product(db, 7),
+    ]
+    for write in writes:
+        write()
+        seen.append(_etag(client))
+        r = client.get("/products/", params={"limit": 5}, headers={"If-None-Match": seen[-2]})
+        assert r.status_code == 200
+
+    assert len(set(seen)) == len(seen)
+
+
+def test_rolled_back_write_keeps_the_etag(client, db):
+    etag = _etag(client)
+
+    bump_catalog_version(db)
+    db.rollback()
+
+    assert _etag(client) == etag
+
+
+def test_counter_is_summed_over_its_shards(db):
+    bumps = [bump_catalog_version(db) for _ in range(40)]
+    db.commit()
+
+    assert len({shard for shard, _ in bumps}) > 1
+    assert catalog_version(db)[0] == 40
+    assert db.query(models.CatalogVersion).count() == len({shard for shard, _ in bumps})
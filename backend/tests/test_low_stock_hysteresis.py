@@ -0,0 +1,80 @@
+"""Coalescing of low-stock events per window, and the hysteresis band around reorder_level."""
+
+import pytest
+
+from app import models, operations
+from app.redis.notification_stream import coalesce
+
+
+def _add(product_id: int, message: str = "low") -> dict:
+    return {"add": {"id": product_id, "message": message, "product_id": product_id}}
+
+
+def _events(*messages) -> list[dict]:
+    return [{"id": f"1-{n}", **m} for n, m in enumerate(messages)]
+
+
+def test_last_event_per_product_wins():
+    diff = coalesce(_events(_add(1, "5 left"), _add(2), _add(1, "3 left"), {"remove": 3}), "0-0")
+
+    assert diff == {
+        "type": "diff", "prev": "0-0", "id": "1-3",
+        "added": [_add(1, "3 left")["add"], _add(2)["add"]],
+        "removed": [3],
+    }
+
+
+def test_add_then_remove_in_one_window_is_a_single_remove():
+    diff = coalesce(_events(_add(1), {"remove": 1}), "1-9")
+    assert (diff["added"], diff["removed"], diff["prev"]) == ([], [1], "1-9")
+
+
+def test_remove_then_add_in_one_window_is_a_single_add():
+    diff = coalesce(_events({"remove": 1}, _add(1)), "1-9")
+    assert (diff["added"], diff["removed"]) == ([_add(1)["add"]], [])
+
+
+@pytest.fixture
+def product(db, monkeypatch):
+    """Reorder level 10 with a 20% band: opens at 10 or below, closes above 12."""
+    monkeypatch.setattr(operations, "LOW_STOCK_HYSTERESIS", 0.2)
+    p = db.get(models.Product, 14)
+    p.stock = 30
+    db.commit()
+    return p
+
+
+def _set_stock(db, product, stock) -> list[dict]:
+    product.stock = stock
+    messages = operations.sync_low_stock_notifications(db, [product])
+    db.commit()
+    return messages
+
+
+def _is_open(db, product) -> bool:
+    notification = db.query(models.LowStockNotification).filter_by(product_id=product.id).one_or_none()
+    return bool(notification and notification.is_active)
+
+
+def test_stock_hovering_in_the_band_neither_opens_nor_closes(db, product):
+    assert operations.low_stock_clear_level(product) == 12
+
+    assert _set_stock(db, product, 11) == []
+    assert not _is_open(db, product)
+
+    (opened,) = _set_stock(db, product, 10)
+    assert opened["add"]["product_id"] == product.id
+
+    for stock in (11, 12, 9, 12, 11):
+        assert _set_stock(db, product, stock) == [], stock
+        assert _is_open(db, product)
+
+    assert _set_stock(db, product, 13) == [{"remove": product.id}]
+    assert not _is_open(db, product)
+
+    for stock in (12, 11):
+        assert _set_stock(db, product, stock) == []
+        assert not _is_open(db, product)
+
+    (reopened,) = _set_stock(db, product, 10)
+    assert reopened["add"]["id"] == opened["add"]["id"]
@@ -0,0 +1,49 @@
+"""Low-stock publishing happens after commit, so a Redis outage must not fail the request."""
+
+import asyncio
+
+import pytest
+
+from app import models, operations, schemas
+from app.redis import notification_stream
+from app.router import product_router
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    def fail(*args, **kwargs):
+        raise ConnectionError("Redis is down")
+
+    async def fail_async(*args, **kwargs):
+        fail()
+
+    monkeypatch.setattr(notification_stream, "publish", fail_async)
+    monkeypatch.setattr(notification_stream, "publish_sync", fail)
+
+
+def test_dispense_survives_publish_failure(db, redis_down):
+    user = db.query(models.User).one()
+
+    # product 12 starts at 11 in stock, reorder level 10
+    dispense_in = schemas.DispenseCreate(items=[{"product_id": 12, "qty": 5}])
+    disp = asyncio.run(operations.dispense_products(db, user, dispense_in))
+
+    assert disp.id is not None
+    assert db.get(models.Product, 12).stock == 6
+    assert db.query(models.Dispense).count() == 1
+    assert db.query(models.LowStockNotification).filter_by(product_id=12, is_active=True).count() == 1
+
+
+def test_stock_and_reorder_routes_survive_publish_failure(make_client, redis_down, Session):
+    client = make_client(product_router.router)
+
+    r = client.put("/products/12/stock", params={"qty": 2})
+    assert r.status_code == 200
+    assert r.json()["stock"] == 2
+
+    r = client.put("/products/13/reorder", params={"reorder_level": 40})
+    assert r.status_code == 200
+
+    with Session() as session:
+        active = {n.product_id for n in session.query(models.LowStockNotification).filter_by(is_active=True)}
+    assert {12, 13} <= active
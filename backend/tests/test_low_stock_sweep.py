@@ -0,0 +1,119 @@
+"""The periodic low-stock sweep: correct with odd notification rows, and driven by the partial index."""
+
+import pytest
+from sqlalchemy import event, insert, text, update
+
+from app import crud, models, operations, schemas
+
+
+def _active(db) -> set[int]:
+    db.expire_all()
+    return {n.product_id for n in db.query(models.LowStockNotification).filter_by(is_active=True)}
+
+
+def _low(db) -> set[int]:
+    return {p.id for p in db.query(models.Product) if p.stock <= p.reorder_level}
+
+
+def test_sweep_is_not_blocked_by_a_notification_without_product(db):
+    db.add(models.LowStockNotification(product_id=None, message="orphaned", is_active=True))
+    db.commit()
+
+    messages = operations.sweep_low_stock(db)
+
+    assert _active(db) == _low(db) | {None}
+    assert len(messages) == len(_low(db))
+
+
+def test_sweep_closes_notifications_of_restocked_products(db):
+    operations.sweep_low_stock(db)
+    restocked = sorted(_low(db))[:3]
+
+    # a write that bypasses sync_low_stock_notifications
+    db.execute(update(models.Product).where(models.Product.id.in_(restocked)).values(stock=500))
+    db.commit()
+    messages = operations.sweep_low_stock(db)
+
+    assert _active(db) == _low(db)
+    assert not _active(db) & set(restocked)
+    assert sorted(m["remove"] for m in messages) == restocked
+    assert operations.sweep_low_stock(db) == []
+
+
+@pytest.fixture
+def catalog(db):
+    """A realistic catalog: thousands of products, only a few of them low."""
+    db.execute(insert(models.Product), [
+        {"drug_id": 1, "formulation_type_id": 1, "strength": f"{i}mg", "stock": 100, "reorder_level": 10}
+        for i in range(5000)
+    ])
+    db.execute(update(models.Product).where(models.Product.id < 40).values(stock=100))
+    db.commit()
+    operations.sweep_low_stock(db)
+    db.execute(text("ANALYZE"))
+
+
+def test_sweep_reads_only_low_products_and_active_notifications(db, catalog, query_plans):
+    sweep_plan = query_plans(db, lambda: operations.sweep_low_stock(db))[0]
+
+    assert "USING INDEX ix_product_low_stock" in sweep_plan
+    assert "SCAN product |" not in sweep_plan + " |"
+
+
+def test_get_low_stock_reads_the_partial_index(db, catalog, query_plans):
+    plan = query_plans(db, lambda: operations.get_low_stock(db))[0]
+
+    assert "USING INDEX ix_product_low_stock" in plan
+    assert "USE TEMP B-TREE FOR ORDER BY" not in plan
+
+
+def test_dispense_racing_the_sweep_for_a_new_notification(db, engine):
+    """The sweep inserts the notification between the dispense's SELECT and its INSERT."""
+    user = db.query(models.User).one()
+    raced = []
+
+    def sweep_first(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO low_stock_notifications") and not raced:
+            raced.append(1)
+            conn.connection.cursor().execute(
+                "INSERT INTO low_stock_notifications (product_id, message, is_active) VALUES (12, 'from the sweep', 1)"
+            )
+
+    event.listen(engine, "before_cursor_execute", sweep_first)
+    try:
+        # product 12 starts at 11 in stock, reorder level 10
+        dispense_in = schemas.DispenseCreate(items=[{"product_id": 12, "qty": 5}])
+        _, messages = operations.apply_dispense(db, user, dispense_in)
+    finally:
+        event.remove(engine, "before_cursor_execute", sweep_first)
+
+    assert raced
+    notification = db.query(models.LowStockNotification).filter_by(product_id=12).one()
+    assert notification.is_active and "6 left" in notification.message
+    assert messages == [{"add": {"id": notification.id, "message": notification.message, "product_id": 12}}]
+
+
+def test_created_product_below_reorder_level_is_notified(db):
+    product = crud.create_product(db, schemas.ProductCreate(
+        drug_id="Paracetamol", brand_id="GSK", formulation_type_id="Syrup", unit_id="milligram",
+        strength="5mg", price=3.0, stock=2,
+    ))
+
+    assert product.id in _active(db)
+    assert product.id not in [m["add"]["product_id"] for m in operations.sweep_low_stock(db)]
+
+
+def test_sweep_leaves_products_inside_the_band_alone(db, count_statements):
+    operations.sweep_low_stock(db)
+    # open notifications, stock back above reorder_level but not past the clear level
+    band = sorted(_low(db))[:3]
+    db.execute(update(models.Product).where(models.Product.id.in_(band)).values(stock=11))
+    db.commit()
+    assert all(operations.low_stock_clear_level(db.get(models.Product, i)) == 11 for i in band)
+
+    with count_statements() as counter:
+        assert operations.sweep_low_stock(db) == []
+
+    # nothing stale: only the candidate query runs
+    assert counter.count == 1
+    assert set(band) <= _active(db)
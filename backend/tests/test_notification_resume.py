@@ -0,0 +1,206 @@
+"""Reconnecting notification sockets: replay or snapshot, then live diffs with no gap and no overlap."""
+
+import asyncio
+
+import orjson
+import pytest
+
+from app.notification_set import ActiveNotifications
+from app.redis import notification_stream
+from app.redis.notification_stream import LOW_STOCK_STREAM, coalesce
+from app.router import notifications_router
+from app.ws_manager import ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self):
+        self.received: list[dict] = []
+        self.client = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        self.received.append(orjson.loads(payload))
+
+    async def close(self, code: int):
+        pass
+
+
+def _add(product_id: int) -> dict:
+    return {"add": {"id": product_id, "message": f"product {product_id} low", "product_id": product_id}}
+
+
+@pytest.fixture
+def worker(db, monkeypatch):
+    """This worker's socket manager and active set, loaded like the listener does at start."""
+    manager = ConnectionManager()
+    active = ActiveNotifications()
+    monkeypatch.setattr(notifications_router, "manager", manager)
+    monkeypatch.setattr(notifications_router, "active", active)
+    active.load(db, "0-0")
+    return manager, active
+
+
+async def _listen_once():
+    """One listener step: read everything new, apply it to `active`, broadcast it."""
+    active = notifications_router.active
+    events = await notification_stream.read(active.version, block_ms=1)
+    if events:
+        diff = coalesce(events, active.version)
+        active.apply(diff)
+        notifications_router.manager.broadcast(diff)
+
+
+async def _connect(last_event_id=None) -> FakeSocket:
+    socket = FakeSocket()
+    socket.client = await notifications_router.manager.connect(socket)
+    await notifications_router.resume(socket.client, last_event_id)
+    return socket
+
+
+async def _drain():
+    for _ in range(100):
+        await asyncio.sleep(0)
+
+
+def _state(messages: list[dict]) -> dict[int, dict]:
+    """What a client ends up with, checking every diff applies on top of the previous message."""
+    state, position = {}, None
+    for message in messages:
+        if message["type"] == "snapshot":
+            state = {n["product_id"]: n for n in message["notifications"]}
+        else:
+            assert message["prev"] == position, "gap or overlap"
+            for n in message["added"]:
+                state[n["product_id"]] = n
+            for product_id in message["removed"]:
+                state.pop(product_id, None)
+        position = message["id"]
+    return state
+
+
+def test_reconnect_replays_only_what_was_missed(worker):
+    manager, active = worker
+
+    async def run():
+        await notification_stream.publish([_add(1), _add(2)])
+        await _listen_once()
+        first = await _connect()
+        await _drain()
+        seen = first.received[-1]["id"]
+        manager.disconnect(first.client)
+
+        # missed while disconnected
+        await notification_stream.publish([{"remove": 1}, _add(3)])
+        await _listen_once()
+        await notification_stream.publish([_add(4)])
+        await _listen_once()
+
+        second = await _connect(seen)
+        # live after the join
+        await notification_stream.publish([{"remove": 3}])
+        await _listen_once()
+        await _drain()
+        return seen, first.received, second.received
+
+    seen, first, second = asyncio.run(run())
+
+    assert [m["type"] for m in first] == ["snapshot"]
+    assert [m["type"] for m in second] == ["diff", "diff"]
+    assert second[0]["prev"] == seen
+    assert second[0]["added"] == [_add(3)["add"], _add(4)["add"]]
+    assert second[0]["removed"] == [1]
+    assert _state(first + second) == {2: _add(2)["add"], 4: _add(4)["add"]}
+
+
+@pytest.mark.parametrize("position", ["trimmed", "junk", "ahead"])
+def test_unusable_position_gets_a_snapshot(worker, fake_redis, position):
+    redis, _ = fake_redis
+
+    async def run():
+        await notification_stream.publish([_add(n) for n in range(1, 6)])
+        ids = [event["id"] for event in await notification_stream.read("0-0", block_ms=1)]
+        await _listen_once()
+        await redis.xtrim(LOW_STOCK_STREAM, maxlen=2, approximate=False)
+        last_event_id = {"trimmed": ids[1], "junk": "not-an-id", "ahead": "99999999999999-0"}[position]
+
+        socket = await _connect(last_event_id)
+        await notification_stream.publish([{"remove": 5}])
+        await _listen_once()
+        await _drain()
+        return socket.received
+
+    received = asyncio.run(run())
+
+    assert received[0]["type"] == "snapshot"
+    assert [m["type"] for m in received[1:]] == ["diff"]
+    assert _state(received) == {n: _add(n)["add"] for n in range(1, 5)}
+
+
+def test_client_already_current_gets_nothing_until_the_next_diff(worker):
+    async def run():
+        await notification_stream.publish([_add(1)])
+        await _listen_once()
+        socket = await _connect(notifications_router.active.version)
+        await _drain()
+        before = list(socket.received)
+        await notification_stream.publish([_add(2)])
+        await _listen_once()
+        await _drain()
+        return before, socket.received
+
+    before, received = asyncio.run(run())
+
+    assert before == []
+    assert len(received) == 1 and received[0]["added"] == [_add(2)["add"]]
+
+
+def test_events_arriving_during_a_replay_are_neither_lost_nor_repeated(worker, monkeypatch):
+    """The listener moves `active` on while the replay awaits Redis: resume replays again up to it."""
+    replay = notification_stream.replay
+    calls = []
+
+    async def replay_then_listen(after, upto):
+        events = await replay(after, upto)
+        calls.append((after, upto))
+        if len(calls) == 1:
+            await notification_stream.publish([_add(9)])
+            await _listen_once()
+        return events
+
+    monkeypatch.setattr(notification_stream, "replay", replay_then_listen)
+
+    async def run():
+        await notification_stream.publish([_add(1)])
+        await _listen_once()
+        seen = notifications_router.active.version
+        await notification_stream.publish([_add(2)])
+        await _listen_once()
+
+        socket = await _connect(seen)
+        await notification_stream.publish([{"remove": 1}])
+        await _listen_once()
+        await _drain()
+        return seen, socket.received
+
+    seen, received = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert [m["type"] for m in received] == ["diff", "diff", "diff"]
+    assert received[0]["prev"] == seen
+    assert _state([{"type": "snapshot", "id": seen, "notifications": [_add(1)["add"]]}] + received) == {
+        2: _add(2)["add"], 9: _add(9)["add"],
+    }
+
+
+def test_worker_not_loaded_joins_without_a_snapshot(db, monkeypatch):
+    monkeypatch.setattr(notifications_router, "manager", ConnectionManager())
+    monkeypatch.setattr(notifications_router, "active", ActiveNotifications())
+
+    async def run():
+        socket = await _connect("1-0")
+        await _drain()
+        return socket.received, len(notifications_router.manager.clients)
+
+    assert asyncio.run(run()) == ([], 1)
@@ -0,0 +1,118 @@
+"""The low-stock stream: replay positions, and the listener's position across Redis errors."""
+
+import asyncio
+
+import pytest
+
+from app.notification_set import ActiveNotifications
+from app.redis import notification_stream
+from app.redis.notification_stream import LOW_STOCK_STREAM
+from app.router import notifications_router
+
+
+def _add(product_id: int) -> dict:
+    return {"add": {"id": product_id, "message": f"product {product_id} low", "product_id": product_id}}
+
+
+async def _publish(*messages) -> list[str]:
+    """Publish one message at a time; returns their stream ids."""
+    ids = []
+    for message in messages:
+        await notification_stream.publish([message])
+        ids.append(await notification_stream.latest_id())
+    return ids
+
+
+def test_read_and_replay_return_events_in_order(fake_redis):
+    async def run():
+        ids = await _publish(_add(1), {"remove": 2}, _add(3))
+        return ids, await notification_stream.read("0-0", block_ms=1), await notification_stream.replay(ids[0], ids[2])
+
+    ids, read, replayed = asyncio.run(run())
+
+    assert [e["id"] for e in read] == ids
+    assert read[1] == {"id": ids[1], "remove": 2}
+    assert replayed == read[1:]
+
+
+def test_replay_after_a_trim_asks_for_a_snapshot(fake_redis):
+    redis, _ = fake_redis
+
+    async def run():
+        ids = await _publish(*(_add(n) for n in range(5)))
+        await redis.xtrim(LOW_STOCK_STREAM, maxlen=2, approximate=False)
+        return ids, [await notification_stream.replay(after, ids[-1]) for after in ids]
+
+    ids, replays = asyncio.run(run())
+
+    # ids[0..2] were trimmed, so what came after them may be gone
+    assert replays[:3] == [None, None, None]
+    assert [e["id"] for e in replays[3]] == ids[4:]
+    assert replays[4] == []
+
+
+@pytest.mark.parametrize("after, upto, expected", [
+    ("5-0", "5-0", []),       # already there
+    ("5-1", "5-0", None),     # ahead of upto
+    ("junk", "5-0", None),
+    ("", "5-0", None),
+])
+def test_replay_positions(fake_redis, after, upto, expected):
+    assert asyncio.run(notification_stream.replay(after, upto)) == expected
+
+
+def test_listener_keeps_its_position_across_a_redis_error(db, monkeypatch):
+    monkeypatch.setattr(notifications_router, "active", ActiveNotifications())
+    monkeypatch.setattr(notifications_router, "LOW_STOCK_COALESCE_MS", 1)
+    monkeypatch.setattr(notifications_router, "LISTENER_RETRY_SECONDS", 0.01)
+    broadcast = []
+
+    async def record(diff):
+        broadcast.append(diff)
+
+    monkeypatch.setattr(notifications_router, "broadcast_message", record)
+
+    reads, failed, fail = [], [], asyncio.Event()
+    read = notification_stream.read
+
+    async def flaky_read(after, block_ms=notification_stream.READ_BLOCK_MS):
+        reads.append(after)
+        if fail.is_set():
+            fail.clear()
+            failed.append(len(reads) - 1)
+            raise ConnectionError("Redis went away")
+        return await read(after, min(block_ms, 20))
+
+    monkeypatch.setattr(notification_stream, "read", flaky_read)
+
+    async def wait_for(condition):
+        for _ in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("timed out")
+
+    async def run():
+        listener = asyncio.create_task(notifications_router.redis_listener())
+        try:
+            await wait_for(lambda: notifications_router.active.ready)
+            first = await _publish(_add(1))
+            await wait_for(lambda: broadcast)
+
+            fail.set()
+            await wait_for(lambda: not fail.is_set())
+            # published while the listener is backing off
+            rest = await _publish({"remove": 1}, _add(2))
+            await wait_for(lambda: broadcast[-1]["id"] == rest[-1])
+        finally:
+            listener.cancel()
+        return first + rest
+
+    ids = asyncio.run(run())
+
+    # the read after the failed one picks up where it left off
+    assert reads[failed[0]] == reads[failed[0] + 1] == ids[0]
+    # the diffs chain from the load position to the last event, nothing skipped
+    assert broadcast[0]["id"] == ids[0]
+    assert all(later["prev"] == earlier["id"] for earlier, later in zip(broadcast, broadcast[1:]))
+    assert notifications_router.active.by_product.keys() == {2}
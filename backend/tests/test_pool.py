@@ -0,0 +1,90 @@
+"""Pool exhaustion under a burst of concurrent requests, with the old and the configured pool sizes."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app import database, pool_metrics
+from app.router import metrics_router
+
+# Concurrent requests in the burst, and how long each keeps its connection;
+# the hold is longer than the pool timeout, so a request that has to wait fails
+REQUESTS = 30
+HOLD_SECONDS = 0.5
+POOL_TIMEOUT = 0.2
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """Fresh metrics behind InstrumentedQueuePool and the /metrics/db-pool report."""
+    metrics = pool_metrics.PoolMetrics()
+    monkeypatch.setattr(pool_metrics.InstrumentedQueuePool, "metrics", metrics)
+    monkeypatch.setitem(pool_metrics.POOL_METRICS, "sync", metrics)
+    return metrics
+
+
+def _burst(tmp_path, **pool_options) -> tuple[int, int]:
+    """Run REQUESTS at once against a fresh engine; returns (ok, timed out)."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        connect_args={"check_same_thread": False},
+        poolclass=pool_metrics.InstrumentedQueuePool,
+        **{**pool_options, "pool_timeout": POOL_TIMEOUT},
+    )
+    pool_metrics.instrument("sync", engine)
+    start = threading.Barrier(REQUESTS)
+
+    def request():
+        start.wait()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                threading.Event().wait(HOLD_SECONDS)
+            return True
+        except PoolTimeout:
+            return False
+
+    try:
+        with ThreadPoolExecutor(REQUESTS) as pool:
+            results = list(pool.map(lambda _: request(), range(REQUESTS)))
+    finally:
+        engine.dispose()
+    return results.count(True), results.count(False)
+
+
+def test_old_pool_size_is_exhausted(tmp_path, metrics):
+    # SQLAlchemy's defaults, which ran out during the morning rush
+    ok, timed_out = _burst(tmp_path, pool_size=5, max_overflow=10)
+
+    assert ok == 15
+    assert timed_out == REQUESTS - 15
+    report = metrics_router.db_pool_metrics()["sync"]
+    assert report["checkout_errors"] == timed_out
+    assert report["wait"]["count"] == ok
+
+
+def test_configured_pool_absorbs_the_burst(tmp_path, metrics):
+    options = {k: database.POOL_OPTIONS[k] for k in ("pool_size", "max_overflow")}
+    ok, timed_out = _burst(tmp_path, **options)
+
+    assert (ok, timed_out) == (REQUESTS, 0)
+    report = metrics_router.db_pool_metrics()["sync"]
+    assert report["checkout_errors"] == 0
+    assert report["wait"]["count"] == REQUESTS
+    assert report["checked_out"] == 0
+
+
+def test_both_engines_fit_postgres_max_connections():
+    """The pools the engines were actually built with, summed over the deployed workers."""
+    sync_pool, async_pool = database.engine.pool, database.async_engine.pool
+    held = sum(pool.size() + pool._max_overflow for pool in (sync_pool, async_pool))
+
+    # the async engine has its own, smaller pool rather than a second copy of the sync one
+    assert async_pool.size() == database.ASYNC_POOL_OPTIONS["pool_size"] < sync_pool.size()
+    assert held == database.connections_per_worker()
+    assert database.WORKERS * held <= database.POSTGRES_MAX_CONNECTIONS - database.POSTGRES_RESERVED_CONNECTIONS
+    # headroom for a second worker with the default 100 connections
+    assert 2 * held <= 100 - database.POSTGRES_RESERVED_CONNECTIONS
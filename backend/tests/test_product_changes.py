@@ -0,0 +1,102 @@
+"""Delta sync: /products/changes pages on commit-ordered catalog versions, never skipping a write."""
+
+import random
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, etag, models, operations, schemas
+from app.database import Base
+from app.etag import bump_catalog_version
+from app.product_import import import_products
+from tests.conftest import seed
+
+
+@pytest.fixture(autouse=True)
+def shards(monkeypatch):
+    monkeypatch.setattr(etag, "CATALOG_VERSION_SHARDS", 4)
+    monkeypatch.setattr(etag, "random", random.Random(19))
+
+
+def _sync(db, cursor=None, limit=500) -> tuple[list[int], list[int], str]:
+    """Follow has_more to the end; returns (upserted ids, deleted ids, cursor)."""
+    upserts, deletes = [], []
+    while True:
+        changes = crud.get_product_changes(db, cursor, limit=limit)
+        upserts += [row[0] for row in changes["upserts"]]
+        deletes += changes["deletes"]
+        cursor = changes["cursor"]
+        if not changes["has_more"]:
+            return upserts, deletes, cursor
+
+
+@pytest.mark.parametrize("limit", [1, 3, 500])
+def test_full_sync_then_deltas(db, limit):
+    upserts, deletes, cursor = _sync(db, limit=limit)
+    assert sorted(upserts) == list(range(1, 51)) and deletes == []
+    assert _sync(db, cursor, limit) == ([], [], cursor)
+
+    user = db.query(models.User).one()
+    crud.update_product(db, 4, schemas.ProductBase.model_validate({"price": 1.5}))
+    crud.delete_product(db, 9)
+    operations.update_product_stock(db, 12, 3, user.id)
+    import_products(db, [
+        {"drug_id": "Ibuprofen", "formulation_type_id": "Tablet", "strength": f"{n}mg", "stock": 1}
+        for n in range(5)
+    ])
+
+    upserts, deletes, cursor = _sync(db, cursor, limit)
+    assert sorted(upserts) == [4, 12, 51, 52, 53, 54, 55]
+    assert deletes == [9]
+    assert _sync(db, cursor, limit)[:2] == ([], [])
+
+
+def test_rows_stamped_by_one_write_are_paged_by_id(db):
+    _, _, cursor = _sync(db)
+    db.commit()
+    bump_catalog_version(db, range(10, 20))
+    db.commit()
+
+    pages = []
+    while True:
+        changes = crud.get_product_changes(db, cursor, limit=3)
+        pages.append([row[0] for row in changes["upserts"]])
+        cursor = changes["cursor"]
+        if not changes["has_more"]:
+            break
+    assert pages == [[10, 11, 12], [13, 14, 15], [16, 17, 18], [19]]
+
+
+def test_write_committing_after_the_cursor_is_not_missed(tmp_path, monkeypatch):
+    """A transaction that stamps its rows before a terminal syncs, and commits after."""
+    monkeypatch.setattr(etag, "CATALOG_VERSION_SHARDS", 1)
+    engine = create_engine(f"sqlite:///{tmp_path / 'sync.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        seed(db)
+
+    with Session() as writer, Session() as reader:
+        _, _, cursor = _sync(reader)
+        reader.execute(update(models.Product).where(models.Product.id == 7).values(stock=1))
+        bump_catalog_version(reader, [7])
+        reader.commit()
+
+        # the writer's transaction is open across the terminal's sync
+        writer.execute(update(models.Product).where(models.Product.id == 5).values(stock=99))
+        bump_catalog_version(writer, [5])
+        upserts, _, cursor = _sync(reader, cursor)
+        assert upserts == [7]
+
+        writer.commit()
+        upserts, _, cursor = _sync(reader, cursor)
+        assert upserts == [5]
+    engine.dispose()
+
+
+def test_bad_cursor_is_rejected(db):
+    with pytest.raises(HTTPException) as e:
+        crud.get_product_changes(db, "1=x")
+    assert e.value.status_code == 400
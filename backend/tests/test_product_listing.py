@@ -0,0 +1,90 @@
+"""Keyset paging over /products/, and the uncached random sample."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, models
+from app.router import product_router
+
+
+@pytest.fixture
+def changed(db):
+    """Spread last_changed_date with ties and never-changed rows; returns {id: date}."""
+    base = datetime(2026, 10, 1, 8, 30)
+    dates = {}
+    for p in db.query(models.Product):
+        p.last_changed_date = None if p.id % 7 == 0 else base + timedelta(minutes=p.id % 5, microseconds=p.id % 2)
+        dates[p.id] = p.last_changed_date
+    db.commit()
+    return dates
+
+
+def _walk(client, limit, **params) -> list[int]:
+    ids, cursor = [], None
+    while True:
+        r = client.get("/products/", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        ids += [p["id"] for p in r.json()]
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            return ids
+
+
+@pytest.mark.parametrize("limit", [1, 7, 50])
+def test_paging_by_id_visits_every_product_once(make_client, db, limit):
+    client = make_client(product_router.router)
+    assert _walk(client, limit) == list(range(1, 51))
+
+
+@pytest.mark.parametrize("limit", [1, 4, 9])
+def test_paging_by_last_changed_date_handles_ties_and_nulls(make_client, changed, limit):
+    client = make_client(product_router.router)
+
+    # most recently changed first, ties by id descending, never-changed last
+    expected = (
+        sorted((i for i in changed if changed[i]), key=lambda i: (changed[i], i), reverse=True)
+        + sorted((i for i in changed if not changed[i]), reverse=True)
+    )
+    assert _walk(client, limit, order_by="last_changed_date") == expected
+
+
+def test_paging_with_filters(make_client, db):
+    client = make_client(product_router.router)
+    low = [p.id for p in db.query(models.Product).order_by(models.Product.id) if p.stock <= p.reorder_level]
+
+    assert _walk(client, 3, low_stock=True) == low
+    assert _walk(client, 3, low_stock=False, formulation_type_id=1) == [
+        i for i in range(1, 51) if i not in low and (i - 1) % 2 == 0
+    ]
+
+
+def test_page_after_a_write_neither_skips_nor_repeats(make_client, db):
+    client = make_client(product_router.router)
+    first = client.get("/products/", params={"limit": 10})
+    cursor = first.headers["x-next-cursor"]
+
+    crud.delete_product(db, 3)
+    crud.delete_product(db, 11)
+
+    rest = client.get("/products/", params={"limit": 10, "cursor": cursor}).json()
+    assert [p["id"] for p in rest] == list(range(12, 22))
+
+
+def test_bad_cursor_is_rejected(make_client, db):
+    client = make_client(product_router.router)
+    assert client.get("/products/", params={"cursor": "abc"}).status_code == 400
+
+
+def test_sample_is_drawn_fresh_each_call(make_client, db, monkeypatch):
+    client = make_client(product_router.router)
+    points = iter([5, 30])
+    monkeypatch.setattr(crud.random, "randint", lambda lo, hi: next(points))
+
+    first = client.get("/products/sample", params={"size": 1})
+    second = client.get("/products/sample", params={"size": 1})
+
+    assert [p["id"] for p in first.json()] == [5]
+    assert [p["id"] for p in second.json()] == [30]
+    assert "etag" not in first.headers
+    assert "etag" in client.get("/products/").headers
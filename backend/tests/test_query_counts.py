@@ -0,0 +1,55 @@
+"""Product serialization paths must issue a fixed number of statements, whatever the page size."""
+
+from sqlalchemy import update
+
+from app import crud, models, operations
+from app.router import product_router
+from app.utils import to_product_response
+
+
+def _statements(Session, count_statements, fetch) -> int:
+    """Statements run to load and serialize fetch(db), on a fresh session."""
+    with Session() as session, count_statements() as counter:
+        for p in fetch(session):
+            to_product_response(p)
+    return counter.count
+
+
+def test_get_all_products(db, Session, count_statements):
+    small = _statements(Session, count_statements, lambda s: crud.get_all_products(s, limit=5))
+    large = _statements(Session, count_statements, lambda s: crud.get_all_products(s, limit=50))
+    assert small == large <= 5
+
+
+def test_get_product_by_name_or_id(db, Session, count_statements):
+    few = _statements(Session, count_statements, lambda s: crud.get_product_by_name_or_id(s, "Paracetamol"))
+    many = _statements(Session, count_statements, lambda s: crud.get_product_by_name_or_id(s, "o"))
+    assert few == many <= 5
+
+
+def test_search_products(db, Session, count_statements, monkeypatch):
+    monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", "ilike")
+    small = _statements(Session, count_statements, lambda s: operations.search_products(s, "mg", limit=5))
+    large = _statements(Session, count_statements, lambda s: operations.search_products(s, "mg", limit=50))
+    assert small == large <= 5
+
+
+def test_get_low_stock(db, Session, count_statements):
+    few = _statements(Session, count_statements, operations.get_low_stock)
+
+    db.execute(update(models.Product).values(reorder_level=100))
+    db.commit()
+    everything = _statements(Session, count_statements, operations.get_low_stock)
+
+    assert few == everything <= 5
+
+
+def test_read_products_endpoint(make_client, count_statements):
+    client = make_client(product_router.router)
+
+    with count_statements() as small:
+        assert len(client.get("/products/", params={"limit": 5}).json()) == 5
+    with count_statements() as large:
+        assert len(client.get("/products/", params={"limit": 50}).json()) == 50
+
+    assert small.count == large.count
@@ -0,0 +1,123 @@
+"""Analytics answered from the daily rollups must match the raw dispense rows."""
+
+import asyncio
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import select, text
+
+from app import analytics_crud, crud, models, operations, rollups, schemas
+
+
+def _history(db):
+    """Dispenses over the past ten days at varied times, plus one through apply_dispense."""
+    user = db.query(models.User).one()
+    clerk = models.User(username="bob", email="bob@example.com", hashed_password="x")
+    db.add(clerk)
+    db.flush()
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for n in range(30):
+        disp = models.Dispense(
+            user_id=(user if n % 3 else clerk).id,
+            created_at=today - timedelta(days=n % 10, hours=-(n * 7 % 24), minutes=-n),
+        )
+        db.add(disp)
+        db.flush()
+        db.add_all(
+            models.DispenseItem(dispense_id=disp.id, product_id=1 + (n * k) % 20, qty=1 + k, price_at_dispense=5.0 + k)
+            for k in range(1, 1 + n % 3 + 1)
+        )
+        db.flush()
+        rollups.record_dispense(db, disp.id)
+    db.commit()
+
+    dispense_in = schemas.DispenseCreate(items=[{"product_id": 3, "qty": 1}, {"product_id": 4, "qty": 2}])
+    asyncio.run(operations.dispense_products(db, user, dispense_in))
+    return today
+
+
+def _both(monkeypatch, fetch):
+    monkeypatch.setattr(analytics_crud, "ANALYTICS_SOURCE", "rollup")
+    from_rollups = fetch()
+    monkeypatch.setattr(analytics_crud, "ANALYTICS_SOURCE", "raw")
+    return from_rollups, fetch()
+
+
+def _ranges(today):
+    now = datetime.now()
+    return [
+        (None, None),
+        (today - timedelta(days=30), None),
+        (today - timedelta(days=6), today),
+        (today - timedelta(days=6, hours=-5), now),
+        (today - timedelta(days=4, hours=-13, minutes=-20), today - timedelta(days=1, hours=-9)),
+        (today - timedelta(days=2, hours=-1), today - timedelta(days=2, hours=-23)),
+    ]
+
+
+def test_rollups_match_raw(db, monkeypatch):
+    today = _history(db)
+
+    for start, end in _ranges(today):
+        for fetch in (
+            lambda: analytics_crud.get_most_purchased_products(db, start, end),
+            lambda: analytics_crud.get_most_active_users(db, start, end),
+            lambda: analytics_crud.get_revenue_stats(db, start, end),
+        ):
+            rolled, raw = _both(monkeypatch, fetch)
+            assert rolled == pytest.approx(raw) if isinstance(raw, dict) else rolled == raw, (start, end)
+
+
+def test_timeseries_rollups_match_raw(db, monkeypatch):
+    today = _history(db)
+
+    for interval in ("day", "week", "month"):
+        for start, end in _ranges(today)[1:]:
+            rolled, raw = _both(monkeypatch, lambda: analytics_crud.get_timeseries(db, interval, start, end, True, 3, 3))
+            assert rolled == raw, (interval, start, end)
+
+
+def _rollup_rows(db):
+    return {
+        model.__tablename__: sorted(tuple(row) for row in db.execute(select(model.__table__)))
+        for model in (models.DailyProductSales, models.DailyUserActivity)
+    }
+
+
+def test_backfill_matches_incremental(db):
+    _history(db)
+    incremental = _rollup_rows(db)
+    rollups.backfill(db)
+    assert _rollup_rows(db) == incremental
+
+
+def test_backfill_migration_matches_incremental(db):
+    _history(db)
+    incremental = _rollup_rows(db)
+    path = Path(__file__).parents[1] / "alembic" / "versions" / "99be2d13e563_backfill_daily_rollups.py"
+    spec = importlib.util.spec_from_file_location("backfill_migration", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    with Operations.context(MigrationContext.configure(db.connection())):
+        migration.upgrade()
+    assert _rollup_rows(db) == incremental
+
+    with Operations.context(MigrationContext.configure(db.connection())):
+        migration.downgrade()
+    assert _rollup_rows(db) == {"daily_product_sales": [], "daily_user_activity": []}
+
+
+def test_deleting_a_user_keeps_their_rollups(db):
+    _history(db)
+    db.execute(text("PRAGMA foreign_keys=ON"))
+    bob = db.query(models.User).filter_by(username="bob").one()
+    rows = db.query(models.DailyUserActivity).filter_by(user_id=bob.id).count()
+
+    assert crud.delete_user(db, bob.id)
+    assert db.query(models.DailyUserActivity).filter_by(user_id=bob.id).count() == rows
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import text
+
+from app import crud, models, operations
+from app.search_index import product_ids_like
+
+
+def _fields(p):
+    return [p.drug.name, p.brand.name if p.brand else None, p.strength,
+            p.unit.code if p.unit else None, p.unit.name if p.unit else None]
+
+
+def _expected(db, query):
+    tokens = query.lower().split()
+    return [
+        p.id for p in db.query(models.Product).order_by(models.Product.id)
+        if all(any(tok in (f or "").lower() for f in _fields(p)) for tok in tokens)
+    ]
+
+
+@pytest.mark.parametrize("query", ["para", "PARA 500", "gsk tab", "ml", "milli 1000mg", "emz amox", "nothing", "250 mg"])
+def test_search_products_matches_every_token(db, monkeypatch, query):
+    monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", "ilike")
+    found = [p.id for p in operations.search_products(db, query)]
+    assert found == _expected(db, query)
+
+
+def test_search_products_pages(db, monkeypatch):
+    monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", "ilike")
+    everything = [p.id for p in operations.search_products(db, "mg")]
+    assert [p.id for p in operations.search_products(db, "mg", skip=5, limit=5)] == everything[5:10]
+
+
+def test_get_product_by_name_or_id(db):
+    names = {p.drug.name for p in crud.get_product_by_name_or_id(db, "cillin")}
+    assert names == {"Amoxicillin"}
+
+    brands = {p.brand.name for p in crud.get_product_by_name_or_id(db, "gsk")}
+    assert brands == {"GSK"}
+
+    assert [p.id for p in crud.get_product_by_name_or_id(db, "7")] == [7]
+
+
+def test_name_lookups_reach_products_through_foreign_key_indexes(db):
+    """Each ILIKE runs against its own table; products are found by indexed key, not scanned."""
+    stmt = product_ids_like("%para%", fields=("drug", "brand", "unit"))
+    sql = str(stmt.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    plan = " | ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+    for column in ("drug_id", "brand_id", "unit_id"):
+        assert f"ix_product_{column}" in plan
+    assert "SCAN product" not in plan
@@ -0,0 +1,107 @@
+"""
+Opt-in (pytest -m benchmark -s): search latency over a 100k product
+catalog, ILIKE against the in-memory index, plus trigram ranking when
+BENCHMARK_DATABASE_URL points at a scratch Postgres database (its tables
+are dropped). On SQLite the trigram mode falls back to ILIKE and is skipped.
+"""
+
+import os
+import random
+import statistics
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+
+from app import models, operations
+from app.database import Base, is_postgres
+from app.search_index import ProductSearchIndex
+
+PRODUCTS = 100_000
+ROUNDS = 5
+QUERIES = ["para", "amox 500", "gsk tab", "ml", "drug17 250mg", "brand3", "xyz"]
+
+# same as alembic 08557ccd5c12, create_all does not make them
+TRGM_INDEXES = [
+    ("ix_drug_name_trgm", "drug", "name"),
+    ("ix_brand_name_trgm", "brand", "name"),
+    ("ix_product_strength_trgm", "product", "strength"),
+    ("ix_unit_code_trgm", "unit", "code"),
+    ("ix_unit_name_trgm", "unit", "name"),
+]
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    url = os.getenv("BENCHMARK_DATABASE_URL") or f"sqlite:///{tmp_path_factory.mktemp('search') / 'search.db'}"
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rng = random.Random(0)
+    with engine.begin() as conn:
+        drugs = ["Paracetamol", "Amoxicillin", "Ibuprofen"] + [f"Drug{i}" for i in range(997)]
+        conn.execute(insert(models.Drug), [{"name": name} for name in drugs])
+        conn.execute(insert(models.Brand), [{"name": name} for name in ["GSK", "Emzor"] + [f"Brand{i}" for i in range(48)]])
+        conn.execute(insert(models.FormulationType), [{"name": "Tablet"}, {"name": "Syrup"}])
+        conn.execute(insert(models.Unit), [{"code": "mg", "name": "milligram"}, {"code": "ml", "name": "millilitre"}])
+        for offset in range(0, PRODUCTS, 10_000):
+            conn.execute(insert(models.Product), [
+                {
+                    "drug_id": rng.randint(1, len(drugs)),
+                    "brand_id": rng.choice([None, rng.randint(1, 50)]),
+                    "formulation_type_id": rng.randint(1, 2),
+                    "unit_id": rng.randint(1, 2),
+                    "strength": f"{rng.choice([5, 125, 250, 500, 1000])}mg",
+                    "price": 1.0,
+                    "stock": 100,
+                }
+                for _ in range(offset, min(offset + 10_000, PRODUCTS))
+            ])
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for name, table, column in TRGM_INDEXES:
+                conn.execute(text(f"CREATE INDEX {name} ON {table} USING gin ({column} gin_trgm_ops)"))
+        conn.execute(text("ANALYZE"))
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+def _time(db, query: str) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        operations.search_products(db, query, limit=50)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+@pytest.mark.parametrize("mode", ["ilike", "index", "trigram"])
+def test_search_latency_over_100k_products(catalog, monkeypatch, mode):
+    index = ProductSearchIndex()
+    monkeypatch.setattr(operations, "product_index", index)
+    monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", mode)
+    with catalog() as db:
+        if mode == "trigram" and not is_postgres(db):
+            pytest.skip("trigram ranking needs Postgres, set BENCHMARK_DATABASE_URL")
+        if mode == "index":
+            started = time.perf_counter()
+            index.load(db)
+            print(f"\nindex built over {PRODUCTS} products in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        timings = {query: _time(db, query) for query in QUERIES}
+
+        if mode != "ilike":
+            # same matches as the ILIKE baseline (trigram only reorders them)
+            monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", "ilike")
+            for query in QUERIES:
+                baseline = {p.id for p in operations.search_products(db, query, limit=PRODUCTS)}
+                monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", mode)
+                assert {p.id for p in operations.search_products(db, query, limit=PRODUCTS)} == baseline, query
+                monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", "ilike")
+
+    print(f"\n{mode} over {PRODUCTS} products, median of {ROUNDS} (first page of 50):")
+    for query, ms in timings.items():
+        print(f"  {query!r:>16}: {ms:8.1f} ms")
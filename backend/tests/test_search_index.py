@@ -0,0 +1,78 @@
+"""The in-memory search index against ILIKE, on one worker and across workers."""
+
+import pytest
+
+from app import crud, operations, product_import, schemas
+from app.product_import import import_products
+from app.search_index import ProductSearchIndex
+
+QUERIES = ["para", "PARA 500", "gsk tab", "ml", "milli 1000mg", "emz amox", "nothing", "250 mg", "mg", "ibu 7"]
+
+
+@pytest.fixture
+def index(db, monkeypatch):
+    """A loaded index in place of this worker's."""
+    index = ProductSearchIndex()
+    index.load(db)
+    for module in (crud, operations, product_import):
+        monkeypatch.setattr(module, "product_index", index)
+    return index
+
+
+def _search(db, monkeypatch, mode, query, **page) -> list[int]:
+    monkeypatch.setattr(operations, "PRODUCT_SEARCH_MODE", mode)
+    return [p.id for p in operations.search_products(db, query, **page)]
+
+
+def _assert_parity(db, monkeypatch):
+    for query in QUERIES:
+        assert _search(db, monkeypatch, "index", query) == _search(db, monkeypatch, "ilike", query), query
+        for page in ({"skip": 3, "limit": 4}, {"skip": 0, "limit": 1}, {"skip": 40, "limit": 10}):
+            assert (
+                _search(db, monkeypatch, "index", query, **page) == _search(db, monkeypatch, "ilike", query, **page)
+            ), (query, page)
+
+
+def _write(db):
+    """Create, update, delete and bulk import, each through its own code path."""
+    crud.create_product(db, schemas.ProductCreate(
+        drug_id="Ibuprofen", brand_id="Emzor", formulation_type_id="Tablet", unit_id="milligram",
+        strength="700mg", price=3.0, stock=12,
+    ))
+    crud.update_product(db, 3, schemas.ProductBase.model_validate({"strength": "17ml"}))
+    crud.delete_product(db, 8)
+    import_products(db, [
+        {"drug_id": "Ibuprofen", "brand_id": "GSK", "formulation_type_id": "Tablet", "strength": "75mg"},
+        {"drug_id": "Paracetamol", "brand_id": "Fidson", "formulation_type_id": "Syrup",
+         "unit_id": "mg", "strength": "500mg", "price": 1.0},
+    ])
+
+
+def test_index_matches_ilike(db, monkeypatch, index):
+    _assert_parity(db, monkeypatch)
+
+
+def test_index_follows_writes_on_its_own_worker(db, monkeypatch, index):
+    _write(db)
+    _assert_parity(db, monkeypatch)
+
+
+def test_index_catches_up_with_writes_from_other_workers(db, monkeypatch, index):
+    # this worker's index stays as loaded while another worker writes
+    other = ProductSearchIndex()
+    other.load(db)
+    for module in (crud, product_import):
+        monkeypatch.setattr(module, "product_index", other)
+
+    _write(db)
+
+    assert 8 in index.search(["mg"], limit=100)
+    _assert_parity(db, monkeypatch)
+    assert 8 not in index.search(["mg"], limit=100)
+
+
+def test_unchanged_catalog_refreshes_with_one_query(db, index, count_statements):
+    index.refresh(db)
+    with count_statements() as counter:
+        index.refresh(db)
+    assert counter.count == 1
@@ -0,0 +1,94 @@
+"""/analytics/timeseries/ buckets, gap filling and moving averages against hand-computed values."""
+
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import insert
+
+from app import analytics_crud, models, rollups
+
+# (when, product, qty, price): 2026-03-02 is a Monday
+SALES = [
+    (datetime(2026, 3, 2, 10), 1, 2, 5.0),
+    (datetime(2026, 3, 2, 15), 2, 1, 4.0),
+    (datetime(2026, 3, 4, 9), 1, 3, 5.0),
+    (datetime(2026, 3, 10, 12), 2, 4, 4.0),
+    (datetime(2026, 4, 1, 8), 1, 1, 5.0),
+]
+START, END = datetime(2026, 3, 1), datetime(2026, 4, 5)
+
+
+@pytest.fixture(params=["raw", "rollup"])
+def sales(db, monkeypatch, request):
+    user = db.query(models.User).one()
+    db.execute(insert(models.Dispense), [
+        {"id": n, "user_id": user.id, "created_at": when} for n, (when, *_) in enumerate(SALES, 1)
+    ])
+    db.execute(insert(models.DispenseItem), [
+        {"dispense_id": n, "product_id": product, "qty": qty, "price_at_dispense": price}
+        for n, (_, product, qty, price) in enumerate(SALES, 1)
+    ])
+    db.commit()
+    rollups.backfill(db)
+    monkeypatch.setattr(analytics_crud, "ANALYTICS_SOURCE", request.param)
+
+
+def _series(db, interval, **options):
+    result = analytics_crud.get_timeseries(db, interval, START, END, **options)
+    return result, [(row["period"], row["qty"], row["revenue"]) for row in result["series"]]
+
+
+def test_days_without_gap_filling(db, sales):
+    _, series = _series(db, "day", fill_gaps=False)
+    assert series == [
+        (date(2026, 3, 2), 3, 14.0),
+        (date(2026, 3, 4), 3, 15.0),
+        (date(2026, 3, 10), 4, 16.0),
+        (date(2026, 4, 1), 1, 5.0),
+    ]
+
+
+def test_days_with_gaps_filled(db, sales):
+    _, series = _series(db, "day")
+
+    assert len(series) == 36
+    assert series[0] == (date(2026, 3, 1), 0, 0.0)
+    assert series[1:4] == [(date(2026, 3, 2), 3, 14.0), (date(2026, 3, 3), 0, 0.0), (date(2026, 3, 4), 3, 15.0)]
+    assert series[-1] == (date(2026, 4, 5), 0, 0.0)
+    assert sum(qty for _, qty, _ in series) == 11
+
+
+def test_weeks_start_on_monday(db, sales):
+    _, series = _series(db, "week")
+    assert series == [
+        (date(2026, 2, 23), 0, 0.0),
+        (date(2026, 3, 2), 6, 29.0),
+        (date(2026, 3, 9), 4, 16.0),
+        (date(2026, 3, 16), 0, 0.0),
+        (date(2026, 3, 23), 0, 0.0),
+        (date(2026, 3, 30), 1, 5.0),
+    ]
+
+
+def test_months_start_on_the_first(db, sales):
+    _, series = _series(db, "month")
+    assert series == [(date(2026, 3, 1), 10, 45.0), (date(2026, 4, 1), 1, 5.0)]
+
+
+def test_moving_average_over_filled_weeks(db, sales):
+    result, _ = _series(db, "week", moving_average=2)
+    assert [row["qty_ma"] for row in result["series"]] == [0.0, 3.0, 5.0, 2.0, 0.0, 0.5]
+    assert [row["revenue_ma"] for row in result["series"]] == [0.0, 14.5, 22.5, 8.0, 0.0, 2.5]
+
+
+def test_moving_average_without_gap_filling_skips_empty_buckets(db, sales):
+    result, _ = _series(db, "day", fill_gaps=False, moving_average=3)
+    assert [row["qty_ma"] for row in result["series"]] == [3.0, 3.0, pytest.approx(10 / 3), pytest.approx(8 / 3)]
+
+
+def test_top_products_get_their_own_series(db, sales):
+    result, _ = _series(db, "month", top_n=1)
+
+    (top,) = result["top_products"]
+    assert top["product_id"] == 1 and top["total_qty"] == 6
+    assert [(row["period"], row["qty"]) for row in top["series"]] == [(date(2026, 3, 1), 5), (date(2026, 4, 1), 1)]
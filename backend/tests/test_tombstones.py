@@ -0,0 +1,45 @@
+"""Tombstones when a deleted product's id is handed out again (SQLite reuses the highest id)."""
+
+from app import crud, models, schemas
+from app.product_import import import_products
+
+
+def _create(db) -> models.Product:
+    return crud.create_product(db, schemas.ProductCreate(
+        drug_id="Paracetamol", brand_id="GSK", formulation_type_id="Syrup", unit_id="milligram",
+        strength="125mg", price=4.0, stock=20,
+    ))
+
+
+def _tombstones(db) -> list[int]:
+    db.expire_all()
+    return [t.product_id for t in db.query(models.ProductTombstone)]
+
+
+def test_delete_recreate_delete(db):
+    assert crud.delete_product(db, 50)
+    assert _tombstones(db) == [50]
+
+    product = _create(db)
+    assert product.id == 50
+    assert _tombstones(db) == []
+    changes = crud.get_product_changes(db)
+    assert 50 not in changes["deletes"]
+    assert 50 in [row[0] for row in changes["upserts"]]
+
+    assert crud.delete_product(db, 50)
+    assert _tombstones(db) == [50]
+    assert 50 in crud.get_product_changes(db)["deletes"]
+
+
+def test_bulk_import_clears_reused_tombstones(db):
+    crud.delete_product(db, 50)
+    crud.delete_product(db, 49)
+
+    summary, _ = import_products(db, [
+        {"drug_id": "Ibuprofen", "formulation_type_id": "Tablet", "strength": "1mg", "stock": 1},
+        {"drug_id": "Ibuprofen", "formulation_type_id": "Tablet", "strength": "2mg", "stock": 1},
+    ])
+
+    assert summary["created"] == 2
+    assert _tombstones(db) == []
@@ -0,0 +1,94 @@
+"""Cached principals skip the user query, and every write to the user row drops them."""
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app import crud, models, schemas, security
+from app.database import get_db
+from app.router import auth_router
+from app.user_cache import UserPrincipalCache
+
+
+@pytest.fixture(params=[False, True], ids=["local", "redis"])
+def user_cache(request, monkeypatch):
+    """A fresh cache in place of the worker-wide one, with and without Redis."""
+    cache = UserPrincipalCache(ttl=60, maxsize=16, use_redis=request.param)
+    for module in (security, crud, auth_router):
+        monkeypatch.setattr(module, "user_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def client(Session, db, user_cache):
+    """/me behind the real get_current_user, logged in as the seeded admin."""
+    app = FastAPI()
+    app.include_router(auth_router.router)
+
+    @app.get("/me")
+    def me(user: schemas.UserResponse = Depends(security.get_current_user)):
+        return user
+
+    def _db():
+        with Session() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = _db
+    client = TestClient(app)
+    client.cookies.set("access_token", security.create_access_token({"sub": "alice"}))
+    return client
+
+
+def _user_queries(client, count_statements) -> int:
+    with count_statements() as counter:
+        assert client.get("/me").status_code == 200
+    return sum("FROM users" in s for s in counter.statements)
+
+
+def test_principal_is_cached(client, user_cache, count_statements):
+    assert _user_queries(client, count_statements) == 1
+    assert _user_queries(client, count_statements) == 0
+    assert user_cache.get("alice").username == "alice"
+
+
+def test_update_user_drops_principal(client, db, user_cache):
+    assert client.get("/me").json()["is_admin"] is True
+
+    user = db.query(models.User).one()
+    crud.update_user(db, user.id, {"is_admin": False})
+
+    assert user_cache.get("alice") is None
+    assert client.get("/me").json()["is_admin"] is False
+
+
+def test_rename_drops_old_principal(client, db, user_cache):
+    client.get("/me")
+
+    user = db.query(models.User).one()
+    crud.update_user(db, user.id, {"username": "alice2"})
+
+    # the old token must stop working straight away
+    assert user_cache.get("alice") is None
+    assert client.get("/me").status_code == 401
+
+
+def test_delete_user_drops_principal(client, db, user_cache):
+    client.get("/me")
+
+    crud.delete_user(db, db.query(models.User).one().id)
+
+    assert user_cache.get("alice") is None
+    assert client.get("/me").status_code == 401
+
+
+def test_verify_email_drops_principal(client, db, user_cache):
+    user = db.query(models.User).one()
+    user.is_active = False
+    user.verification_code = "123456"
+    db.commit()
+    assert client.get("/me").json()["is_active"] is False
+
+    r = client.post("/auth/verify-email", json={"email": "alice@example.com", "code": "123456"})
+    assert r.status_code == 200
+
+    assert client.get("/me").json()["is_active"] is True
@@ -0,0 +1,53 @@
+"""The incrementally maintained inventory valuation must match a rebuild from the product table."""
+
+import asyncio
+
+from sqlalchemy import event, select
+
+from app import crud, models, operations, schemas, valuation
+
+
+def _summary(db):
+    db.expire_all()
+    return sorted(tuple(row) for row in db.execute(select(models.InventoryValuation.__table__)))
+
+
+def test_valuation_follows_every_write(db):
+    valuation.rebuild(db)
+    user = db.query(models.User).one()
+
+    dispense_in = schemas.DispenseCreate(items=[{"product_id": 14, "qty": 3}, {"product_id": 9, "qty": 2}])
+    asyncio.run(operations.dispense_products(db, user, dispense_in))
+    crud.update_product(db, 5, schemas.ProductBase.model_validate({"price": 99.5, "nhia_cover": True}))
+    operations.update_product_stock(db, 6, 40, user.id)
+    crud.create_product(db, schemas.ProductCreate(
+        drug_id="Paracetamol", brand_id="GSK", formulation_type_id="Syrup", unit_id="milligram",
+        strength="5mg", price=3.0, stock=12,
+    ))
+    crud.delete_product(db, 7)
+
+    incremental = _summary(db)
+    valuation.rebuild(db)
+    assert _summary(db) == incremental
+
+
+def test_deltas_are_written_in_key_order(db, engine):
+    """Concurrent writers must take the summary row locks in the same order."""
+    written = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "inventory_valuation" in statement:
+            written.extend(parameters if executemany else [parameters])
+
+    products = db.query(models.Product).order_by(models.Product.id.desc()).all()
+    for p in products:
+        p.nhia_cover = p.id % 3 == 0
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        valuation.apply_deltas(db, [valuation.contribution(p) for p in products])
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    keys = [tuple(row[:2]) for row in written]
+    assert len(keys) == 4
+    assert keys == sorted(keys)
@@ -0,0 +1,133 @@
+"""Notification fan-out: slow clients are dropped from or cut off, never waited on."""
+
+import asyncio
+import time
+
+import orjson
+import pytest
+
+from app.ws_manager import ConnectionManager
+
+
+class FakeSocket:
+    """A websocket whose sends can be held back to play a slow client."""
+
+    def __init__(self, paused: bool = False):
+        self.received: list[dict] = []
+        self.closed_with: int | None = None
+        self.unpaused = asyncio.Event()
+        if not paused:
+            self.unpaused.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload: str):
+        await self.unpaused.wait()
+        self.received.append(orjson.loads(payload))
+
+    async def close(self, code: int):
+        self.closed_with = code
+
+
+async def _connect(manager, **kwargs):
+    socket = FakeSocket(**kwargs)
+    manager.join(await manager.connect(socket))
+    return socket
+
+
+async def _drain(manager, timeout: float = 5):
+    """Wait until every joined client's writer has emptied its queue."""
+    deadline = time.monotonic() + timeout
+    while any(c.queue.qsize() for c in manager.clients.values()):
+        assert time.monotonic() < deadline, "queues never drained"
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0)
+
+
+def test_slow_client_drops_oldest_without_holding_up_others():
+    async def run():
+        manager = ConnectionManager(queue_size=3, policy="drop")
+        fast = await _connect(manager)
+        slow = await _connect(manager, paused=True)
+
+        for n in range(10):
+            manager.broadcast({"n": n})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        fast_received = list(fast.received)
+
+        slow.unpaused.set()
+        await _drain(manager)
+        return manager, fast_received, slow
+
+    manager, fast_received, slow = asyncio.run(run())
+
+    assert [m["n"] for m in fast_received] == list(range(10))
+    # the first message was already in flight; of the rest only the newest 3 were kept
+    assert [m["n"] for m in slow.received] == [0, 7, 8, 9]
+    assert manager.stats["dropped"] == 6
+    assert slow.closed_with is None
+
+
+def test_slow_client_is_disconnected_under_disconnect_policy():
+    async def run():
+        manager = ConnectionManager(queue_size=2, policy="disconnect")
+        fast = await _connect(manager)
+        slow = await _connect(manager, paused=True)
+
+        for n in range(5):
+            manager.broadcast({"n": n})
+            await asyncio.sleep(0)
+        await _drain(manager)
+        return manager, fast, slow
+
+    manager, fast, slow = asyncio.run(run())
+
+    assert slow.closed_with == 1013
+    assert len(manager.clients) == 1
+    assert manager.stats["slow_disconnects"] == 1
+    assert [m["n"] for m in fast.received] == list(range(5))
+
+
+def test_stuck_send_times_out_and_drops_the_client():
+    async def run():
+        manager = ConnectionManager(queue_size=10, send_timeout=0.05)
+        stuck = await _connect(manager, paused=True)
+        manager.broadcast({"n": 1})
+        await asyncio.sleep(0.2)
+        return manager, stuck
+
+    manager, stuck = asyncio.run(run())
+
+    assert stuck.closed_with == 1011
+    assert not manager.clients
+    assert manager.stats["send_failures"] == 1
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        ConnectionManager(policy="block")
+
+
+def test_fan_out_to_5000_clients():
+    clients = 5000
+
+    async def run():
+        manager = ConnectionManager(queue_size=10)
+        sockets = [await _connect(manager) for _ in range(clients)]
+
+        started = time.perf_counter()
+        for n in range(5):
+            manager.broadcast({"type": "diff", "n": n})
+        enqueue_seconds = time.perf_counter() - started
+        await _drain(manager, timeout=30)
+        return manager, sockets, enqueue_seconds
+
+    manager, sockets, enqueue_seconds = asyncio.run(run())
+
+    assert all([m["n"] for m in s.received] == list(range(5)) for s in sockets)
+    assert manager.stats["sent"] == 5 * clients
+    assert manager.stats["dropped"] == 0
+    # broadcast only enqueues a shared payload; it never awaits a socket
+    assert enqueue_seconds < 1.0